@@ -1,11 +1,25 @@
 from __future__ import annotations
 
+import logging
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 
-from .llm_client import LLMClient
-from .prompts import SYSTEM_PROMPT, build_user_prompt
-from .report_schema import extract_json_from_text, validate_report
+from .config_index import ConfigFact
+from .llm_cache import LLMCache, llm_cache_key
+from .profiling import count, span
+from .prompts import SYSTEM_PROMPT, build_reduce_prompt, build_user_prompt
+from .report_schema import IncrementalReportParser, extract_json_from_text, validate_report
+
+# ContextItem нужен упаковщику контекста и на `agent --help`: http.client/ssl клиента сюда не тянем
+if TYPE_CHECKING:
+    from .llm_client import LLMClient, RequestTiming
+
+
+log = logging.getLogger("agent")
 
 
 @dataclass(frozen=True)
@@ -18,6 +32,108 @@ class ContextItem:
     end_line: int
     language: str
     text: str
+    # text is minified and every line carries its source line number ("143|...")
+    numbered: bool = False
+
+
+# поля RequestTiming одного вызова, которые попадают в llm_timing отчёта
+_REQUEST_TIMING_KEYS = ("auth_ms", "connect_ms", "ttfb_ms", "reused_connection", "retries")
+
+
+def _timing_sink(timing: Dict[str, Any]) -> Callable[[RequestTiming], None]:
+    def record(t: RequestTiming) -> None:
+        timing.update(
+            auth_ms=round(t.auth_ms, 1),
+            connect_ms=round(t.connect_ms, 1),
+            ttfb_ms=round(t.ttfb_ms, 1),
+            reused_connection=t.reused_connection,
+            retries=t.retries,
+        )
+
+    return record
+
+
+def _stream_report(
+    llm: LLMClient,
+    *,
+    user_prompt: str,
+    temperature: float,
+    t0: float,
+    timing: Dict[str, Any],
+    on_hypothesis: Optional[Callable[[Dict[str, Any]], None]],
+) -> Tuple[str, Dict[str, Any], bool]:
+    import http.client  # уже загружен LLM-клиентом
+
+    parser = IncrementalReportParser()
+    try:
+        with span("llm_call"):
+            for delta in llm.chat_stream(
+                system=SYSTEM_PROMPT, user=user_prompt, temperature=temperature, on_timing=_timing_sink(timing),
+            ):
+                if "first_token_ms" not in timing:
+                    timing["first_token_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+                with span("json_parse"):
+                    done = parser.feed(delta)
+                for h in done:
+                    if "first_hypothesis_ms" not in timing:
+                        timing["first_hypothesis_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+                        log.info("First hypothesis after %.0fms: %s", timing["first_hypothesis_ms"], h.get("title", ""))
+                    if on_hypothesis is not None:
+                        on_hypothesis(h)
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        # обрыв посреди ответа: оставляем то, что уже пришло
+        if not parser.hypotheses:
+            raise
+        log.warning("LLM stream broke after %d hypotheses: %s", len(parser.hypotheses), e)
+
+    with span("json_parse"):
+        report, partial = parser.result()
+    if partial:
+        log.warning("LLM response was incomplete; kept a partial report with %d hypotheses", len(report["hypotheses"]))
+    return parser.text, report, partial
+
+
+def _complete(
+    llm: LLMClient,
+    *,
+    user_prompt: str,
+    temperature: float,
+    cache: Optional[LLMCache],
+    on_hypothesis: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    key = llm_cache_key(model=llm.cfg.model, system=SYSTEM_PROMPT, user=user_prompt, temperature=temperature)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            log.info("LLM cache hit: report from %.0f min ago", (time.time() - cached.created_at) / 60.0)
+            count("llm_cache_hits")
+            return cached.report
+
+    count("llm_calls")
+    count("llm_prompt_chars", len(SYSTEM_PROMPT) + len(user_prompt))
+    t0 = time.perf_counter()
+    timing: Dict[str, Any] = {"streamed": llm.cfg.stream}
+    if llm.cfg.stream:
+        content, report, partial = _stream_report(
+            llm, user_prompt=user_prompt, temperature=temperature, t0=t0, timing=timing, on_hypothesis=on_hypothesis,
+        )
+    else:
+        with span("llm_call"):
+            content = llm.chat_text(
+                system=SYSTEM_PROMPT, user=user_prompt, temperature=temperature, on_timing=_timing_sink(timing),
+            )
+        with span("json_parse"):
+            report = extract_json_from_text(content)
+            validate_report(report)
+        partial = False
+    count("llm_response_chars", len(content))
+
+    # кэшируем только целый валидный отчёт
+    if cache is not None and not partial:
+        cache.put(key, model=llm.cfg.model, raw=content, report=report)
+
+    timing["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    return {**report, "llm_timing": timing}
 
 
 def analyze_incident_with_llm(
@@ -25,16 +141,207 @@ def analyze_incident_with_llm(
     llm: LLMClient,
     incident: Dict[str, Any],
     contexts: List[ContextItem],
+    config_facts: Optional[List[ConfigFact]] = None,
     temperature: float = 0.1,
+    cache: Optional[LLMCache] = None,
+    on_hypothesis: Optional[Callable[[Dict[str, Any]], None]] = None,
 ) -> Dict[str, Any]:
-    # temperature передаём через env/config в GigaChat wrapper (в MVP — достаточно)
-    user_prompt = build_user_prompt(
-        incident=incident,
-        contexts=[c.__dict__ for c in contexts],
+    """
+    With streaming enabled (GIGACHAT_STREAM) hypotheses are passed to on_hypothesis as soon as each one
+    is complete, and a truncated response yields a report marked "partial" instead of an error.
+    Fresh reports carry "llm_timing": first token / first hypothesis / total and the request's
+    auth / connect / TTFB phases (ms), whether the connection was reused and the 401 retries.
+    """
+    with span("prompt_build"):
+        user_prompt = build_user_prompt(
+            incident=incident,
+            contexts=[c.__dict__ for c in contexts],
+            config_facts=[f.__dict__ for f in config_facts or []],
+        )
+    return _complete(llm, user_prompt=user_prompt, temperature=temperature, cache=cache, on_hypothesis=on_hypothesis)
+
+
+def shard_contexts(
+    contexts: List[ContextItem],
+    *,
+    max_tokens: int,
+    max_chars: int,
+    count_tokens: Callable[[str], int],
+    max_shards: int,
+) -> Tuple[List[List[ContextItem]], List[ContextItem]]:
+    """
+    First-fit in rank order: each context goes to the first shard with room, so the best evidence
+    lands in shard 0 and shards stay full. Returns (shards, contexts that fit nowhere).
+    """
+    shards: List[List[ContextItem]] = []
+    used: List[Tuple[int, int]] = []        # (tokens, chars) на шард
+    left: List[ContextItem] = []
+    for c in contexts:
+        t, n = count_tokens(c.text), len(c.text)
+        for i, (ut, un) in enumerate(used):
+            if ut + t <= max_tokens and un + n <= max_chars:
+                shards[i].append(c)
+                used[i] = (ut + t, un + n)
+                break
+        else:
+            if len(shards) < max_shards and t <= max_tokens and n <= max_chars:
+                shards.append([c])
+                used.append((t, n))
+            else:
+                left.append(c)
+    return shards, left
+
+
+_NORM_RE = re.compile(r"[\W_]+")
+
+
+def _norm(s: Any) -> str:
+    return _NORM_RE.sub(" ", str(s or "").lower()).strip()
+
+
+def _dedup(items: List[Any], key: Callable[[Any], Any]) -> List[Any]:
+    seen = set()
+    out = []
+    for it in items:
+        k = key(it)
+        if k in seen:
+            continue
+        seen.add(k)
+        out.append(it)
+    return out
+
+
+def _conf(h: Dict[str, Any]) -> float:
+    try:
+        return float(h.get("confidence") or 0.0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def merge_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Local merge of per-shard reports: hypotheses with the same normalized title are folded into the most
+    confident one (evidence and fixes united), hotspots deduplicated by path+lines. Also the reduce fallback.
+    """
+    by_title: Dict[str, Dict[str, Any]] = {}
+    for r in reports:
+        for h in r.get("hypotheses") or []:
+            if not isinstance(h, dict):
+                continue
+            k = _norm(h.get("title"))
+            cur = by_title.get(k)
+            if cur is None:
+                by_title[k] = dict(h)
+                continue
+            best, other = (h, cur) if _conf(h) > _conf(cur) else (cur, h)
+            merged = dict(best)
+            merged["evidence"] = _dedup(
+                list(best.get("evidence") or []) + list(other.get("evidence") or []),
+                key=lambda e: (e.get("path"), e.get("lines")) if isinstance(e, dict) else str(e),
+            )
+            merged["fixes"] = _dedup(list(best.get("fixes") or []) + list(other.get("fixes") or []), key=_norm)
+            by_title[k] = merged
+
+    lead = max(reports, key=lambda r: _conf(r.get("classification") or {}))
+    return {
+        "summary": lead.get("summary", ""),
+        "classification": lead.get("classification") or {},
+        "hypotheses": sorted(by_title.values(), key=_conf, reverse=True),
+        "hotspots": _dedup(
+            [h for r in reports for h in r.get("hotspots") or []],
+            key=lambda h: (h.get("path"), h.get("lines")) if isinstance(h, dict) else str(h),
+        ),
+        "checks": _dedup([c for r in reports for c in r.get("checks") or []], key=_norm),
+        "missing_data": _dedup([m for r in reports for m in r.get("missing_data") or []], key=_norm),
+    }
+
+
+def analyze_incident_map_reduce(
+    *,
+    llm: LLMClient,
+    incident: Dict[str, Any],
+    contexts: List[ContextItem],
+    count_tokens: Callable[[str], int],
+    max_shard_tokens: int,
+    max_shard_chars: int,
+    max_shards: int = 4,
+    config_facts: Optional[List[ConfigFact]] = None,
+    temperature: float = 0.1,
+    cache: Optional[LLMCache] = None,
+    on_hypothesis: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Map: ranked contexts are split into shards that each fit the window and analyzed concurrently,
+    one validated partial report per shard. Reduce: one short call over the locally pre-merged shard
+    reports (no code) merges and deduplicates hypotheses/hotspots; if it fails the local merge is used.
+    Wall-clock ~ slowest shard + reduce.
+    """
+    t0 = time.perf_counter()
+    shards, left = shard_contexts(
+        contexts, max_tokens=max_shard_tokens, max_chars=max_shard_chars, count_tokens=count_tokens, max_shards=max_shards,
     )
+    for c in left:
+        log.info("Map-reduce: dropped %s:%d-%d (score=%.3f, no shard has room)", c.path, c.start_line, c.end_line, c.score)
+    if len(shards) <= 1:
+        return analyze_incident_with_llm(
+            llm=llm, incident=incident, contexts=shards[0] if shards else [], config_facts=config_facts,
+            temperature=temperature, cache=cache, on_hypothesis=on_hypothesis,
+        )
+    log.info("Map-reduce: %d contexts -> %d shards (%s)", len(contexts), len(shards), ", ".join(str(len(s)) for s in shards))
+
+    lock = threading.Lock()
+
+    def emit(h: Dict[str, Any]) -> None:
+        if on_hypothesis is not None:
+            with lock:
+                on_hypothesis(h)
+
+    def map_one(i: int) -> Optional[Dict[str, Any]]:
+        try:
+            return analyze_incident_with_llm(
+                llm=llm, incident=incident, contexts=shards[i], config_facts=config_facts,
+                temperature=temperature, cache=cache, on_hypothesis=emit,
+            )
+        except Exception as e:
+            log.error("Map-reduce: shard %d/%d failed: %s", i + 1, len(shards), e)
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="map") as ex:
+        results = list(ex.map(map_one, range(len(shards))))
+    map_ms = (time.perf_counter() - t0) * 1000.0
+    partials = [r for r in results if r is not None]
+    if not partials:
+        raise RuntimeError(f"all {len(shards)} map-reduce shards failed")
 
-    content = llm.chat_text(system=SYSTEM_PROMPT, user=user_prompt)
+    merged = merge_reports(partials)
+    try:
+        with span("prompt_build"):
+            reduce_prompt = build_reduce_prompt(incident=incident, merged=merged, shards=len(partials))
+        report = _complete(llm, user_prompt=reduce_prompt, temperature=temperature, cache=cache)
+        reduce_timing = report.pop("llm_timing", None)
+        # reduce не должен терять найденное: пустой результат при непустых шардах — сбой
+        if merged["hypotheses"] and not report["hypotheses"]:
+            raise ValueError("reduce returned no hypotheses")
+    except Exception as e:
+        log.warning("Map-reduce: reduce call failed (%s); using the local merge", e)
+        report = merged
+        reduce_timing = None
 
-    report = extract_json_from_text(content)
-    validate_report(report)
+    first = [p["llm_timing"]["first_hypothesis_ms"] for p in partials if "first_hypothesis_ms" in p.get("llm_timing", {})]
+    timing: Dict[str, Any] = {"streamed": llm.cfg.stream, "map_ms": round(map_ms, 1)}
+    if first:
+        timing["first_hypothesis_ms"] = min(first)
+    # фазы каждого запроса (шарды, затем reduce); ответы из кэша запросов не делали
+    calls = [p["llm_timing"] for p in partials if "llm_timing" in p] + ([reduce_timing] if reduce_timing else [])
+    timing["requests"] = [{k: t[k] for k in _REQUEST_TIMING_KEYS if k in t} for t in calls]
+    timing["total_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    report["llm_timing"] = timing
+    report["map_reduce"] = {
+        "shards": len(shards),
+        "failed_shards": len(shards) - len(partials),
+        "contexts": sum(len(s) for s in shards),
+        "dropped_contexts": len(left),
+    }
+    if any(p.get("partial") for p in partials) or len(partials) < len(shards):
+        report["partial"] = True
     return report
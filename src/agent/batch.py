@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple
+
+
+log = logging.getLogger("agent")
+
+Incident = Tuple[str, Dict[str, Any]]     # (имя для файла отчёта, incident)
+
+_SAFE_NAME_RE = re.compile(r"[^\w.-]+")
+
+
+def _safe_name(name: str) -> str:
+    return _SAFE_NAME_RE.sub("_", name).strip("._") or "incident"
+
+
+def iter_incidents(source: Path) -> Iterator[Incident]:
+    """
+    Incidents from a directory of *.json files, a .jsonl file, or "-" (JSONL on stdin).
+    JSONL lines are named by their "id"/"incident_id" field, else by line number; a name already
+    taken (a repeated id, or two ids that sanitize alike) gets a "-2", "-3", ... suffix.
+    Unreadable files and lines that are not a JSON object are logged and skipped.
+    """
+    seen: Set[str] = set()
+    for name, incident in _read_incidents(source):
+        unique, n = name, 1
+        while unique in seen:
+            n += 1
+            unique = f"{name}-{n}"
+        if unique != name:
+            log.warning("Incident name %s is already taken; writing it as %s", name, unique)
+        seen.add(unique)
+        yield unique, incident
+
+
+def _read_incidents(source: Path) -> Iterator[Incident]:
+    if source.is_dir():
+        for p in sorted(source.glob("*.json")):
+            try:
+                incident = json.loads(p.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as e:
+                log.warning("Skipping %s: %s", p.name, e)
+                continue
+            if not isinstance(incident, dict):
+                log.warning("Skipping %s: not a JSON object", p.name)
+                continue
+            yield _safe_name(p.stem), incident
+        return
+
+    stream = sys.stdin if str(source) == "-" else open(source, "r", encoding="utf-8")
+    try:
+        for no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                incident = json.loads(line)
+            except ValueError as e:
+                log.warning("Skipping JSONL line %d: %s", no, e)
+                continue
+            if not isinstance(incident, dict):
+                log.warning("Skipping JSONL line %d: not a JSON object", no)
+                continue
+            name = incident.get("id") or incident.get("incident_id") or f"line{no:05d}"
+            yield _safe_name(str(name)), incident
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate_per_s` tokens per second, up to `burst` at once. rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate_per_s: float, burst: int = 1):
+        self.rate = rate_per_s
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+@dataclass
+class BatchResult:
+    ok: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+
+def _batches(items: Iterable[Incident], size: int) -> Iterator[List[Incident]]:
+    batch: List[Incident] = []
+    for it in items:
+        batch.append(it)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def run_batch(
+    incidents: Iterable[Incident],
+    *,
+    prepare: Callable[[List[Incident]], List[Any]],
+    analyze: Callable[[Any], Dict[str, Any]],
+    on_report: Callable[[str, Dict[str, Any]], None],
+    concurrency: int = 4,
+    rate_per_s: float = 0.0,
+    burst: int = 1,
+    prepare_batch_size: int = 16,
+) -> BatchResult:
+    """
+    Pipeline: incidents are read and prepared (retrieval, one batched embedding per group) in a single
+    worker thread, while the LLM calls of already prepared ones run concurrently in threads,
+    bounded by a semaphore and a token bucket. on_report is called as soon as each report is ready.
+    Preparation runs at most `concurrency` batches ahead of the LLM stage, so memory stays bounded
+    on an arbitrarily long input stream.
+    `prepare` returns one job per incident, in order; `analyze` turns a job into a report.
+    """
+    result = BatchResult()
+    t0 = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    batch_size = max(1, prepare_batch_size)
+    sem = asyncio.Semaphore(max(1, concurrency))
+    # места для подготовленных, но ещё не отправленных в LLM инцидентов
+    ahead = asyncio.Semaphore(max(1, concurrency) * batch_size)
+    bucket = TokenBucket(rate_per_s, burst)
+    tasks: Set[asyncio.Task[None]] = set()
+
+    async def run_one(name: str, job: Any) -> None:
+        try:
+            async with sem:
+                await bucket.acquire()
+                t = time.perf_counter()
+                try:
+                    report = await asyncio.to_thread(analyze, job)
+                    on_report(name, report)
+                except Exception as e:
+                    log.error("Incident %s failed: %s", name, e)
+                    result.failed.append(name)
+                    return
+        finally:
+            ahead.release()
+        result.ok.append(name)
+        log.info("Incident %s done in %.1fs (%d ok, %d failed)", name, time.perf_counter() - t, len(result.ok), len(result.failed))
+
+    # SQLite/Qdrant/ONNX-клиенты используются из одного и того же потока
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="prepare") as prep:
+        it = _batches(incidents, batch_size)
+        while True:
+            batch = await loop.run_in_executor(prep, next, it, None)
+            if batch is None:
+                break
+            for _ in batch:
+                await ahead.acquire()
+            try:
+                jobs = await loop.run_in_executor(prep, prepare, batch)
+            except Exception as e:
+                log.error("Preparing %d incidents failed: %s", len(batch), e)
+                result.failed.extend(name for name, _ in batch)
+                for _ in batch:
+                    ahead.release()
+                continue
+            for (name, _), job in zip(batch, jobs):
+                task = asyncio.create_task(run_one(name, job))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks)
+
+    result.elapsed_s = time.perf_counter() - t0
+    return result
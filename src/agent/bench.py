@@ -0,0 +1,451 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import platform
+import re
+import socket
+import subprocess
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .analyzer import ContextItem, analyze_incident_with_llm
+from .config import load_chunking_config, load_index_config
+from .generations import new_generation
+from .indexer import build_chunks, build_lookup_tables, iter_repo_files
+from .llm_client import LLMClient, LLMConfig
+from .retriever import incident_to_query_text, retrieve_topk
+from .store_sqlite import SQLiteStore
+from .synth import generate_repo, write_incidents
+from .vectordb_numpy import NumpyVectorDB, SnapshotWriter
+from .vectordb_qdrant import QdrantVectorDB, VectorIndex
+
+
+log = logging.getLogger("agent")
+
+BENCH_BACKENDS = ("qdrant", "numpy")
+
+# camelCase и snake_case дробим на слова: PaymentService.confirm -> payment, service, confirm
+_WORD_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+@dataclass
+class HashingEmbedder:
+    """
+    Deterministic offline stand-in for FastEmbedProvider: signed feature hashing of the words of a text
+    into `dims` buckets. It is lexical, so stack-trace queries still find the code they name.
+    Benchmarks only: it says nothing about the quality of a real model.
+    """
+
+    dims: int = 384
+    model_name: str = "bench/hashing"
+
+    def dim(self) -> int:
+        return self.dims
+
+    def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        out = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, text in enumerate(texts):
+            h = np.fromiter(
+                (zlib.crc32(w.lower().encode("utf-8")) for w in _WORD_RE.findall(text)), dtype=np.uint32,
+            )
+            if len(h):
+                sign = np.where(h & 0x80000000, -1.0, 1.0)
+                out[row] = np.bincount(h % self.dims, weights=sign, minlength=self.dims)
+        out /= np.linalg.norm(out, axis=1, keepdims=True) + 1e-12
+        return out.tolist()
+
+
+_MOCK_REPORT = {
+    "summary": "Synthetic incident: the dependency call at the top of the stack trace fails under load.",
+    "classification": {"type": "dependency", "confidence": 0.6},
+    "hypotheses": [
+        {
+            "title": f"Hypothesis {i + 1}",
+            "confidence": round(0.7 - 0.2 * i, 2),
+            "evidence": [],
+            "impact": "Requests to the endpoint fail or time out.",
+            "fixes": ["Check the pool and timeout settings of the failing call."],
+        }
+        for i in range(3)
+    ],
+    "hotspots": [],
+    "checks": ["Compare pool usage before and during the incident."],
+    "missing_data": [],
+}
+
+
+class MockLLMServer:
+    """
+    Local stand-in for the GigaChat OAuth and chat/completions endpoints over plain http (SSE when the
+    request has "stream": true). Always answers with the same valid report, so the LLM stage of
+    `agent bench` measures prompt building, transport and parsing on our side.
+    Tokens live `token_ttl_s`; setting `unauthorized = n` answers the next n chat calls with 401.
+    """
+
+    def __init__(self, *, token_delay_ms: float = 0.0, piece_chars: int = 24, token_ttl_s: float = 1800.0):
+        text = json.dumps(_MOCK_REPORT, ensure_ascii=False, indent=1)
+        delay = token_delay_ms / 1000.0
+        self.calls = 0
+        self.auth_calls = 0
+        self.connections = 0
+        self.unauthorized = 0
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                mock.connections += 1
+                # мелкие SSE-чанки без TCP_NODELAY упираются в Nagle + delayed ACK (~40 мс на вызов)
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def _send(self, data: bytes, content_type: str = "application/json", status: int = 200) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, data: bytes) -> None:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.endswith("/oauth"):
+                    mock.auth_calls += 1
+                    expires = int((time.time() + token_ttl_s) * 1000)
+                    token = f"bench-{mock.auth_calls}"
+                    self._send(json.dumps({"access_token": token, "expires_at": expires}).encode("utf-8"))
+                    return
+                mock.calls += 1
+                if mock.unauthorized > 0:
+                    mock.unauthorized -= 1
+                    self._send(b'{"status": 401, "message": "Unauthorized"}', status=401)
+                    return
+                if not json.loads(body or b"{}").get("stream"):
+                    self._send(json.dumps({"choices": [{"message": {"content": text}}]}).encode("utf-8"))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(0, len(text), piece_chars):
+                    event = {"choices": [{"delta": {"content": text[i:i + piece_chars]}, "index": 0}]}
+                    self._chunk(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+                    if delay:
+                        time.sleep(delay)
+                self._chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def config(self, *, stream: bool = True) -> LLMConfig:
+        return LLMConfig(
+            credentials="bench",
+            verify_ssl_certs=False,
+            base_url=f"{self.url}/api/v1",
+            auth_url=f"{self.url}/api/v2/oauth",
+            timeout_s=30.0,
+            stream=stream,
+        )
+
+    def close(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def latency_summary(ms: List[float]) -> Dict[str, float]:
+    if not ms:
+        return {}
+    p50, p95, p99 = np.percentile(np.asarray(ms, dtype=np.float64), [50, 95, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(np.mean(ms)), 3),
+        "max_ms": round(float(np.max(ms)), 3),
+    }
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:             # Windows
+        return None
+    # ru_maxrss: килобайты на Linux, байты на macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def git_revision() -> Dict[str, Any]:
+    here = Path(__file__).resolve().parent
+    try:
+        sha = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=here, capture_output=True, text=True, timeout=10, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=here, capture_output=True, text=True, timeout=30,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": sha, "dirty": bool(dirty)}
+
+
+def _stage(seconds: float, items: int, unit: str) -> Dict[str, Any]:
+    return {"seconds": round(seconds, 3), unit: items, f"{unit}_per_s": round(items / max(seconds, 1e-9), 1)}
+
+
+def _bench_retrieval(
+    vectordb: VectorIndex,
+    *,
+    store: SQLiteStore,
+    embedder: HashingEmbedder,
+    incidents: List[Dict[str, Any]],
+    queries: int,
+    top_k: int,
+    prefetch: int,
+) -> Dict[str, Any]:
+    # первый запрос прогревает страницы/кэши и в статистику не идёт
+    retrieve_topk(vectordb=vectordb, store=store, embedder=embedder, incident=incidents[0], top_k=top_k, prefetch_k=prefetch)
+    total: List[float] = []
+    search: List[float] = []
+    for q in range(queries):
+        incident = incidents[q % len(incidents)]
+        t0 = time.perf_counter()
+        retrieve_topk(vectordb=vectordb, store=store, embedder=embedder, incident=incident, top_k=top_k, prefetch_k=prefetch)
+        total.append((time.perf_counter() - t0) * 1000.0)
+
+        qv = embedder.embed_texts([incident_to_query_text(incident)])[0]
+        t1 = time.perf_counter()
+        vectordb.search(query_vector=qv, top_k=prefetch)
+        search.append((time.perf_counter() - t1) * 1000.0)
+    return {"queries": queries, **latency_summary(total), "search": latency_summary(search)}
+
+
+def _bench_llm(
+    vectordb: VectorIndex,
+    *,
+    store: SQLiteStore,
+    embedder: HashingEmbedder,
+    incidents: List[Dict[str, Any]],
+    calls: int,
+    top_k: int,
+    prefetch: int,
+) -> Dict[str, Any]:
+    ms: List[float] = []
+    with MockLLMServer() as mock, LLMClient(mock.config()) as llm:
+        for i in range(calls + 1):
+            incident = incidents[i % len(incidents)]
+            retrieved = retrieve_topk(
+                vectordb=vectordb, store=store, embedder=embedder, incident=incident, top_k=top_k, prefetch_k=prefetch,
+            )
+            contexts = [
+                ContextItem(
+                    score=r.score, base=r.base_score, rr=r.rerank_score, path=r.chunk.path,
+                    start_line=r.chunk.start_line, end_line=r.chunk.end_line, language=r.chunk.language, text=r.chunk.text,
+                )
+                for r in retrieved
+            ]
+            t0 = time.perf_counter()
+            analyze_incident_with_llm(llm=llm, incident=incident, contexts=contexts, temperature=0.1)
+            if i:                   # первый вызов — OAuth и новое соединение
+                ms.append((time.perf_counter() - t0) * 1000.0)
+    return {"calls": calls, **latency_summary(ms)}
+
+
+def run_benchmark(
+    workdir: Path,
+    *,
+    chunks: int,
+    incidents: int = 50,
+    queries: int = 200,
+    backends: tuple[str, ...] = BENCH_BACKENDS,
+    dim: int = 384,
+    seed: int = 0,
+    llm_calls: int = 10,
+    top_k: int = 12,
+    prefetch: int = 80,
+) -> Dict[str, Any]:
+    """
+    Offline end-to-end run on a generated repo: scan -> chunk -> lookup tables -> SQLite -> embed
+    (HashingEmbedder) -> vector snapshot -> Qdrant upsert, then retrieve_topk latency per backend and
+    the analyze call against MockLLMServer. Same arguments give the same repo, incidents and vectors.
+    """
+    unknown = [b for b in backends if b not in BENCH_BACKENDS]
+    if unknown:
+        raise ValueError(f"unknown backend(s) {', '.join(unknown)} ({' | '.join(BENCH_BACKENDS)})")
+    chunk_cfg = load_chunking_config()
+    idx_cfg = load_index_config()
+    stages: Dict[str, Any] = {}
+
+    t0 = time.perf_counter()
+    repo = generate_repo(workdir / "repo", chunks=chunks, incidents=incidents, seed=seed, chunk_cfg=chunk_cfg)
+    write_incidents(workdir / "incidents.jsonl", repo.incidents)
+    stages["generate"] = _stage(time.perf_counter() - t0, repo.files, "files")
+    log.info("bench: generated %d files, %d chunks, %d incidents in %s", repo.files, repo.chunks, len(repo.incidents), repo.root)
+
+    t0 = time.perf_counter()
+    nbytes = 0
+    nfiles = 0
+    for p in iter_repo_files(repo.root):
+        nbytes += len(p.read_bytes())
+        nfiles += 1
+    stages["scan"] = {**_stage(time.perf_counter() - t0, nfiles, "files"), "mb": round(nbytes / 1e6, 1)}
+
+    t0 = time.perf_counter()
+    chunk_list = build_chunks(repo_root=repo.root, chunk_cfg=chunk_cfg, index_cfg=idx_cfg)
+    stages["chunk"] = _stage(time.perf_counter() - t0, len(chunk_list), "chunks")
+    total = len(chunk_list)
+
+    t0 = time.perf_counter()
+    tables = build_lookup_tables(chunk_list)
+    stages["lookup_tables"] = _stage(time.perf_counter() - t0, total, "chunks")
+
+    gen = new_generation(workdir / "index")
+    store = SQLiteStore(db_path=gen.payload_path)
+    store.init()
+    t0 = time.perf_counter()
+    store.insert_chunks(chunk_list)
+    store.insert_chunk_tokens(tables.tokens)
+    store.insert_file_symbols(tables.file_symbols)
+    store.insert_config_entries(tables.config_entries)
+    stages["store"] = _stage(time.perf_counter() - t0, total, "chunks")
+
+    embedder = HashingEmbedder(dims=dim)
+    snapshot = SnapshotWriter(gen.snapshot_path, count=total, dim=dim)
+    embed_s = write_s = 0.0
+    for s in range(0, total, idx_cfg.batch_size):
+        part = chunk_list[s:s + idx_cfg.batch_size]
+        t0 = time.perf_counter()
+        vecs = embedder.embed_texts([c.text for c in part])
+        t1 = time.perf_counter()
+        snapshot.add([c.chunk_id for c in part], vecs)
+        embed_s += t1 - t0
+        write_s += time.perf_counter() - t1
+    t0 = time.perf_counter()
+    snapshot.close()
+    write_s += time.perf_counter() - t0
+    stages["embed"] = {**_stage(embed_s, total, "chunks"), "embedder": embedder.model_name, "dim": dim}
+    stages["snapshot"] = _stage(write_s, total, "chunks")
+
+    dbs: Dict[str, VectorIndex] = {}
+    numpy_db = NumpyVectorDB(gen.snapshot_path)
+    if "qdrant" in backends:
+        qdrant = QdrantVectorDB(local_path=str(gen.qdrant_path), collection="bench")
+        qdrant.ensure_collection(dim=dim)
+        t0 = time.perf_counter()
+        for s in range(0, total, idx_cfg.batch_size):
+            part = chunk_list[s:s + idx_cfg.batch_size]
+            qdrant.upsert_batch(
+                ids=numpy_db.chunk_ids[s:s + idx_cfg.batch_size].tolist(),
+                vectors=numpy_db.vectors[s:s + idx_cfg.batch_size].tolist(),
+                payloads=[
+                    {"path": c.path, "language": c.language, "start_line": c.start_line, "end_line": c.end_line}
+                    for c in part
+                ],
+            )
+        stages["upsert"] = _stage(time.perf_counter() - t0, total, "chunks")
+        dbs["qdrant"] = qdrant
+    if "numpy" in backends:
+        dbs["numpy"] = numpy_db
+
+    retrieval: Dict[str, Any] = {}
+    llm: Dict[str, Any] = {}
+    try:
+        for name, db in dbs.items():
+            log.info("bench: %d queries on %s", queries, name)
+            retrieval[name] = _bench_retrieval(
+                db, store=store, embedder=embedder, incidents=repo.incidents, queries=queries, top_k=top_k, prefetch=prefetch,
+            )
+        if llm_calls > 0 and dbs:
+            log.info("bench: %d analyze calls against the mock LLM", llm_calls)
+            llm = _bench_llm(
+                next(iter(dbs.values())), store=store, embedder=embedder, incidents=repo.incidents,
+                calls=llm_calls, top_k=top_k, prefetch=prefetch,
+            )
+    finally:
+        for db in dbs.values():
+            db.close()
+        numpy_db.close()
+        store.close()
+
+    return {
+        "bench_version": 1,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "git": git_revision(),
+        "host": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "params": {
+            "chunks": chunks,
+            "incidents": incidents,
+            "queries": queries,
+            "backends": list(backends),
+            "dim": dim,
+            "seed": seed,
+            "llm_calls": llm_calls,
+            "top_k": top_k,
+            "prefetch": prefetch,
+            "chunk_max_lines": chunk_cfg.max_lines,
+            "chunk_overlap": chunk_cfg.overlap,
+            "index_batch": idx_cfg.batch_size,
+        },
+        "repo": {"files": repo.files, "lines": repo.lines, "chunks": total},
+        "stages": stages,
+        "retrieval": retrieval,
+        "llm": llm,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare_results(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[tuple[str, float, float]]:
+    """
+    (metric, baseline, current) for the throughputs and latencies present in both runs.
+    """
+    rows: List[tuple[str, float, float]] = []
+    for name, st in current.get("stages", {}).items():
+        base = baseline.get("stages", {}).get(name, {})
+        for key, value in st.items():
+            if key.endswith("_per_s") and key in base:
+                rows.append((f"{name}.{key}", float(base[key]), float(value)))
+    for backend, r in current.get("retrieval", {}).items():
+        base = baseline.get("retrieval", {}).get(backend, {})
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if key in r and key in base:
+                rows.append((f"retrieve.{backend}.{key}", float(base[key]), float(r[key])))
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        if key in current.get("llm", {}) and key in baseline.get("llm", {}):
+            rows.append((f"llm.{key}", float(baseline["llm"][key]), float(current["llm"][key])))
+    return rows
@@ -3,18 +3,57 @@ from __future__ import annotations
 import argparse
 import json
 import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
 
-from .config import load_chunking_config, load_index_config, load_embeddings_config, load_qdrant_config
+from .config import (
+    load_chunking_config,
+    load_context_config,
+    load_embed_runtime_config,
+    load_embeddings_config,
+    load_incident_cache_config,
+    load_index_config,
+    load_llm_cache_config,
+    load_qdrant_config,
+    load_query_cache_config,
+    load_reduction_config,
+    load_rerank_config,
+    load_vector_store_config,
+)
 from .embeddings_fastembed import FastEmbedProvider
-from .indexer import build_chunks
-from .retriever import retrieve_topk
+from .generations import (
+    IndexGeneration,
+    current_generation_id,
+    gc_generations,
+    new_generation,
+    publish_generation,
+    resolve_index,
+    validate_generation,
+)
+from .config_index import CONFIG_LANGUAGES, ConfigFact, facts_cover
+from .profiling import count, span, start_profiling, stop_profiling
+from .retriever import RetrievedChunk, embed_queries, find_config_facts, incident_to_query_text, retrieve_topk
+from .signals import IncidentSignals, extract_signals
 from .store_sqlite import SQLiteStore
-from .vectordb_qdrant import QdrantVectorDB
-from .llm_client import LLMClient, load_llm_config
-from .analyzer import ContextItem, analyze_incident_with_llm
+from .vectordb_qdrant import QdrantVectorDB, VectorIndex
+
+# numpy, asyncio, сервер, LLM-клиент (http.client + ssl), кэши, индексатор и упаковщик контекста грузим
+# только в подкомандах, которым они нужны: --help и ошибки аргументов — без них
+if TYPE_CHECKING:
+    from .analyzer import ContextItem
+    from .batch import Incident
+    from .incident_cache import IncidentCache, IncidentMatch
+    from .llm_cache import LLMCache
+    from .llm_client import LLMClient
+    from .query_cache import QueryCache
+    from .reranker_onnx import CrossEncoderReranker
+    from .server import Routes
 
 
 log = logging.getLogger("agent")
@@ -46,14 +85,38 @@ def embed_with_adaptive_batch(embedder: FastEmbedProvider, texts: List[str], bat
             raise
 
 
-def cmd_index(repo: Path, out_dir: Path) -> int:
+def cmd_index(repo: Path, out_dir: Path, keep_generations: int = 2) -> int:
+    """
+    Builds a new generation next to the live one, validates it and switches CURRENT atomically;
+    queries keep reading the previous generation until then. A failed build leaves CURRENT untouched.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    gen = new_generation(out_dir)
+    log.info("Building index generation %s", gen.id)
+    try:
+        rc = _build_generation(repo, gen)
+    except BaseException:
+        shutil.rmtree(gen.root, ignore_errors=True)
+        raise
+    if rc != 0:
+        shutil.rmtree(gen.root, ignore_errors=True)
+        return rc
+
+    publish_generation(out_dir, gen)
+    gc_generations(out_dir, keep=keep_generations)
+    return 0
+
+
+def _build_generation(repo: Path, gen: IndexGeneration) -> int:
+    from .indexer import build_chunks, build_lookup_tables, content_hash
+    from .vectordb_numpy import NumpyVectorDB, SnapshotWriter
+
     chunk_cfg = load_chunking_config()
     idx_cfg = load_index_config()
     emb_cfg = load_embeddings_config()
     qcfg = load_qdrant_config()
 
-    out_dir.mkdir(parents=True, exist_ok=True)
-    db_path = out_dir / "payload.sqlite"
+    db_path = gen.payload_path
 
     store = SQLiteStore(db_path=db_path)
     store.init()
@@ -65,91 +128,549 @@ def cmd_index(repo: Path, out_dir: Path) -> int:
         log.warning("No chunks built. Check include_prefixes/excludes and repo path.")
         return 2
 
+    count("chunks_indexed", len(chunks))
     log.info("Writing payload to SQLite: %s", db_path)
-    store.insert_chunks(chunks)
+    with span("sqlite_insert"):
+        store.insert_chunks(chunks)
 
-    embedder = FastEmbedProvider(model_name=emb_cfg.model_name, batch_size=emb_cfg.batch_size)
-    dim = embedder.dim()
+    with span("lookup_tables"):
+        tables = build_lookup_tables(chunks)
+    with span("sqlite_insert"):
+        store.insert_chunk_tokens(tables.tokens)
+        store.insert_file_symbols(tables.file_symbols)
+        store.insert_config_entries(tables.config_entries)
+    log.info(
+        "Wrote lookup tables: signal_tokens=%d file_symbols=%d config_keys=%d",
+        sum(len(t) for t in tables.tokens.values()), len(tables.file_symbols), len(tables.config_entries),
+    )
 
-    vectordb = QdrantVectorDB(local_path=qcfg.local_path, collection=qcfg.collection)
-    vectordb.ensure_collection(dim=dim)
+    runtime = load_embed_runtime_config()
+    embedder = FastEmbedProvider(model_name=emb_cfg.model_name, batch_size=emb_cfg.batch_size, runtime=runtime)
+    dim = embedder.dim()
+    red_cfg = load_reduction_config()
 
     batch = idx_cfg.batch_size
     total = len(chunks)
     log.info(
-        "Indexing to Qdrant LOCAL (chunks=%d, index_batch=%d, embed_batch=%d, dim=%d, model=%s, qdrant_path=%s, collection=%s)",
-        total, batch, emb_cfg.batch_size, dim, emb_cfg.model_name, qcfg.local_path, qcfg.collection,
+        "Embedding (chunks=%d, index_batch=%d, embed_batch=%d, dim=%d, model=%s)",
+        total, batch, emb_cfg.batch_size, dim, emb_cfg.model_name,
     )
 
+    # проход 1: полные векторы — в read-only снимок (VECTOR_BACKEND=numpy, обучение PCA, точный rescore)
+    snapshot = SnapshotWriter(gen.snapshot_path, count=total, dim=dim)
+    probe: List[float] = []
     i = 0
     while i < total:
         part = chunks[i:i + batch]
-        ids = [c.chunk_id for c in part]
         texts = [c.text for c in part]
-        vecs = embed_with_adaptive_batch(embedder, texts, emb_cfg.batch_size)
+        with span("embed"):
+            vecs = embed_with_adaptive_batch(embedder, texts, emb_cfg.batch_size)
+        count("embed_chars", sum(len(t) for t in texts))
+        with span("snapshot_write"):
+            snapshot.add([c.chunk_id for c in part], vecs)
+        probe = vecs[0]
+        i += len(part)
+
+        if i % max(batch * 20, 1) == 0:
+            log.info("Embedded %d / %d chunks...", i, total)
+    snapshot.close()
+    full = NumpyVectorDB(gen.snapshot_path)
 
+    reduction: Dict[str, Any] | None = None
+    projection = None
+    if red_cfg.method != "none":
+        from .reduction import fit_projection, measure_recall, write_reduced
+
+        with span("reduce"):
+            projection = fit_projection(full.vectors, method=red_cfg.method, dim=red_cfg.dim, sample=red_cfg.sample)
+            projection.save(gen.projection_path)
+            write_reduced(gen.snapshot_path, full.vectors, projection)
+            reduction = {"method": projection.method, "dim": projection.dim, **measure_recall(full.vectors, projection)}
+        log.info(
+            "Reduced %d -> %d (%s): recall@%s=%.3f, with full-dim rescore of top-%s=%.3f",
+            dim, projection.dim, projection.method, reduction.get("k"), reduction.get("recall", 1.0),
+            reduction.get("prefetch"), reduction.get("recall_rescored", 1.0),
+        )
+
+    # проход 2: из снимка в Qdrant (у каждого поколения своё хранилище: сборка не трогает lock запросов)
+    search_dim = projection.dim if projection is not None else dim
+    vectordb = QdrantVectorDB(local_path=str(gen.qdrant_path), collection=qcfg.collection)
+    vectordb.ensure_collection(dim=search_dim)
+    log.info("Indexing to Qdrant LOCAL (dim=%d, qdrant_path=%s, collection=%s)", search_dim, gen.qdrant_path, qcfg.collection)
+    for s in range(0, total, batch):
+        rows = full.vectors[s:s + batch]
         payloads = [
             {"path": c.path, "language": c.language, "start_line": c.start_line, "end_line": c.end_line}
-            for c in part
+            for c in chunks[s:s + batch]
         ]
-
-        vectordb.upsert_batch(ids=ids, vectors=vecs, payloads=payloads)
-        i += len(part)
-
-        if i % max(batch * 20, 1) == 0:
-            log.info("Upserted %d / %d chunks...", i, total)
+        with span("upsert"):
+            vectordb.upsert_batch(
+                ids=full.chunk_ids[s:s + batch].tolist(),
+                vectors=(projection.apply(rows) if projection is not None else rows).tolist(),
+                payloads=payloads,
+            )
+        count("vectors_upserted", len(payloads))
+    full.close()
 
     meta = {
         "repo_root": str(repo),
         "commit_sha": None,
         "embed_model": emb_cfg.model_name,
         "embed_batch_size": emb_cfg.batch_size,
+        "embed_profile": runtime.profile,
+        "embed_quantize": runtime.quantize,
         "chunk_max_lines": chunk_cfg.max_lines,
         "chunk_overlap": chunk_cfg.overlap,
         "created_at": datetime.now(timezone.utc).isoformat(),
         "dim": dim,
         "chunks": total,
-        "qdrant_local_path": qcfg.local_path,
+        "content_hash": content_hash(chunks),
+        "generation": gen.id,
+        "qdrant_local_path": str(gen.qdrant_path),
         "qdrant_collection": qcfg.collection,
+        "vector_snapshot": str(gen.snapshot_path),
+        "search_dim": search_dim,
+        "reduction": reduction,
     }
-    (out_dir / "index_meta.json").write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-    log.info("Wrote meta: %s", out_dir / "index_meta.json")
+    gen.meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    log.info("Wrote meta: %s", gen.meta_path)
+
+    vectordb.close()
+    try:
+        for backend in ("qdrant", "numpy"):
+            db = _open_vectordb(gen, backend=backend)
+            try:
+                with span("validate"):
+                    validate_generation(gen, store=store, vectordb=db, expected_chunks=total, probe_vector=probe)
+            finally:
+                db.close()
+    except ValueError as e:
+        log.error("Index validation failed, not publishing: %s", e)
+        return 3
     return 0
 
 
-def _make_runtime_clients(index_dir: Path):
-    store = SQLiteStore(db_path=index_dir / "payload.sqlite")
+def _resolve_generation(index_dir: Path) -> IndexGeneration:
+    return resolve_index(index_dir, legacy_qdrant_path=load_qdrant_config().local_path)
+
+
+def _make_runtime_clients(gen: IndexGeneration, *, persistent: bool = False):
+    store, vectordb = _open_index(gen, persistent=persistent)
     emb_cfg = load_embeddings_config()
-    qcfg = load_qdrant_config()
-    embedder = FastEmbedProvider(model_name=emb_cfg.model_name, batch_size=emb_cfg.batch_size)
-    vectordb = QdrantVectorDB(local_path=qcfg.local_path, collection=qcfg.collection)
+    meta = gen.meta()
+    if meta.get("embed_model") not in (None, emb_cfg.model_name):
+        log.warning(
+            "Index %s was built with EMBED_MODEL=%s, queries use %s: vectors are not comparable",
+            gen.id, meta["embed_model"], emb_cfg.model_name,
+        )
+    known_dim = meta.get("dim") if meta.get("embed_model") == emb_cfg.model_name else None
+    embedder = FastEmbedProvider(
+        model_name=emb_cfg.model_name, batch_size=emb_cfg.batch_size, known_dim=known_dim, runtime=load_embed_runtime_config(),
+    )
     return store, embedder, vectordb
 
 
-def cmd_run(index_dir: Path, incident_file: Path, topk: int, prefetch: int, max_per_file: int) -> int:
-    store, embedder, vectordb = _make_runtime_clients(index_dir)
-    incident = json.loads(incident_file.read_text(encoding="utf-8"))
+def _open_index(gen: IndexGeneration, *, persistent: bool = False) -> Tuple[SQLiteStore, VectorIndex]:
+    store = SQLiteStore(db_path=gen.payload_path, persistent=persistent)
+    vectordb = _open_vectordb(gen, backend=load_vector_store_config().backend, rescore=load_reduction_config().rescore)
+    return store, vectordb
 
-    results = retrieve_topk(
-        vectordb=vectordb,
-        store=store,
-        embedder=embedder,
-        incident=incident,
-        top_k=topk,
-        prefetch_k=prefetch,
-        max_per_file=max_per_file,
+
+def _open_vectordb(gen: IndexGeneration, *, backend: str, rescore: bool = True) -> VectorIndex:
+    """
+    Qdrant or the NumPy snapshot; for a generation built with EMBED_REDUCE both hold reduced vectors,
+    so the query is projected and (with rescore) the prefetch set re-scored from the full-dim snapshot.
+    """
+    reduced = gen.projection_path.exists()
+    if backend == "qdrant" and not reduced:
+        return QdrantVectorDB(local_path=str(gen.qdrant_path), collection=load_qdrant_config().collection)
+
+    from .reduction import ReducedVectorDB, load_projection
+    from .vectordb_numpy import REDUCED_FILE, VECTORS_FILE, NumpyVectorDB
+
+    vectordb: VectorIndex
+    if backend == "numpy":
+        vectordb = NumpyVectorDB(gen.snapshot_path, vectors_file=REDUCED_FILE if reduced else VECTORS_FILE)
+    else:
+        vectordb = QdrantVectorDB(local_path=str(gen.qdrant_path), collection=load_qdrant_config().collection)
+    projection = load_projection(gen.projection_path)
+    if projection is None:
+        return vectordb
+    return ReducedVectorDB(vectordb, projection=projection, full=NumpyVectorDB(gen.snapshot_path) if rescore else None)
+
+
+def _make_query_cache(index_dir: Path) -> QueryCache | None:
+    from .query_cache import QueryCache
+
+    cfg = load_query_cache_config()
+    if cfg.max_entries <= 0:
+        return None
+    return QueryCache.for_index(
+        index_dir,
+        model_name=load_embeddings_config().model_name,
+        max_entries=cfg.max_entries,
     )
 
-    print(f"Retrieved chunks: {len(results)}\n")
-    for r in results:
-        c = r.chunk
+
+def _make_reranker(budget_ms: float) -> CrossEncoderReranker | None:
+    if budget_ms <= 0:
+        return None
+    from .reranker_onnx import CrossEncoderReranker
+
+    cfg = load_rerank_config()
+    return CrossEncoderReranker(model_name=cfg.model_name, batch_size=cfg.batch_size)
+
+
+def _log_cache_stats(cache: QueryCache | None) -> None:
+    if cache is not None:
+        log.info(
+            "Query cache: results hits=%d misses=%d, vectors hits=%d misses=%d (%s)",
+            cache.hits["results"], cache.misses["results"], cache.hits["vectors"], cache.misses["vectors"], cache.db_path,
+        )
+
+
+def _make_llm_cache(no_cache: bool) -> LLMCache | None:
+    from .llm_cache import LLMCache
+
+    cfg = load_llm_cache_config()
+    if cfg.max_entries <= 0:
+        return None
+    cache = LLMCache(
+        db_path=Path(cfg.path),
+        ttl_s=cfg.ttl_hours * 3600.0,
+        max_entries=cfg.max_entries,
+        max_bytes=cfg.max_mb * 1024 * 1024,
+        read=not no_cache,
+    )
+    cache.init()
+    return cache
+
+
+def _make_incident_cache(index_dir: Path, gen: IndexGeneration) -> IncidentCache | None:
+    from .incident_cache import IncidentCache
+
+    cfg = load_incident_cache_config()
+    if not cfg.path:
+        return None
+    return IncidentCache(
+        path=cfg.path,
+        # ключ — проиндексированное содержимое: пересборка без изменений (ежедневная переиндексация)
+        # сохраняет прошлые инциденты, а изменённый код — со сдвинутыми строками в отчётах — их отсекает.
+        # У индексов без content_hash в meta — поколение
+        index_id=f"{index_dir.resolve()}@{gen.meta().get('content_hash') or gen.id}",
+        model_name=load_embeddings_config().model_name,
+        threshold=cfg.threshold,
+        vector_weight=cfg.vector_weight,
+        max_entries=cfg.max_entries,
+    )
+
+
+def _log_llm_cache_stats(cache: LLMCache | None) -> None:
+    if cache is not None and cache.read:
+        log.info(
+            "LLM cache: hits=%d misses=%d hit_rate=%.0f%% (%s)",
+            cache.hits, cache.misses, 100.0 * cache.hit_rate, cache.db_path,
+        )
+
+
+def _load_incident(
+    incident_file: Path,
+    logs: List[Path] | None = None,
+    traces: List[Path] | None = None,
+    metrics: List[Path] | None = None,
+) -> Dict[str, Any]:
+    incident = json.loads(incident_file.read_text(encoding="utf-8"))
+    if logs:
+        from .log_ingest import attach_log_digest, ingest_logs
+
+        incident = attach_log_digest(incident, ingest_logs(logs))
+    if traces:
+        from .trace_ingest import attach_trace_digest, ingest_traces
+
+        incident = attach_trace_digest(incident, ingest_traces(traces))
+    if metrics:
+        from .metric_ingest import attach_metric_digest, ingest_metrics
+
+        incident = attach_metric_digest(incident, ingest_metrics(metrics, time_window=incident.get("time_window")))
+    return incident
+
+
+def cmd_run(
+    index_dir: Path,
+    incident_file: Path,
+    topk: int,
+    prefetch: int,
+    max_per_file: int,
+    rerank_budget_ms: float = 0.0,
+    rerank_top_n: int | None = None,
+    logs: List[Path] | None = None,
+    traces: List[Path] | None = None,
+    metrics: List[Path] | None = None,
+) -> int:
+    gen = _resolve_generation(index_dir)
+    store, embedder, vectordb = _make_runtime_clients(gen)
+    cache = _make_query_cache(gen.root)
+    incident = _load_incident(incident_file, logs, traces, metrics)
+
+    with span("retrieve"):
+        results = retrieve_topk(
+            vectordb=vectordb,
+            store=store,
+            embedder=embedder,
+            incident=incident,
+            top_k=topk,
+            prefetch_k=prefetch,
+            max_per_file=max_per_file,
+            cache=cache,
+            reranker=_make_reranker(rerank_budget_ms),
+            rerank_top_n=rerank_top_n if rerank_top_n is not None else load_rerank_config().top_n,
+            rerank_budget_ms=rerank_budget_ms,
+        )
+    _log_cache_stats(cache)
+
+    with span("config_facts"):
+        facts = find_config_facts(store, incident)
+
+    _print_retrieval([_retrieved_to_json(r) for r in results], [f.__dict__ for f in facts])
+    return 0
+
+
+def _retrieved_to_json(r: RetrievedChunk) -> Dict[str, Any]:
+    c = r.chunk
+    return {
+        "score": r.score,
+        "base_score": r.base_score,
+        "rerank_score": r.rerank_score,
+        "ce_score": r.ce_score,
+        "pinned": r.pinned,
+        "path": c.path,
+        "start_line": c.start_line,
+        "end_line": c.end_line,
+        "language": c.language,
+    }
+
+
+def _print_retrieval(rows: List[Dict[str, Any]], facts: List[Dict[str, Any]]) -> None:
+    print(f"Retrieved chunks: {len(rows)}\n")
+    for r in rows:
+        pin = " pinned" if r["pinned"] else ""
+        ce = f" ce={r['ce_score']:.3f}" if r["ce_score"] is not None else ""
         print(
-            f"[score={r.score:.4f} base={r.base_score:.4f} rr={r.rerank_score:+.2f}] "
-            f"{c.path}:{c.start_line}-{c.end_line} ({c.language})"
+            f"[score={r['score']:.4f} base={r['base_score']:.4f} rr={r['rerank_score']:+.2f}{ce}{pin}] "
+            f"{r['path']}:{r['start_line']}-{r['end_line']} ({r['language']})"
         )
+    if facts:
+        print(f"\nConfig keys: {len(facts)}\n")
+        for f in facts:
+            print(f"[matched={f['matched']}] {f['path']}:{f['line']} {f['key']} = {f['value']}")
+
+
+def cmd_run_remote(
+    server: str,
+    incident_file: Path,
+    topk: int,
+    prefetch: int,
+    max_per_file: int,
+    rerank_budget_ms: float = 0.0,
+    rerank_top_n: int | None = None,
+    logs: List[Path] | None = None,
+    traces: List[Path] | None = None,
+    metrics: List[Path] | None = None,
+) -> int:
+    """
+    Thin client: log/trace/metric digests are built locally, retrieval runs in `agent serve`.
+    """
+    from .server import ServerClient
+
+    incident = _load_incident(incident_file, logs, traces, metrics)
+    resp = ServerClient(server).call(
+        "/retrieve",
+        {
+            "incident": incident,
+            "topk": topk,
+            "prefetch": prefetch,
+            "max_per_file": max_per_file,
+            "rerank_budget_ms": rerank_budget_ms,
+            "rerank_top_n": rerank_top_n,
+        },
+    )
+    _print_retrieval(resp["chunks"], resp["config_facts"])
     return 0
 
 
+def _drop_covered_config_chunks(retrieved: List[RetrievedChunk], facts: List[ConfigFact]) -> List[RetrievedChunk]:
+    """
+    Config chunks whose keys are all already injected as facts only spend the context budget;
+    a chunk with any key not among the facts stays whole.
+    """
+    out = [
+        r for r in retrieved
+        if not (
+            r.chunk.language in CONFIG_LANGUAGES
+            and facts_cover(
+                facts, path=r.chunk.path, start_line=r.chunk.start_line, text=r.chunk.text, language=r.chunk.language,
+            )
+        )
+    ]
+    if len(out) < len(retrieved):
+        log.info("Config keys: %d facts replace %d config chunks", len(facts), len(retrieved) - len(out))
+    return out
+
+
+def _pack_context(
+    retrieved: List[RetrievedChunk],
+    *,
+    max_context_tokens: int,
+    max_context_chars: int,
+    minify: bool = True,
+) -> List[ContextItem]:
+    from .analyzer import ContextItem
+    from .context_packer import load_token_counter, merge_contexts, pack_contexts
+    from .minify import minify_contexts
+
+    raw = [
+        ContextItem(
+            score=r.score,
+            base=r.base_score,
+            rr=r.rerank_score,
+            path=r.chunk.path,
+            start_line=r.chunk.start_line,
+            end_line=r.chunk.end_line,
+            language=r.chunk.language,
+            text=r.chunk.text,
+        )
+        for r in retrieved
+    ]
+    counter = load_token_counter(load_context_config().tokenizer)
+    raw_tokens = sum(counter.count(c.text) for c in raw)
+
+    merged = merge_contexts(raw)
+    # экономию слияния и минификации считаем по отдельности: токены после слияния, но до минификации
+    if minify:
+        merged, merged_tokens, minified_tokens = minify_contexts(merged, count_tokens=counter.count)
+        merged = [c for c in merged if c.text]
+    else:
+        merged_tokens = minified_tokens = sum(counter.count(c.text) for c in merged)
+    packed = pack_contexts(merged, max_tokens=max_context_tokens, max_chars=max_context_chars, counter=counter)
+    count("context_tokens_raw", raw_tokens)
+    count("context_tokens_packed", packed.tokens)
+
+    log.info(
+        "Context pack: chunks=%d merged=%d packed=%d tokens=%d/%d (merge %+d tokens, minify %+d tokens)",
+        len(raw), len(merged), len(packed.items), packed.tokens, max_context_tokens,
+        merged_tokens - raw_tokens, minified_tokens - merged_tokens,
+    )
+    for c in packed.dropped:
+        log.info("Context pack: dropped %s:%d-%d (score=%.3f, does not fit)", c.path, c.start_line, c.end_line, c.score)
+    return packed.items
+
+
+def _prepare_analysis(
+    store: SQLiteStore,
+    embedder: FastEmbedProvider,
+    vectordb: VectorIndex,
+    incident: Dict[str, Any],
+    *,
+    topk: int,
+    prefetch: int,
+    max_per_file: int,
+    max_context_chars: int,
+    max_context_tokens: int,
+    minify: bool,
+    cache: QueryCache | None,
+    reranker: CrossEncoderReranker | None,
+    rerank_budget_ms: float,
+    rerank_top_n: int | None,
+    query_vector: List[float] | None = None,
+) -> Tuple[List[ContextItem], List[ConfigFact]]:
+    """
+    Retrieval -> config facts -> packed context: everything before the LLM call.
+    """
+    with span("retrieve"):
+        retrieved = retrieve_topk(
+            vectordb=vectordb,
+            store=store,
+            embedder=embedder,
+            incident=incident,
+            top_k=topk,
+            prefetch_k=prefetch,
+            max_per_file=max_per_file,
+            cache=cache,
+            reranker=reranker,
+            rerank_top_n=rerank_top_n if rerank_top_n is not None else load_rerank_config().top_n,
+            rerank_budget_ms=rerank_budget_ms,
+            query_vector=query_vector,
+        )
+
+    with span("config_facts"):
+        facts = find_config_facts(store, incident)
+    retrieved = _drop_covered_config_chunks(retrieved, facts)
+
+    with span("context_pack"):
+        contexts = _pack_context(
+            retrieved,
+            max_context_tokens=max_context_tokens,
+            max_context_chars=max_context_chars,
+            minify=minify,
+        )
+    return contexts, facts
+
+
+def _write_report(out_report: Path, report: Dict[str, Any]) -> None:
+    out_report.parent.mkdir(parents=True, exist_ok=True)
+    # при стриминге отчёт перезаписывается по мере прихода гипотез: читатель не должен видеть полфайла
+    tmp = out_report.with_name(out_report.name + ".tmp")
+    tmp.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, out_report)
+
+
+def _run_llm(
+    llm: LLMClient,
+    incident: Dict[str, Any],
+    contexts: List[ContextItem],
+    facts: List[ConfigFact],
+    *,
+    map_reduce: bool,
+    max_shards: int,
+    max_context_tokens: int,
+    max_context_chars: int,
+    cache: LLMCache | None,
+    on_hypothesis: Any = None,
+) -> Dict[str, Any]:
+    from .analyzer import analyze_incident_map_reduce, analyze_incident_with_llm
+    from .context_packer import load_token_counter
+
+    if map_reduce:
+        return analyze_incident_map_reduce(
+            llm=llm,
+            incident=incident,
+            contexts=contexts,
+            count_tokens=load_token_counter(load_context_config().tokenizer).count,
+            max_shard_tokens=max_context_tokens,
+            max_shard_chars=max_context_chars,
+            max_shards=max_shards,
+            config_facts=facts,
+            temperature=0.1,
+            cache=cache,
+            on_hypothesis=on_hypothesis,
+        )
+    return analyze_incident_with_llm(
+        llm=llm,
+        incident=incident,
+        contexts=contexts,
+        config_facts=facts,
+        temperature=0.1,
+        cache=cache,
+        on_hypothesis=on_hypothesis,
+    )
+
+
+def _print_timing(report: Dict[str, Any]) -> None:
+    timing = report.get("llm_timing") or {}
+    if "first_hypothesis_ms" in timing:
+        print(f"Time to first hypothesis: {timing['first_hypothesis_ms'] / 1000.0:.1f}s (total {timing['total_ms'] / 1000.0:.1f}s)")
+
+
 def cmd_analyze(
     index_dir: Path,
     incident_file: Path,
@@ -158,52 +679,697 @@ def cmd_analyze(
     prefetch: int,
     max_per_file: int,
     max_context_chars: int,
+    rerank_budget_ms: float = 0.0,
+    rerank_top_n: int | None = None,
+    max_context_tokens: int = 24_000,
+    minify: bool = True,
+    logs: List[Path] | None = None,
+    traces: List[Path] | None = None,
+    metrics: List[Path] | None = None,
+    no_cache: bool = False,
+    map_reduce: bool = False,
+    max_shards: int = 4,
 ) -> int:
-    store, embedder, vectordb = _make_runtime_clients(index_dir)
-    incident = json.loads(incident_file.read_text(encoding="utf-8"))
+    from .llm_client import LLMClient, load_llm_config
 
-    retrieved = retrieve_topk(
-        vectordb=vectordb,
-        store=store,
-        embedder=embedder,
-        incident=incident,
-        top_k=topk,
-        prefetch_k=prefetch,
+    gen = _resolve_generation(index_dir)
+    store, embedder, vectordb = _make_runtime_clients(gen)
+    cache = _make_query_cache(gen.root)
+    incident = _load_incident(incident_file, logs, traces, metrics)
+
+    query_text = incident_to_query_text(incident)
+    qv = embed_queries(embedder, [query_text], cache)[0]
+    signals = extract_signals(query_text)
+
+    incident_cache = _make_incident_cache(index_dir, gen)
+    if incident_cache is not None and not no_cache:
+        match = incident_cache.lookup(qv, signals)
+        if match is not None:
+            _write_report(out_report, match.as_report())
+            print(f"Wrote cached report (matches {match.name}, similarity {match.similarity:.3f}): {out_report}")
+            return 0
+
+    # map-reduce: контекст пакуется под суммарный бюджет всех шардов, дробит его analyzer
+    shards = max(1, max_shards) if map_reduce else 1
+    contexts, facts = _prepare_analysis(
+        store, embedder, vectordb, incident,
+        topk=topk,
+        prefetch=prefetch,
         max_per_file=max_per_file,
+        max_context_chars=max_context_chars * shards,
+        max_context_tokens=max_context_tokens * shards,
+        minify=minify,
+        cache=cache,
+        reranker=_make_reranker(rerank_budget_ms),
+        rerank_budget_ms=rerank_budget_ms,
+        rerank_top_n=rerank_top_n,
+        query_vector=qv,
+    )
+    _log_cache_stats(cache)
+
+    llm_cache = _make_llm_cache(no_cache)
+    llm = LLMClient(load_llm_config())
+    arrived: List[Dict[str, Any]] = []
+
+    def on_hypothesis(h: Dict[str, Any]) -> None:
+        arrived.append(h)
+        print(f"Hypothesis {len(arrived)}: {h.get('title', '')} (confidence {h.get('confidence', '?')})", flush=True)
+        _write_report(out_report, {"partial": True, "hypotheses": arrived})
+
+    report = _run_llm(
+        llm, incident, contexts, facts,
+        map_reduce=map_reduce,
+        max_shards=shards,
+        max_context_tokens=max_context_tokens,
+        max_context_chars=max_context_chars,
+        cache=llm_cache,
+        on_hypothesis=on_hypothesis,
     )
+    _log_llm_cache_stats(llm_cache)
+    _print_timing(report)
+    if incident_cache is not None:
+        incident_cache.add(name=incident_file.stem, vector=qv, signals=signals, report=report)
+
+    _write_report(out_report, report)
+    print(f"Wrote report: {out_report}")
+    return 0
+
 
-    # собрать контекст с ограничением по размеру
-    contexts: List[ContextItem] = []
-    used = 0
-    for r in retrieved:
-        c = r.chunk
-        text = c.text
-        if used + len(text) > max_context_chars:
-            # пропустим, если не помещается
-            continue
-        contexts.append(
-            ContextItem(
-                score=r.score,
-                base=r.base_score,
-                rr=r.rerank_score,
-                path=c.path,
-                start_line=c.start_line,
-                end_line=c.end_line,
-                language=c.language,
-                text=text,
+def cmd_analyze_remote(
+    server: str,
+    incident_file: Path,
+    out_report: Path,
+    topk: int,
+    prefetch: int,
+    max_per_file: int,
+    max_context_chars: int,
+    rerank_budget_ms: float = 0.0,
+    rerank_top_n: int | None = None,
+    max_context_tokens: int = 24_000,
+    minify: bool = True,
+    logs: List[Path] | None = None,
+    traces: List[Path] | None = None,
+    metrics: List[Path] | None = None,
+    no_cache: bool = False,
+    map_reduce: bool = False,
+    max_shards: int = 4,
+) -> int:
+    from .server import ServerClient
+
+    incident = _load_incident(incident_file, logs, traces, metrics)
+    report = ServerClient(server).call(
+        "/analyze",
+        {
+            "name": incident_file.stem,
+            "incident": incident,
+            "topk": topk,
+            "prefetch": prefetch,
+            "max_per_file": max_per_file,
+            "max_context_chars": max_context_chars,
+            "max_context_tokens": max_context_tokens,
+            "minify": minify,
+            "rerank_budget_ms": rerank_budget_ms,
+            "rerank_top_n": rerank_top_n,
+            "no_cache": no_cache,
+            "map_reduce": map_reduce,
+            "max_shards": max_shards,
+        },
+    )
+    _print_timing(report)
+    _write_report(out_report, report)
+    print(f"Wrote report: {out_report}")
+    return 0
+
+
+@dataclass
+class _BatchJob:
+    name: str
+    incident: Dict[str, Any]
+    vector: List[float]
+    signals: IncidentSignals
+    contexts: List[ContextItem]
+    facts: List[ConfigFact]
+    match: Optional[IncidentMatch] = None
+
+
+def cmd_analyze_batch(
+    index_dir: Path,
+    source: Path,
+    out_dir: Path,
+    topk: int,
+    prefetch: int,
+    max_per_file: int,
+    max_context_chars: int,
+    rerank_budget_ms: float = 0.0,
+    rerank_top_n: int | None = None,
+    max_context_tokens: int = 24_000,
+    minify: bool = True,
+    concurrency: int = 4,
+    rpm: float = 0.0,
+    retrieve_batch: int = 16,
+    no_cache: bool = False,
+) -> int:
+    """
+    Many incidents with one set of clients: shared embedder/Qdrant/SQLite/LLM pool, batched query embeddings,
+    concurrent rate-limited LLM calls; each report is written as soon as it is ready.
+    """
+    import asyncio
+
+    from .analyzer import analyze_incident_with_llm
+    from .batch import iter_incidents, run_batch
+    from .llm_client import LLMClient, load_llm_config
+
+    gen = _resolve_generation(index_dir)
+    store, embedder, vectordb = _make_runtime_clients(gen)
+    cache = _make_query_cache(gen.root)
+    reranker = _make_reranker(rerank_budget_ms)
+    llm_cache = _make_llm_cache(no_cache)
+    incident_cache = _make_incident_cache(index_dir, gen)
+    llm = LLMClient(load_llm_config())
+
+    def prepare(batch: List[Incident]) -> List[_BatchJob]:
+        texts = [incident_to_query_text(inc) for _, inc in batch]
+        vectors = embed_queries(embedder, texts, cache)
+        jobs: List[_BatchJob] = []
+        for (name, incident), text, qv in zip(batch, texts, vectors):
+            signals = extract_signals(text)
+            if incident_cache is not None and not no_cache:
+                match = incident_cache.lookup(qv, signals)
+                if match is not None:
+                    jobs.append(_BatchJob(name, incident, qv, signals, [], [], match))
+                    continue
+            contexts, facts = _prepare_analysis(
+                store, embedder, vectordb, incident,
+                topk=topk,
+                prefetch=prefetch,
+                max_per_file=max_per_file,
+                max_context_chars=max_context_chars,
+                max_context_tokens=max_context_tokens,
+                minify=minify,
+                cache=cache,
+                reranker=reranker,
+                rerank_budget_ms=rerank_budget_ms,
+                rerank_top_n=rerank_top_n,
+                query_vector=qv,
+            )
+            jobs.append(_BatchJob(name, incident, qv, signals, contexts, facts))
+        log.info("Prepared %d incidents (one embedding batch)", len(batch))
+        return jobs
+
+    def analyze(job: _BatchJob) -> Dict[str, Any]:
+        if job.match is not None:
+            return job.match.as_report()
+        report = analyze_incident_with_llm(
+            llm=llm,
+            incident=job.incident,
+            contexts=job.contexts,
+            config_facts=job.facts,
+            temperature=0.1,
+            cache=llm_cache,
+        )
+        if incident_cache is not None:
+            incident_cache.add(name=job.name, vector=job.vector, signals=job.signals, report=report)
+        return report
+
+    def on_report(name: str, report: Dict[str, Any]) -> None:
+        path = out_dir / f"{name}.report.json"
+        _write_report(path, report)
+        print(f"Wrote report: {path}", flush=True)
+
+    with llm:
+        result = asyncio.run(
+            run_batch(
+                iter_incidents(source),
+                prepare=prepare,
+                analyze=analyze,
+                on_report=on_report,
+                concurrency=concurrency,
+                rate_per_s=rpm / 60.0,
+                burst=concurrency,
+                prepare_batch_size=retrieve_batch,
             )
         )
-        used += len(text)
+    _log_cache_stats(cache)
+    _log_llm_cache_stats(llm_cache)
 
+    log.info("Batch done: %d ok, %d failed in %.1fs", len(result.ok), len(result.failed), result.elapsed_s)
+    for name in result.failed:
+        log.warning("Failed incident: %s", name)
+    return 0 if not result.failed else 1
+
+
+def _opt(payload: Dict[str, Any], name: str, default: Any) -> Any:
+    from .server import HTTPError
+
+    v = payload.get(name)
+    if v is None:
+        return default
+    try:
+        return v if default is None else type(default)(v)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"bad value for {name}: {v!r}")
+
+
+@dataclass
+class _LiveIndex:
+    """
+    The generation `agent serve` reads from. refresh() runs on the index thread before each piece of
+    SQLite/Qdrant work, checks CURRENT (at most once per interval) and swaps to a newly published
+    generation, so a rebuild is picked up without a restart.
+    """
+
+    index_dir: Path
+    gen: IndexGeneration
+    store: SQLiteStore
+    vectordb: VectorIndex
+    cache: QueryCache | None
+    incident_cache: IncidentCache | None = None
+    check_interval_s: float = 1.0
+    _checked_at: float = 0.0
+
+    def refresh(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval_s:
+            return
+        self._checked_at = now
+        gen_id = current_generation_id(self.index_dir)
+        if gen_id is None or gen_id == self.gen.id:
+            return
+        gen = _resolve_generation(self.index_dir)
+        try:
+            store, vectordb = _open_index(gen, persistent=True)
+            store.count_chunks()
+        except Exception as e:
+            log.error("Index generation %s is not readable, staying on %s: %s", gen_id, self.gen.id, e)
+            return
+        old_id, old_store, old_vectordb = self.gen.id, self.store, self.vectordb
+        self.gen, self.store, self.vectordb, self.cache = gen, store, vectordb, _make_query_cache(gen.root)
+        self.incident_cache = _make_incident_cache(self.index_dir, gen)
+        # старое поколение отпускаем сразу: вся работа с индексом идёт в этом же потоке
+        old_vectordb.close()
+        old_store.close()
+        log.info("Switched index generation %s -> %s", old_id, gen.id)
+
+
+def cmd_serve(index_dir: Path, listen: str, embed_workers: int, llm_concurrency: int) -> int:
+    """
+    Long-running service: the embedding model, Qdrant local storage (and its file lock), SQLite connections,
+    the cross-encoder and the LLM client are loaded once. Query embedding runs in a worker pool;
+    SQLite/Qdrant work stays on one thread, as in analyze-batch; LLM calls are bounded by a semaphore.
+    """
+    import asyncio
+
+    from .llm_client import LLMClient, load_llm_config
+    from .reranker_onnx import CrossEncoderReranker
+    from .server import HTTPError, serve
+
+    t_start = time.perf_counter()
+    gen = _resolve_generation(index_dir)
+    store, embedder, vectordb = _make_runtime_clients(gen, persistent=True)
+    live = _LiveIndex(
+        index_dir=index_dir,
+        gen=gen,
+        store=store,
+        vectordb=vectordb,
+        cache=_make_query_cache(gen.root),
+        incident_cache=_make_incident_cache(index_dir, gen),
+    )
+    llm_caches = {no_cache: _make_llm_cache(no_cache) for no_cache in (False, True)}
+    rerank_cfg = load_rerank_config()
+    reranker = CrossEncoderReranker(model_name=rerank_cfg.model_name, batch_size=rerank_cfg.batch_size)
     llm = LLMClient(load_llm_config())
-    report = analyze_incident_with_llm(llm=llm, incident=incident, contexts=contexts, temperature=0.1)
 
-    out_report.parent.mkdir(parents=True, exist_ok=True)
-    out_report.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"Wrote report: {out_report}")
+    embedder.embed_texts(["warmup"])   # грузим ONNX-модель до первого запроса
+    dim = embedder.dim()
+    log.info("Warm in %.1fs (embed model=%s, dim=%d)", time.perf_counter() - t_start, embedder.model_name, dim)
+
+    embed_pool = ThreadPoolExecutor(max_workers=max(1, embed_workers), thread_name_prefix="embed")
+    index_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index")
+    llm_sem: asyncio.Semaphore | None = None
+    served = {"retrieve": 0, "analyze": 0}
+
+    def incident_of(payload: Dict[str, Any]) -> Dict[str, Any]:
+        incident = payload.get("incident")
+        if not isinstance(incident, dict):
+            raise HTTPError(400, "'incident' must be a JSON object")
+        return incident
+
+    async def embed(text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        return (await loop.run_in_executor(embed_pool, embed_queries, embedder, [text], live.cache))[0]
+
+    async def on_index(fn: Any, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(index_pool, lambda: fn(*args, **kwargs))
+
+    async def health(_: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "index": str(index_dir),
+            "generation": live.gen.id,
+            "embed_model": embedder.model_name,
+            "uptime_s": round(time.perf_counter() - t_start, 1),
+            "served": served,
+        }
+
+    async def retrieve(payload: Dict[str, Any]) -> Dict[str, Any]:
+        incident = incident_of(payload)
+        budget = _opt(payload, "rerank_budget_ms", 0.0)
+        qv = await embed(incident_to_query_text(incident))
+
+        def work() -> Tuple[List[RetrievedChunk], List[ConfigFact]]:
+            live.refresh()
+            results = retrieve_topk(
+                vectordb=live.vectordb,
+                store=live.store,
+                embedder=embedder,
+                incident=incident,
+                top_k=_opt(payload, "topk", 12),
+                prefetch_k=_opt(payload, "prefetch", 80),
+                max_per_file=_opt(payload, "max_per_file", 2),
+                cache=live.cache,
+                reranker=reranker if budget > 0 else None,
+                rerank_top_n=_opt(payload, "rerank_top_n", rerank_cfg.top_n),
+                rerank_budget_ms=budget,
+                query_vector=qv,
+            )
+            return results, find_config_facts(live.store, incident)
+
+        results, facts = await on_index(work)
+        served["retrieve"] += 1
+        return {"chunks": [_retrieved_to_json(r) for r in results], "config_facts": [f.__dict__ for f in facts]}
+
+    async def analyze(payload: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal llm_sem
+        incident = incident_of(payload)
+        no_cache = bool(payload.get("no_cache"))
+        map_reduce = bool(payload.get("map_reduce"))
+        max_shards = max(1, _opt(payload, "max_shards", 4)) if map_reduce else 1
+        max_context_tokens = _opt(payload, "max_context_tokens", 24_000)
+        max_context_chars = _opt(payload, "max_context_chars", 120_000)
+        budget = _opt(payload, "rerank_budget_ms", 0.0)
+
+        query_text = incident_to_query_text(incident)
+        qv = await embed(query_text)
+        signals = extract_signals(query_text)
+
+        def prepare() -> Tuple[IncidentCache | None, IncidentMatch | None, List[ContextItem], List[ConfigFact]]:
+            live.refresh()
+            # кэш инцидентов — того же поколения, по которому идёт retrieval (и в него же пишем отчёт)
+            incident_cache = live.incident_cache
+            if incident_cache is not None and not no_cache:
+                match = incident_cache.lookup(qv, signals)
+                if match is not None:
+                    return incident_cache, match, [], []
+            contexts, facts = _prepare_analysis(
+                live.store, embedder, live.vectordb, incident,
+                topk=_opt(payload, "topk", 12),
+                prefetch=_opt(payload, "prefetch", 80),
+                max_per_file=_opt(payload, "max_per_file", 2),
+                max_context_chars=max_context_chars * max_shards,
+                max_context_tokens=max_context_tokens * max_shards,
+                minify=bool(payload.get("minify", True)),
+                cache=live.cache,
+                reranker=reranker if budget > 0 else None,
+                rerank_budget_ms=budget,
+                rerank_top_n=_opt(payload, "rerank_top_n", None),
+                query_vector=qv,
+            )
+            return incident_cache, None, contexts, facts
+
+        incident_cache, match, contexts, facts = await on_index(prepare)
+        if match is not None:
+            served["analyze"] += 1
+            return match.as_report()
+        if llm_sem is None:
+            llm_sem = asyncio.Semaphore(max(1, llm_concurrency))
+        async with llm_sem:
+            report = await asyncio.to_thread(
+                _run_llm, llm, incident, contexts, facts,
+                map_reduce=map_reduce,
+                max_shards=max_shards,
+                max_context_tokens=max_context_tokens,
+                max_context_chars=max_context_chars,
+                cache=llm_caches[no_cache],
+            )
+        if incident_cache is not None:
+            await on_index(
+                incident_cache.add, name=str(payload.get("name") or "incident"), vector=qv, signals=signals, report=report,
+            )
+        served["analyze"] += 1
+        return report
+
+    routes: Routes = {
+        ("GET", "/health"): health,
+        ("POST", "/retrieve"): retrieve,
+        ("POST", "/analyze"): analyze,
+    }
+    try:
+        asyncio.run(serve(routes, listen=listen))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        embed_pool.shutdown(wait=False, cancel_futures=True)
+        index_pool.shutdown(wait=True)
+        llm.close()
+    return 0
+
+
+def cmd_bench_embed(repo: Path, sample: int, profiles: List[str], out_json: Path | None = None) -> int:
+    """
+    chunks/s and cosine agreement with the fp32 baseline for each embedding runtime profile,
+    on a fixed random sample of the repo's chunks.
+    """
+    import random
+
+    from .embed_bench import bench_embed_profiles
+    from .indexer import build_chunks
+
+    emb_cfg = load_embeddings_config()
+    chunks = build_chunks(repo_root=repo, chunk_cfg=load_chunking_config(), index_cfg=load_index_config())
+    if not chunks:
+        log.warning("No chunks built. Check include_prefixes/excludes and repo path.")
+        return 2
+    picked = random.Random(0).sample(chunks, min(sample, len(chunks)))
+    log.info("bench-embed: %d of %d chunks, model=%s, batch=%d", len(picked), len(chunks), emb_cfg.model_name, emb_cfg.batch_size)
+
+    results = bench_embed_profiles(
+        [c.text for c in picked], model_name=emb_cfg.model_name, batch_size=emb_cfg.batch_size, profiles=profiles,
+    )
+    print(f"{'profile':<12} {'chunks/s':>9} {'speedup':>8} {'load_s':>7} {'cos_mean':>9} {'cos_min':>8}")
+    base = results[0].chunks_per_s
+    for r in results:
+        cos_mean = "-" if r.cos_mean is None else f"{r.cos_mean:.5f}"
+        cos_min = "-" if r.cos_min is None else f"{r.cos_min:.5f}"
+        print(f"{r.profile:<12} {r.chunks_per_s:>9.1f} {r.chunks_per_s / max(base, 1e-9):>7.2f}x {r.load_s:>7.2f} {cos_mean:>9} {cos_min:>8}")
+    if out_json is not None:
+        out_json.write_text(
+            json.dumps({"model": emb_cfg.model_name, "results": [r.__dict__ for r in results]}, ensure_ascii=False, indent=2),
+            encoding="utf-8",
+        )
+        print(f"Wrote: {out_json}")
+    return 0
+
+
+def cmd_bench(
+    chunks: int,
+    incidents: int,
+    queries: int,
+    backends: List[str],
+    dim: int,
+    seed: int,
+    llm_calls: int,
+    workdir: Path | None,
+    out_json: Path | None,
+    baseline: Path | None,
+) -> int:
+    """
+    Offline end-to-end benchmark on a generated repo (hashing embedder, mock LLM); with --baseline prints
+    the change of every throughput/latency against an earlier results file.
+    """
+    import tempfile
+
+    from .bench import compare_results, run_benchmark
+
+    keep = workdir is not None
+    root = workdir if workdir is not None else Path(tempfile.mkdtemp(prefix="agent-bench-"))
+    if keep and root.exists() and any(root.iterdir()):
+        log.error("bench: --workdir %s is not empty", root)
+        return 2
+    try:
+        results = run_benchmark(
+            root,
+            chunks=chunks,
+            incidents=incidents,
+            queries=queries,
+            backends=tuple(backends),
+            dim=dim,
+            seed=seed,
+            llm_calls=llm_calls,
+        )
+    finally:
+        if not keep:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print(f"{'stage':<14} {'seconds':>9} {'items/s':>12}")
+    for name, st in results["stages"].items():
+        rate = next(v for k, v in st.items() if k.endswith("_per_s"))
+        print(f"{name:<14} {st['seconds']:>9.3f} {rate:>12.1f}")
+    print(f"{'latency, ms':<22} {'p50':>8} {'p95':>8} {'p99':>8}")
+    rows = [(f"retrieve {b}", r) for b, r in results["retrieval"].items()]
+    rows += [(f"  search {b}", r["search"]) for b, r in results["retrieval"].items()]
+    if results["llm"]:
+        rows.append(("analyze (mock LLM)", results["llm"]))
+    for name, r in rows:
+        print(f"{name:<22} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+    if baseline is not None:
+        base = json.loads(baseline.read_text(encoding="utf-8"))
+        print(f"vs {baseline} (commit {(base.get('git') or {}).get('commit') or '?'}):")
+        for metric, old, new in compare_results(results, base):
+            print(f"  {metric:<32} {old:>12.2f} -> {new:>12.2f} ({100.0 * (new - old) / max(abs(old), 1e-9):+.1f}%)")
+    if out_json is not None:
+        out_json.parent.mkdir(parents=True, exist_ok=True)
+        out_json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Wrote: {out_json}")
     return 0
 
 
+def _index_label(index_dir: Path, gen: IndexGeneration) -> str:
+    meta = gen.meta()
+    red = meta.get("reduction") or {}
+    parts = [
+        f"lines={meta.get('chunk_max_lines', '?')}/{meta.get('chunk_overlap', '?')}",
+        f"dim={meta.get('search_dim') or meta.get('dim', '?')}",
+    ]
+    if red:
+        parts.append(f"reduce={red.get('method')}")
+    return f"{index_dir.name}[{' '.join(parts)}]"
+
+
+def cmd_eval(
+    index_dirs: List[Path],
+    incidents: Path,
+    grid_args: Dict[str, Any],
+    repeat: int,
+    latency_key: str,
+    quality_key: str,
+    out_json: Path | None,
+) -> int:
+    """
+    Retrieval quality (recall@k, MRR against labelled file:line evidence) vs latency and memory over a
+    parameter grid, for every index given; prints the Pareto frontier.
+    """
+    from .bench import git_revision
+    from .evaluate import SweepGrid, load_labelled_incidents, mark_pareto, sweep_index
+
+    labelled = load_labelled_incidents(incidents)
+    if not labelled:
+        log.error("eval: no labelled incidents in %s (each needs an \"expected\" list)", incidents)
+        return 2
+    grid = SweepGrid(**grid_args)
+    reranker = _make_reranker(max(grid.rerank_budget_ms))
+
+    points = []
+    for index_dir in index_dirs:
+        gen = _resolve_generation(index_dir)
+        store, embedder, vectordb = _make_runtime_clients(gen)
+        vectordb.close()            # бэкенды открывает sweep, по одному
+        label = _index_label(index_dir, gen)
+        try:
+            points += sweep_index(
+                label,
+                labelled,
+                store=store,
+                embedder=embedder,
+                open_vectordb=lambda backend, rescore, gen=gen: _open_vectordb(gen, backend=backend, rescore=rescore),
+                reduced=gen.projection_path.exists(),
+                grid=grid,
+                reranker=reranker,
+                repeat=repeat,
+            )
+        finally:
+            store.close()
+
+    front = mark_pareto(points, latency=latency_key, quality=quality_key)
+    print(
+        f"{len(labelled)} incidents, {len(points)} configurations, {len(front)} on the Pareto frontier "
+        f"({quality_key} vs {latency_key}, marked *):"
+    )
+    print(f"{'':<2}{latency_key:>9} {'recall':>7} {'mrr':>6} {'hit':>6} {'alloc_kb':>9}  index / params")
+    for p in sorted(points, key=lambda p: p.latency.get(latency_key, 0.0)):
+        if not p.pareto and out_json is not None:
+            continue            # полная таблица — в JSON
+        params = " ".join(f"{k}={v}" for k, v in p.params.items() if k != "rerank_top_n" or p.params["rerank_budget_ms"] > 0)
+        print(
+            f"{'*' if p.pareto else ' ':<2}{p.latency.get(latency_key, 0.0):>9.2f} {p.recall:>7.3f} {p.mrr:>6.3f} "
+            f"{p.hit_rate:>6.3f} {p.peak_alloc_kb or 0:>9.0f}  {p.index} {params}"
+        )
+    if out_json is not None:
+        out_json.parent.mkdir(parents=True, exist_ok=True)
+        out_json.write_text(json.dumps({
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "git": git_revision(),
+            "incidents": len(labelled),
+            "latency_key": latency_key,
+            "quality_key": quality_key,
+            "frontier": [p.as_json() for p in front],
+            "points": [p.as_json() for p in points],
+        }, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"Wrote: {out_json} (all {len(points)} configurations)")
+    return 0
+
+
+def _int_list(s: str) -> tuple[int, ...]:
+    return tuple(int(x) for x in s.split(",") if x.strip())
+
+
+def _add_rerank_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--rerank-budget-ms", type=float, default=0.0,
+        help="Time budget per query for the ONNX cross-encoder stage (0 = heuristic rerank only)",
+    )
+    p.add_argument("--rerank-top-n", type=int, default=None, help="Heuristic candidates passed to the cross-encoder")
+
+
+def _add_ingest_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--logs", type=Path, action="append", default=None,
+        help="Log file (.log or .log.gz), streamed and mined into templates; can be repeated",
+    )
+    p.add_argument(
+        "--traces", type=Path, action="append", default=None,
+        help="OTLP/Jaeger JSON trace export (.json or .json.gz), streamed; can be repeated",
+    )
+    p.add_argument(
+        "--metrics", type=Path, action="append", default=None,
+        help="Prometheus range-query JSON or CSV (wide or long) for the incident window; can be repeated",
+    )
+
+
+def _add_profile_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--profile", type=Path, help="Write per-stage timings and byte/token counters as JSON here")
+    p.add_argument(
+        "--prometheus-textfile", type=Path,
+        help="Also write them as a node_exporter textfile (e.g. /var/lib/node_exporter/agent.prom)",
+    )
+
+
+def _add_server_arg(p: argparse.ArgumentParser) -> None:
+    p.add_argument(
+        "--server", default=None,
+        help="Send the request to a running `agent serve` (host:port or unix:/path) instead of loading the index",
+    )
+
+
+def _add_context_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--topk", type=int, default=12)
+    p.add_argument("--prefetch", type=int, default=80)
+    p.add_argument("--max-per-file", type=int, default=2)
+    p.add_argument("--max-context-chars", type=int, default=120_000)
+    p.add_argument("--max-context-tokens", type=int, default=24_000, help="Token budget for code context")
+    p.add_argument("--no-minify", action="store_true", help="Send code context verbatim (no comment/import stripping)")
+
+
 def main(argv: List[str] | None = None) -> int:
     _setup_logging()
 
@@ -213,27 +1379,147 @@ def main(argv: List[str] | None = None) -> int:
     p_index = sub.add_parser("index", help="Build index for a repo (SQLite payload + Qdrant local vectors)")
     p_index.add_argument("--repo", required=True, type=Path)
     p_index.add_argument("--out", required=True, type=Path)
+    p_index.add_argument(
+        "--keep-generations", type=int, default=2,
+        help="Index generations to keep on disk (the published one included)",
+    )
+    _add_profile_args(p_index)
 
     p_run = sub.add_parser("run", help="Run retrieval for an incident (prints hits)")
-    p_run.add_argument("--index", required=True, type=Path)
+    p_run.add_argument("--index", type=Path, help="Index directory (required unless --server is given)")
     p_run.add_argument("--incident", required=True, type=Path)
     p_run.add_argument("--topk", type=int, default=12)
     p_run.add_argument("--prefetch", type=int, default=80)
     p_run.add_argument("--max-per-file", type=int, default=2)
+    _add_rerank_args(p_run)
+    _add_ingest_args(p_run)
+    _add_server_arg(p_run)
+    _add_profile_args(p_run)
 
     p_an = sub.add_parser("analyze", help="Run retrieval + LLM analysis, write JSON report")
-    p_an.add_argument("--index", required=True, type=Path)
+    p_an.add_argument("--index", type=Path, help="Index directory (required unless --server is given)")
     p_an.add_argument("--incident", required=True, type=Path)
     p_an.add_argument("--out-report", required=True, type=Path)
-    p_an.add_argument("--topk", type=int, default=12)
-    p_an.add_argument("--prefetch", type=int, default=80)
-    p_an.add_argument("--max-per-file", type=int, default=2)
-    p_an.add_argument("--max-context-chars", type=int, default=120_000)
+    _add_context_args(p_an)
+    p_an.add_argument("--no-cache", action="store_true", help="Ignore cached LLM responses and past-incident matches (fresh results are still stored)")
+    p_an.add_argument(
+        "--map-reduce", action="store_true",
+        help="Analyze context that exceeds one window in concurrent shards, then merge the partial reports",
+    )
+    p_an.add_argument("--max-shards", type=int, default=4, help="Map-reduce: at most this many context windows")
+    _add_rerank_args(p_an)
+    _add_ingest_args(p_an)
+    _add_server_arg(p_an)
+    _add_profile_args(p_an)
+
+    p_batch = sub.add_parser("analyze-batch", help="Analyze many incidents with shared clients, concurrent LLM calls")
+    p_batch.add_argument("--index", required=True, type=Path)
+    p_batch.add_argument(
+        "--incidents", required=True, type=Path,
+        help="Directory of incident *.json files, a .jsonl file, or - for JSONL on stdin",
+    )
+    p_batch.add_argument("--out-dir", required=True, type=Path, help="Reports are written as <name>.report.json")
+    p_batch.add_argument("--concurrency", type=int, default=4, help="Max LLM calls in flight")
+    p_batch.add_argument("--rpm", type=float, default=0.0, help="LLM requests per minute, token bucket (0 = unlimited)")
+    p_batch.add_argument("--retrieve-batch", type=int, default=16, help="Incidents per batched query embedding")
+    _add_context_args(p_batch)
+    p_batch.add_argument("--no-cache", action="store_true", help="Ignore cached LLM responses and past-incident matches (fresh results are still stored)")
+    _add_rerank_args(p_batch)
+    _add_profile_args(p_batch)
+
+    p_serve = sub.add_parser("serve", help="Long-running service with warm models and index (HTTP or Unix socket)")
+    p_serve.add_argument("--index", required=True, type=Path)
+    p_serve.add_argument(
+        "--listen", default="127.0.0.1:8765",
+        help="host:port or unix:/path/to/agent.sock",
+    )
+    p_serve.add_argument("--embed-workers", type=int, default=2, help="Threads for query embedding")
+    p_serve.add_argument("--llm-concurrency", type=int, default=4, help="Max LLM calls in flight")
+
+    p_bench = sub.add_parser("bench-embed", help="Compare embedding runtime profiles: chunks/s and agreement with fp32")
+    p_bench.add_argument("--repo", required=True, type=Path)
+    p_bench.add_argument("--sample", type=int, default=256, help="Chunks to embed per profile")
+    p_bench.add_argument(
+        "--profiles", default="throughput,int8",
+        help="Comma-separated EMBED_PROFILE names; the fp32 'default' baseline always runs first",
+    )
+    p_bench.add_argument("--out", type=Path, help="Also write results as JSON")
+
+    p_e2e = sub.add_parser("bench", help="Offline end-to-end benchmark on a synthetic Java/Kotlin/YAML repo")
+    p_e2e.add_argument("--chunks", type=int, default=10_000, help="Target repo size in chunks (1k..300k)")
+    p_e2e.add_argument("--incidents", type=int, default=50, help="Synthetic incidents used as queries")
+    p_e2e.add_argument("--queries", type=int, default=200, help="Timed retrieval queries per backend")
+    p_e2e.add_argument("--backends", default="qdrant,numpy", help="Comma-separated: qdrant, numpy")
+    p_e2e.add_argument("--dim", type=int, default=384, help="Dimension of the hashing embedder")
+    p_e2e.add_argument("--seed", type=int, default=0)
+    p_e2e.add_argument("--llm-calls", type=int, default=10, help="Timed analyze calls against the mock LLM (0 = skip)")
+    p_e2e.add_argument("--workdir", type=Path, help="Keep the generated repo, incidents.jsonl and index here (must be empty)")
+    p_e2e.add_argument("--out", type=Path, help="Write results as JSON")
+    p_e2e.add_argument("--baseline", type=Path, help="Earlier results JSON to compare against")
+
+    p_eval = sub.add_parser("eval", help="Recall@k / MRR vs latency over a retrieval parameter grid, with the Pareto frontier")
+    p_eval.add_argument(
+        "--index", required=True, type=Path, action="append",
+        help="Index directory; repeat to compare indexes built with other CHUNK_*/EMBED_REDUCE/EMBED_MODEL",
+    )
+    p_eval.add_argument(
+        "--incidents", required=True, type=Path,
+        help='Labelled incidents (*.json dir or .jsonl), each with "expected": ["path:line", ...]',
+    )
+    p_eval.add_argument("--backends", default="qdrant,numpy", help="Comma-separated: qdrant, numpy")
+    p_eval.add_argument("--topk", default="12", help="Comma-separated top_k values (recall@k uses the same k)")
+    p_eval.add_argument("--prefetch", default="20,40,80,160", help="Comma-separated prefetch_k values")
+    p_eval.add_argument("--max-per-file", default="2", help="Comma-separated max_per_file values")
+    p_eval.add_argument("--token-candidates", default="20", help="Comma-separated inverted-index candidate counts (0 = off)")
+    p_eval.add_argument(
+        "--rerank-budget-ms", default="0",
+        help="Comma-separated cross-encoder budgets (0 = heuristic rerank only)",
+    )
+    p_eval.add_argument("--rerank-top-n", type=int, default=None, help="Heuristic candidates passed to the cross-encoder")
+    p_eval.add_argument("--rescore", default="true", help="For EMBED_REDUCE indexes: true, false or true,false")
+    p_eval.add_argument("--repeat", type=int, default=1, help="Runs of the query set per configuration (latency only)")
+    p_eval.add_argument("--latency", default="p95_ms", choices=("p50_ms", "p95_ms", "p99_ms", "mean_ms"))
+    p_eval.add_argument("--objective", default="recall", choices=("recall", "mrr", "hit_rate"))
+    p_eval.add_argument("--out", type=Path, help="Write all configurations and the frontier as JSON")
 
     args = p.parse_args(argv)
+    if args.cmd in ("run", "analyze") and args.index is None and args.server is None:
+        p.error(f"{args.cmd}: --index is required unless --server is given")
+
+    profile_json = getattr(args, "profile", None)
+    prom_file = getattr(args, "prometheus_textfile", None)
+    if profile_json is None and prom_file is None:
+        return _dispatch(args)
+
+    prof = start_profiling()
+    try:
+        with span(args.cmd):
+            return _dispatch(args)
+    finally:
+        stop_profiling()
+        if profile_json is not None:
+            prof.write_json(profile_json, command=args.cmd)
+            log.info("Wrote profile: %s", profile_json)
+        if prom_file is not None:
+            prof.write_prometheus(prom_file, command=args.cmd)
 
+
+def _dispatch(args: argparse.Namespace) -> int:
     if args.cmd == "index":
-        return cmd_index(repo=args.repo, out_dir=args.out)
+        return cmd_index(repo=args.repo, out_dir=args.out, keep_generations=args.keep_generations)
+    if args.cmd == "run" and args.server:
+        return cmd_run_remote(
+            server=args.server,
+            incident_file=args.incident,
+            topk=args.topk,
+            prefetch=args.prefetch,
+            max_per_file=args.max_per_file,
+            rerank_budget_ms=args.rerank_budget_ms,
+            rerank_top_n=args.rerank_top_n,
+            logs=args.logs,
+            traces=args.traces,
+            metrics=args.metrics,
+        )
     if args.cmd == "run":
         return cmd_run(
             index_dir=args.index,
@@ -241,6 +1527,31 @@ def main(argv: List[str] | None = None) -> int:
             topk=args.topk,
             prefetch=args.prefetch,
             max_per_file=args.max_per_file,
+            rerank_budget_ms=args.rerank_budget_ms,
+            rerank_top_n=args.rerank_top_n,
+            logs=args.logs,
+            traces=args.traces,
+            metrics=args.metrics,
+        )
+    if args.cmd == "analyze" and args.server:
+        return cmd_analyze_remote(
+            server=args.server,
+            incident_file=args.incident,
+            out_report=args.out_report,
+            topk=args.topk,
+            prefetch=args.prefetch,
+            max_per_file=args.max_per_file,
+            max_context_chars=args.max_context_chars,
+            max_context_tokens=args.max_context_tokens,
+            minify=not args.no_minify,
+            logs=args.logs,
+            traces=args.traces,
+            metrics=args.metrics,
+            rerank_budget_ms=args.rerank_budget_ms,
+            rerank_top_n=args.rerank_top_n,
+            no_cache=args.no_cache,
+            map_reduce=args.map_reduce,
+            max_shards=args.max_shards,
         )
     if args.cmd == "analyze":
         return cmd_analyze(
@@ -251,6 +1562,81 @@ def main(argv: List[str] | None = None) -> int:
             prefetch=args.prefetch,
             max_per_file=args.max_per_file,
             max_context_chars=args.max_context_chars,
+            max_context_tokens=args.max_context_tokens,
+            minify=not args.no_minify,
+            logs=args.logs,
+            traces=args.traces,
+            metrics=args.metrics,
+            rerank_budget_ms=args.rerank_budget_ms,
+            rerank_top_n=args.rerank_top_n,
+            no_cache=args.no_cache,
+            map_reduce=args.map_reduce,
+            max_shards=args.max_shards,
+        )
+
+    if args.cmd == "analyze-batch":
+        return cmd_analyze_batch(
+            index_dir=args.index,
+            source=args.incidents,
+            out_dir=args.out_dir,
+            topk=args.topk,
+            prefetch=args.prefetch,
+            max_per_file=args.max_per_file,
+            max_context_chars=args.max_context_chars,
+            max_context_tokens=args.max_context_tokens,
+            minify=not args.no_minify,
+            rerank_budget_ms=args.rerank_budget_ms,
+            rerank_top_n=args.rerank_top_n,
+            concurrency=args.concurrency,
+            rpm=args.rpm,
+            retrieve_batch=args.retrieve_batch,
+            no_cache=args.no_cache,
+        )
+    if args.cmd == "serve":
+        return cmd_serve(
+            index_dir=args.index,
+            listen=args.listen,
+            embed_workers=args.embed_workers,
+            llm_concurrency=args.llm_concurrency,
+        )
+    if args.cmd == "bench-embed":
+        return cmd_bench_embed(
+            repo=args.repo,
+            sample=args.sample,
+            profiles=[s.strip() for s in args.profiles.split(",") if s.strip()],
+            out_json=args.out,
+        )
+    if args.cmd == "bench":
+        return cmd_bench(
+            chunks=args.chunks,
+            incidents=args.incidents,
+            queries=args.queries,
+            backends=[s.strip() for s in args.backends.split(",") if s.strip()],
+            dim=args.dim,
+            seed=args.seed,
+            llm_calls=args.llm_calls,
+            workdir=args.workdir,
+            out_json=args.out,
+            baseline=args.baseline,
+        )
+    if args.cmd == "eval":
+        return cmd_eval(
+            index_dirs=args.index,
+            incidents=args.incidents,
+            grid_args={
+                "backends": tuple(s.strip() for s in args.backends.split(",") if s.strip()),
+                "rescore": tuple(s.strip().lower() == "true" for s in args.rescore.split(",") if s.strip()),
+                "top_k": _int_list(args.topk),
+                "prefetch_k": _int_list(args.prefetch),
+                "max_per_file": _int_list(args.max_per_file),
+                "token_candidates_k": _int_list(args.token_candidates),
+                "rerank_budget_ms": tuple(float(x) for x in args.rerank_budget_ms.split(",") if x.strip()),
+                "rerank_top_n": args.rerank_top_n if args.rerank_top_n is not None else load_rerank_config().top_n,
+            },
+            repeat=max(1, args.repeat),
+            latency_key=args.latency,
+            quality_key=args.objective,
+            out_json=args.out,
         )
 
     return 2
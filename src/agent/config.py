@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import os
 
 
@@ -59,7 +59,193 @@ def load_embeddings_config() -> EmbeddingsConfig:
     )
 
 
+@dataclass(frozen=True)
+class EmbedRuntimeConfig:
+    """
+    ONNX Runtime settings for the embedding model. The "default" profile leaves fastembed's session untouched.
+    """
+
+    profile: str = "default"
+    threads: int | None = None              # intra-op; None — как решит fastembed/onnxruntime
+    inter_threads: int | None = None
+    providers: tuple[str, ...] = ()
+    cpu_affinity: tuple[int, ...] = ()      # ядра для процесса (Linux), потоки ORT их наследуют
+    graph_opt: str = "all"                  # disable | basic | extended | all
+    quantize: str = "none"                  # none | int8 (динамическая квантизация весов)
+
+    @property
+    def custom_session(self) -> bool:
+        # всё, кроме threads/providers, fastembed наружу не отдаёт: сессию пересоздаём сами
+        return self.inter_threads is not None or self.graph_opt != "all" or self.quantize != "none"
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def embed_profiles() -> dict[str, EmbedRuntimeConfig]:
+    n = _cpu_count()
+    return {
+        "default": EmbedRuntimeConfig(),
+        # индексация: все ядра на один батч, без параллелизма между узлами графа
+        "throughput": EmbedRuntimeConfig(profile="throughput", threads=n, inter_threads=1),
+        "int8": EmbedRuntimeConfig(profile="int8", threads=n, inter_threads=1, quantize="int8"),
+        # serve: короткие запросы, не отнимаем все ядра у SQLite/LLM-потоков
+        "latency": EmbedRuntimeConfig(profile="latency", threads=min(4, n), inter_threads=1),
+    }
+
+
+def parse_cpu_list(spec: str) -> tuple[int, ...]:
+    """
+    "0-3,8,10-11" -> (0, 1, 2, 3, 8, 10, 11)
+    """
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        cpus.update(range(int(lo), int(hi or lo) + 1))
+    return tuple(sorted(cpus))
+
+
+def load_embed_runtime_config(profile: str | None = None) -> EmbedRuntimeConfig:
+    """
+    EMBED_PROFILE (default | throughput | int8 | latency), then per-knob overrides from env.
+    """
+    name = (profile or os.getenv("EMBED_PROFILE", "default")).strip().lower()
+    profiles = embed_profiles()
+    if name not in profiles:
+        raise ValueError(f"unknown embedding profile {name!r} ({' | '.join(profiles)})")
+    cfg = profiles[name]
+    if os.getenv("EMBED_THREADS"):
+        cfg = replace(cfg, threads=int(os.environ["EMBED_THREADS"]))
+    if os.getenv("EMBED_INTER_THREADS"):
+        cfg = replace(cfg, inter_threads=int(os.environ["EMBED_INTER_THREADS"]))
+    if os.getenv("EMBED_PROVIDERS"):
+        cfg = replace(cfg, providers=tuple(p.strip() for p in os.environ["EMBED_PROVIDERS"].split(",") if p.strip()))
+    if os.getenv("EMBED_CPU_AFFINITY"):
+        cfg = replace(cfg, cpu_affinity=parse_cpu_list(os.environ["EMBED_CPU_AFFINITY"]))
+    if os.getenv("EMBED_GRAPH_OPT"):
+        cfg = replace(cfg, graph_opt=os.environ["EMBED_GRAPH_OPT"].strip().lower())
+    if os.getenv("EMBED_QUANTIZE"):
+        cfg = replace(cfg, quantize=os.environ["EMBED_QUANTIZE"].strip().lower())
+    return cfg
+
+
 def load_qdrant_config() -> QdrantConfig:
     local_path = os.getenv("QDRANT_LOCAL_PATH", "./data/qdrant_local")
     collection = os.getenv("QDRANT_COLLECTION", "repo_chunks")
     return QdrantConfig(local_path=local_path, collection=collection)
+
+
+@dataclass(frozen=True)
+class VectorStoreConfig:
+    # Чем отвечать на запросы: "qdrant" — Qdrant local (хранилище держит один процесс),
+    # "numpy" — read-only mmap-снимок поколения, читают сколько угодно процессов
+    backend: str
+
+
+def load_vector_store_config() -> VectorStoreConfig:
+    backend = os.getenv("VECTOR_BACKEND", "qdrant").strip().lower()
+    if backend not in ("qdrant", "numpy"):
+        raise ValueError(f"VECTOR_BACKEND must be qdrant or numpy, got {backend!r}")
+    return VectorStoreConfig(backend=backend)
+
+
+@dataclass(frozen=True)
+class ReductionConfig:
+    # "none" | "pca" (обучается при index на выборке векторов) | "truncate" (Matryoshka: только для моделей, обученных так)
+    method: str
+    dim: int
+    sample: int
+    # точный пересчёт prefetch-набора по полным векторам из снимка поколения
+    rescore: bool
+
+
+def load_reduction_config() -> ReductionConfig:
+    return ReductionConfig(
+        method=os.getenv("EMBED_REDUCE", "none").strip().lower(),
+        dim=int(os.getenv("EMBED_REDUCE_DIM", "256")),
+        sample=int(os.getenv("EMBED_REDUCE_SAMPLE", "20000")),
+        rescore=os.getenv("EMBED_REDUCE_RESCORE", "true").lower() == "true",
+    )
+
+
+@dataclass(frozen=True)
+class QueryCacheConfig:
+    # LRU по числу записей; 0 — кэш выключен
+    max_entries: int = 256
+
+
+def load_query_cache_config() -> QueryCacheConfig:
+    return QueryCacheConfig(
+        max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "256")),
+    )
+
+
+@dataclass(frozen=True)
+class RerankConfig:
+    # ONNX cross-encoder из каталога fastembed (TextCrossEncoder)
+    model_name: str
+    batch_size: int = 8
+    top_n: int = 30
+
+
+def load_rerank_config() -> RerankConfig:
+    return RerankConfig(
+        model_name=os.getenv("RERANK_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2"),
+        batch_size=int(os.getenv("RERANK_BATCH_SIZE", "8")),
+        top_n=int(os.getenv("RERANK_TOP_N", "30")),
+    )
+
+
+@dataclass(frozen=True)
+class LLMCacheConfig:
+    # кэш ответов LLM по хэшу промпта; max_entries=0 — выключен
+    path: str = "./data/llm_cache.sqlite"
+    ttl_hours: float = 168.0
+    max_entries: int = 512
+    max_mb: int = 256
+
+
+def load_llm_cache_config() -> LLMCacheConfig:
+    return LLMCacheConfig(
+        path=os.getenv("LLM_CACHE_PATH", "./data/llm_cache.sqlite"),
+        ttl_hours=float(os.getenv("LLM_CACHE_TTL_HOURS", "168")),
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+        max_mb=int(os.getenv("LLM_CACHE_MAX_MB", "256")),
+    )
+
+
+@dataclass(frozen=True)
+class IncidentCacheConfig:
+    # семантический кэш прошлых инцидентов (SQLite, общий для процессов); пустой path — выключен
+    path: str = "./data/incident_cache.sqlite"
+    threshold: float = 0.92
+    vector_weight: float = 0.7
+    max_entries: int = 5000
+
+
+def load_incident_cache_config() -> IncidentCacheConfig:
+    return IncidentCacheConfig(
+        path=os.getenv("INCIDENT_CACHE_PATH", "./data/incident_cache.sqlite"),
+        threshold=float(os.getenv("INCIDENT_CACHE_THRESHOLD", "0.92")),
+        vector_weight=float(os.getenv("INCIDENT_CACHE_VECTOR_WEIGHT", "0.7")),
+        max_entries=int(os.getenv("INCIDENT_CACHE_MAX_ENTRIES", "5000")),
+    )
+
+
+@dataclass(frozen=True)
+class ContextConfig:
+    # tokenizer.json или HF repo id для точного подсчёта токенов; None — приближённый подсчёт
+    tokenizer: str | None = None
+
+
+def load_context_config() -> ContextConfig:
+    return ContextConfig(
+        tokenizer=os.getenv("CONTEXT_TOKENIZER") or None,
+    )
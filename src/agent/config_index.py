@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from .signals import IncidentSignals
+
+
+# языки (см. indexer.CODE_EXT), из которых строим таблицу ключей; Helm values.yaml — это yaml
+CONFIG_LANGUAGES = {"yaml", "properties", "terraform"}
+
+# значения таких ключей не отправляем в LLM
+SECRET_KEY_RE = re.compile(r"(password|passwd|secret|token|credential|private[-_.]?key|api[-_.]?key)", re.IGNORECASE)
+MASKED_VALUE = "***"
+_MAX_VALUE_LEN = 200
+
+YAML_KEY_RE = re.compile(r"""^("[^"]*"|'[^']*'|[^\s#'"\-][^:#]*?|-[^\s:#][^:#]*?)\s*:(?:\s+(.*))?$""")
+YAML_BLOCK_SCALARS = {"|", ">", "|-", ">-", "|+", ">+"}
+PROPERTIES_RE = re.compile(r"^((?:\\.|[^=:\s\\])+)\s*(?:[=:]\s*|\s+)(.*)$")
+TF_BLOCK_RE = re.compile(r'^([A-Za-z_][\w-]*)((?:\s+"[^"]*"|\s+[A-Za-z_][\w-]*)*)\s*\{\s*$')
+TF_ASSIGN_RE = re.compile(r'^([A-Za-z_][\w-]*|"[^"]+")\s*=\s*(.*)$')
+TF_HEREDOC_RE = re.compile(r"<<-?\s*([A-Z_][A-Z0-9_]*)\s*$")
+QUOTED_VALUE_RE = re.compile(r"""^("(?:\\.|[^"\\])*"|'[^']*')\s*(?:(?:#|//).*)?$""")
+
+# части ключа: kebab/snake/dot + camelCase ("maximumPoolSize" -> maximum, pool, size)
+_TERM_SPLIT_RE = re.compile(r"[^A-Za-z0-9]+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+# ключевое слово инцидента (подстрока keyword/exception в lowercase) -> термины ключей конфигурации
+KEYWORD_TERMS: Dict[str, Tuple[str, ...]] = {
+    "timeout": ("timeout",),
+    "timed out": ("timeout",),
+    "latency": ("timeout",),
+    "p99": ("timeout",),
+    "p95": ("timeout",),
+    "hikari": ("hikari", "pool", "datasource"),
+    "connection is not available": ("hikari", "pool", "connection"),
+    "connection": ("connection", "pool"),
+    "psqlexception": ("datasource", "pool"),
+    "retry": ("retry", "retries", "attempts", "backoff"),
+    "retries": ("retry", "retries", "attempts", "backoff"),
+    "circuit": ("circuit", "breaker", "resilience4j"),
+    "throttle": ("throttle", "rate", "limit"),
+    "rate limit": ("rate", "limit", "ratelimiter"),
+    "oom": ("memory", "heap", "xmx", "limits"),
+    "outofmemory": ("memory", "heap", "xmx", "limits"),
+    "gc": ("gc", "heap", "memory"),
+    "pause": ("gc",),
+    "deadlock": ("lock", "isolation"),
+    "lock": ("lock",),
+}
+
+
+@dataclass(frozen=True)
+class ConfigEntry:
+    key: str        # "spring.datasource.hikari.maximum-pool-size"
+    value: str
+    line: int       # 1-based
+
+
+@dataclass(frozen=True)
+class ConfigFact:
+    key: str
+    value: str
+    path: str
+    line: int
+    matched: int    # сколько терминов запроса совпало с ключом
+
+
+def _unquote(s: str) -> str:
+    s = s.strip()
+    if len(s) >= 2 and s[0] == s[-1] and s[0] in "\"'":
+        return s[1:-1]
+    return s
+
+
+def _strip_trailing_comment(value: str, markers: Tuple[str, ...] = (" #",)) -> str:
+    if value[:1] in "\"'":
+        m = QUOTED_VALUE_RE.match(value)
+        return m.group(1) if m else value
+    for m in markers:
+        i = value.find(m)
+        if i >= 0:
+            value = value[:i]
+    return value.strip()
+
+
+def _entry(key: str, value: str, line: int) -> ConfigEntry:
+    value = value.strip()
+    if SECRET_KEY_RE.search(key) and value:
+        value = MASKED_VALUE
+    return ConfigEntry(key=key, value=value[:_MAX_VALUE_LEN], line=line)
+
+
+def flatten_yaml(lines: List[str]) -> List[ConfigEntry]:
+    """
+    Line-based YAML flattener (application.yml, Helm values.yaml, k8s manifests): nested maps become
+    dotted paths, list items become [i]. Anchors/flow collections are kept as literal values.
+    """
+    out: List[ConfigEntry] = []
+    stack: List[Tuple[int, str]] = []           # (indent, segment)
+    list_counters: Dict[str, int] = {}
+    block_indent: Optional[int] = None
+
+    def path(extra: str) -> str:
+        segs = [s for _, s in stack] + [extra]
+        return ".".join(segs).replace(".[", "[")
+
+    for no, raw in enumerate(lines, start=1):
+        line = raw.rstrip()
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+
+        if block_indent is not None:
+            if not stripped or indent > block_indent:
+                continue
+            block_indent = None
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped in ("---", "..."):
+            stack.clear()
+            list_counters.clear()
+            continue
+
+        if stripped == "-" or stripped.startswith("- "):
+            while stack and (stack[-1][0] > indent or (stack[-1][0] == indent and stack[-1][1].startswith("["))):
+                stack.pop()
+            parent = path("")
+            i = list_counters.get(parent, 0)
+            list_counters[parent] = i + 1
+            stack.append((indent, f"[{i}]"))
+            rest = stripped[1:].lstrip()
+            indent += len(stripped) - len(rest)
+            stripped = rest
+            if not stripped or stripped.startswith("#"):
+                continue
+            if not YAML_KEY_RE.match(stripped):
+                seg = stack.pop()[1]
+                out.append(_entry(path(seg), _unquote(_strip_trailing_comment(stripped)), no))
+                continue
+
+        m = YAML_KEY_RE.match(stripped)
+        if not m:
+            continue
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        key = _unquote(m.group(1))
+        value = _strip_trailing_comment(m.group(2) or "")
+        if not value:
+            stack.append((indent, key))
+            continue
+        if value in YAML_BLOCK_SCALARS:
+            block_indent = indent
+        out.append(_entry(path(key), _unquote(value), no))
+    return _mask_env_secrets(out)
+
+
+def _mask_env_secrets(entries: List[ConfigEntry]) -> List[ConfigEntry]:
+    """
+    k8s `env: [{name: DB_PASSWORD, value: ...}]`: the secret is in the sibling name, not in the key path.
+    """
+    secret_items = {
+        e.key[: -len(".name")] for e in entries
+        if e.key.endswith("].name") and SECRET_KEY_RE.search(e.value)
+    }
+    if not secret_items:
+        return entries
+    return [
+        replace(e, value=MASKED_VALUE) if e.key.endswith("].value") and e.key[: -len(".value")] in secret_items else e
+        for e in entries
+    ]
+
+
+def flatten_properties(lines: List[str]) -> List[ConfigEntry]:
+    out: List[ConfigEntry] = []
+    i = 0
+    while i < len(lines):
+        no = i + 1
+        s = lines[i].strip()
+        # продолжение значения: строка заканчивается на "\"
+        while s.endswith("\\") and i + 1 < len(lines):
+            i += 1
+            s = s[:-1] + lines[i].strip()
+        i += 1
+        if not s or s[0] in "#!":
+            continue
+        m = PROPERTIES_RE.match(s)
+        if m:
+            out.append(_entry(m.group(1).replace("\\", ""), m.group(2), no))
+    return out
+
+
+def flatten_terraform(lines: List[str]) -> List[ConfigEntry]:
+    """
+    HCL blocks (`resource "aws_db_instance" "main" {`) and nested maps become dotted paths.
+    Multi-line lists and heredocs are recorded on their first line and skipped.
+    """
+    out: List[ConfigEntry] = []
+    stack: List[str] = []
+    heredoc: Optional[str] = None
+    list_depth = 0
+    in_comment = False
+
+    for no, raw in enumerate(lines, start=1):
+        s = raw.strip()
+        if heredoc is not None:
+            if s == heredoc:
+                heredoc = None
+            continue
+        if in_comment:
+            if "*/" in s:
+                in_comment = False
+            continue
+        if list_depth:
+            list_depth += s.count("[") - s.count("]")
+            continue
+        if not s or s.startswith(("#", "//")):
+            continue
+        if s.startswith("/*"):
+            in_comment = "*/" not in s
+            continue
+
+        if s.startswith("}"):
+            if stack:
+                stack.pop()
+            continue
+
+        m = TF_BLOCK_RE.match(s)
+        if m:
+            labels = [_unquote(x) for x in re.findall(r'"[^"]*"|[A-Za-z_][\w-]*', m.group(2) or "")]
+            stack.append(".".join([m.group(1)] + labels))
+            continue
+
+        m = TF_ASSIGN_RE.match(s)
+        if not m:
+            continue
+        key = ".".join(stack + [_unquote(m.group(1))])
+        value = _strip_trailing_comment(m.group(2), (" #", " //"))
+        if value == "{":
+            stack.append(_unquote(m.group(1)))
+            continue
+        hd = TF_HEREDOC_RE.search(value)
+        if hd:
+            heredoc = hd.group(1)
+        elif value.count("[") > value.count("]"):
+            list_depth = value.count("[") - value.count("]")
+        out.append(_entry(key, _unquote(value), no))
+    return out
+
+
+FLATTENERS: Dict[str, Callable[[List[str]], List[ConfigEntry]]] = {
+    "yaml": flatten_yaml,
+    "properties": flatten_properties,
+    "terraform": flatten_terraform,
+}
+
+
+def flatten_config(*, text_lines: List[str], language: str) -> List[ConfigEntry]:
+    fn = FLATTENERS.get(language)
+    return fn(text_lines) if fn is not None else []
+
+
+def key_terms(key: str) -> Set[str]:
+    terms: Set[str] = set()
+    for part in _TERM_SPLIT_RE.split(key):
+        if not part:
+            continue
+        terms.add(part.lower())
+        for sub in _CAMEL_RE.findall(part):
+            terms.add(sub.lower())
+    return {t for t in terms if not t.isdigit()}
+
+
+def query_terms(signals: IncidentSignals) -> Set[str]:
+    """
+    Config-key terms implied by incident keywords and exception names (SocketTimeoutException -> timeout).
+    """
+    haystack = [k.lower() for k in signals.keywords] + [e.lower() for e in signals.exceptions]
+    terms: Set[str] = set()
+    for trigger, mapped in KEYWORD_TERMS.items():
+        if any(trigger in h for h in haystack):
+            terms.update(mapped)
+    return terms
+
+
+def facts_cover(facts: Iterable[ConfigFact], *, path: str, start_line: int, text: str, language: str) -> bool:
+    """
+    True when every key line of a config chunk is among the facts: then the chunk adds nothing to them.
+    A chunk with any other key (the rest of a pool block, say) is not covered.
+    """
+    key_lines = {start_line + e.line - 1 for e in flatten_config(text_lines=text.splitlines(), language=language)}
+    if not key_lines:
+        return False
+    return key_lines <= {f.line for f in facts if f.path == path}
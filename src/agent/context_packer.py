@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import math
+import re
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol
+
+from .analyzer import ContextItem
+
+
+class TokenCounter(Protocol):
+    def count(self, text: str) -> int: ...
+
+
+# слова латиницей/кириллицей, группы цифр, прочие символы; пробелы не считаем, переводы строк — считаем
+_APPROX_TOKEN_RE = re.compile(r"[A-Za-z]+|[А-Яа-яЁё]+|\d+|\n|[^\sA-Za-zА-Яа-яЁё\d]")
+
+
+@dataclass(frozen=True)
+class ApproxTokenCounter:
+    """
+    BPE-like estimate without a tokenizer: ~4 latin chars / ~3 cyrillic chars / 3 digits per token,
+    one token per punctuation char and per newline.
+    """
+
+    def count(self, text: str) -> int:
+        n = 0
+        for m in _APPROX_TOKEN_RE.finditer(text):
+            s = m.group(0)
+            c = s[0]
+            if c.isascii() and c.isalpha():
+                n += math.ceil(len(s) / 4)
+            elif c.isalpha():
+                n += math.ceil(len(s) / 3)
+            elif c.isdigit():
+                n += math.ceil(len(s) / 3)
+            else:
+                n += 1
+        return n
+
+
+@dataclass
+class HFTokenCounter:
+    """
+    Exact counts with a HuggingFace `tokenizers` tokenizer (installed with fastembed).
+    """
+
+    name: str
+    _tok: Any = None
+
+    def count(self, text: str) -> int:
+        if self._tok is None:
+            from tokenizers import Tokenizer  # импортируем лениво
+            p = Path(self.name)
+            self._tok = Tokenizer.from_file(str(p)) if p.exists() else Tokenizer.from_pretrained(self.name)
+        return len(self._tok.encode(text, add_special_tokens=False).ids)
+
+
+def load_token_counter(tokenizer: Optional[str]) -> TokenCounter:
+    if tokenizer:
+        return HFTokenCounter(name=tokenizer)
+    return ApproxTokenCounter()
+
+
+def merge_contexts(items: List[ContextItem]) -> List[ContextItem]:
+    """
+    Merge overlapping or adjacent line ranges from the same file into one item (max of the scores),
+    so overlap lines are not sent twice. Output keeps the score order of the best member.
+    """
+    by_path: Dict[str, List[ContextItem]] = {}
+    for it in items:
+        by_path.setdefault(it.path, []).append(it)
+
+    merged: List[ContextItem] = []
+    for group in by_path.values():
+        group.sort(key=lambda c: c.start_line)
+        cur = group[0]
+        for nxt in group[1:]:
+            if nxt.start_line > cur.end_line + 1:
+                merged.append(cur)
+                cur = nxt
+                continue
+            if nxt.end_line > cur.end_line:
+                nxt_lines = nxt.text.split("\n")
+                tail = nxt_lines[cur.end_line - nxt.start_line + 1:]
+                cur = replace(cur, end_line=nxt.end_line, text="\n".join([cur.text, *tail]))
+            cur = replace(cur, score=max(cur.score, nxt.score), base=max(cur.base, nxt.base), rr=max(cur.rr, nxt.rr))
+        merged.append(cur)
+
+    merged.sort(key=lambda c: c.score, reverse=True)
+    return merged
+
+
+@dataclass
+class PackResult:
+    items: List[ContextItem]
+    tokens: int
+    chars: int
+    dropped: List[ContextItem] = field(default_factory=list)
+
+
+def _value(it: ContextItem) -> float:
+    # score может быть отрицательным (path_penalty); пустые по ценности тоже берём, если есть место
+    return max(it.score, 0.0) + 1e-3
+
+
+def pack_contexts(
+    items: List[ContextItem],
+    *,
+    max_tokens: int,
+    counter: TokenCounter,
+    max_chars: Optional[int] = None,
+) -> PackResult:
+    """
+    Knapsack-style packing: greedy by score density (score per token), compared with the best single
+    item that fits (the usual 1/2-approximation guard). Items that do not fit are reported, not hidden.
+    """
+    tokens = [counter.count(it.text) for it in items]
+    fits = [
+        i for i in range(len(items))
+        if tokens[i] <= max_tokens and (max_chars is None or len(items[i].text) <= max_chars)
+    ]
+
+    greedy: List[int] = []
+    used_t = used_c = 0
+    for i in sorted(fits, key=lambda i: _value(items[i]) / max(tokens[i], 1), reverse=True):
+        if used_t + tokens[i] > max_tokens:
+            continue
+        if max_chars is not None and used_c + len(items[i].text) > max_chars:
+            continue
+        greedy.append(i)
+        used_t += tokens[i]
+        used_c += len(items[i].text)
+
+    chosen = greedy
+    if fits:
+        best = max(fits, key=lambda i: _value(items[i]))
+        if _value(items[best]) > sum(_value(items[i]) for i in greedy):
+            chosen = [best]
+
+    chosen_set = set(chosen)
+    packed = sorted((items[i] for i in chosen), key=lambda c: c.score, reverse=True)
+    return PackResult(
+        items=packed,
+        tokens=sum(tokens[i] for i in chosen),
+        chars=sum(len(items[i].text) for i in chosen),
+        dropped=[items[i] for i in range(len(items)) if i not in chosen_set],
+    )
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from .config import embed_profiles, load_embed_runtime_config
+from .embeddings_fastembed import FastEmbedProvider
+
+
+log = logging.getLogger("agent")
+
+
+@dataclass(frozen=True)
+class EmbedBenchResult:
+    profile: str
+    chunks: int
+    load_s: float
+    elapsed_s: float
+    chunks_per_s: float
+    # косинус с fp32-векторами профиля "default" для тех же чанков
+    cos_mean: Optional[float]
+    cos_min: Optional[float]
+
+
+def _normalized(vectors: List[List[float]]) -> np.ndarray:
+    a = np.asarray(vectors, dtype=np.float32)
+    return a / (np.linalg.norm(a, axis=1, keepdims=True) + 1e-12)
+
+
+def bench_embed_profiles(
+    texts: List[str],
+    *,
+    model_name: str,
+    batch_size: int,
+    profiles: List[str],
+) -> List[EmbedBenchResult]:
+    """
+    Embeds the same texts with each runtime profile (one warm-up batch excluded from timing; EMBED_* env
+    overrides apply). Plain fastembed fp32 ("default", no overrides) always runs first as the baseline
+    for vector agreement.
+    """
+    # неизвестный профиль — ошибка до долгих прогонов
+    cfgs = [embed_profiles()["default"]] + [load_embed_runtime_config(p) for p in profiles if p != "default"]
+    affinity = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else None
+
+    baseline: Optional[np.ndarray] = None
+    results: List[EmbedBenchResult] = []
+    for cfg in cfgs:
+        try:
+            t0 = time.perf_counter()
+            embedder = FastEmbedProvider(model_name=model_name, batch_size=batch_size, runtime=cfg)
+            embedder.embed_texts(texts[:batch_size])
+            load_s = time.perf_counter() - t0
+
+            t1 = time.perf_counter()
+            vecs = _normalized(embedder.embed_texts(texts))
+            elapsed = time.perf_counter() - t1
+        finally:
+            if affinity is not None:
+                os.sched_setaffinity(0, affinity)      # affinity профиля не должна влиять на следующий
+
+        cos_mean = cos_min = None
+        if baseline is None:
+            baseline = vecs
+        else:
+            cos = np.einsum("ij,ij->i", baseline, vecs)
+            cos_mean, cos_min = round(float(cos.mean()), 5), round(float(cos.min()), 5)
+        results.append(EmbedBenchResult(
+            profile=cfg.profile,
+            chunks=len(texts),
+            load_s=round(load_s, 2),
+            elapsed_s=round(elapsed, 2),
+            chunks_per_s=round(len(texts) / max(elapsed, 1e-9), 1),
+            cos_mean=cos_mean,
+            cos_min=cos_min,
+        ))
+        log.info("bench-embed %s: %.1f chunks/s", cfg.profile, results[-1].chunks_per_s)
+    return results
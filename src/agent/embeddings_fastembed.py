@@ -1,39 +1,161 @@
 from __future__ import annotations
 
+import logging
+import os
 from dataclasses import dataclass
-from typing import List, Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, List, Optional
 
-import numpy as np
-from fastembed import TextEmbedding
+from .config import EmbedRuntimeConfig
+
+if TYPE_CHECKING:
+    from fastembed import TextEmbedding
+
+
+log = logging.getLogger("agent")
+
+_GRAPH_OPT_LEVELS = {
+    "disable": "ORT_DISABLE_ALL",
+    "basic": "ORT_ENABLE_BASIC",
+    "extended": "ORT_ENABLE_EXTENDED",
+    "all": "ORT_ENABLE_ALL",
+}
+
+
+def set_cpu_affinity(cpus: tuple[int, ...]) -> None:
+    if not cpus:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        log.warning("CPU affinity is not supported on this platform; ignoring EMBED_CPU_AFFINITY")
+        return
+    os.sched_setaffinity(0, cpus)
+
+
+def quantized_model_path(path: Path) -> Path:
+    """
+    int8 dynamic quantization of the ONNX weights (MatMul/Gather), cached next to the fp32 file.
+    """
+    out = path.with_name(path.stem + ".int8.onnx")
+    if out.exists():
+        return out
+    try:
+        from onnxruntime.quantization import QuantType, quantize_dynamic  # импортируем лениво
+    except ImportError as e:
+        raise RuntimeError("EMBED_QUANTIZE=int8 needs the onnx package (pip install onnx)") from e
+
+    log.info("Quantizing %s -> %s (int8, one-time)", path, out)
+    tmp = out.with_name(f"{out.stem}.{os.getpid()}.tmp.onnx")
+    quantize_dynamic(str(path), str(tmp), weight_type=QuantType.QInt8)
+    os.replace(tmp, out)
+    return out
+
+
+def _install_session(model: Any, rt: EmbedRuntimeConfig) -> None:
+    # fastembed не даёт передать SessionOptions: берём путь к его ONNX-файлу и подменяем сессию.
+    # Токенизатор и постобработка остаются от fastembed.
+    import onnxruntime as ort
+
+    inner = getattr(model, "model", None)
+    model_dir = getattr(inner, "_model_dir", None)
+    desc = getattr(inner, "model_description", None)
+    model_file = desc.get("model_file") if isinstance(desc, dict) else getattr(desc, "model_file", None)
+    if rt.quantize not in ("none", "int8"):
+        raise ValueError(f"unknown EMBED_QUANTIZE {rt.quantize!r} (none | int8)")
+    if rt.graph_opt not in _GRAPH_OPT_LEVELS:
+        raise ValueError(f"unknown EMBED_GRAPH_OPT {rt.graph_opt!r} ({' | '.join(_GRAPH_OPT_LEVELS)})")
+    if inner is None or model_dir is None or not model_file or not hasattr(inner, "model"):
+        # int8/graph_opt меняют сами векторы и скорость: молча считать fp32 под их именем нельзя
+        requested = [
+            s for s, on in (
+                (f"EMBED_QUANTIZE={rt.quantize}", rt.quantize != "none"),
+                (f"EMBED_GRAPH_OPT={rt.graph_opt}", rt.graph_opt != "all"),
+            ) if on
+        ]
+        if requested:
+            raise RuntimeError(
+                f"profile {rt.profile}: {', '.join(requested)} needs a custom session, "
+                "but this fastembed version's internals are not recognized"
+            )
+        log.warning("fastembed internals not recognized; profile %s runs without inter-op thread settings", rt.profile)
+        return
+
+    path = Path(model_dir) / model_file
+    if rt.quantize == "int8":
+        path = quantized_model_path(path)
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = getattr(ort.GraphOptimizationLevel, _GRAPH_OPT_LEVELS[rt.graph_opt])
+    if rt.threads:
+        so.intra_op_num_threads = rt.threads
+    if rt.inter_threads:
+        so.inter_op_num_threads = rt.inter_threads
+    providers = list(rt.providers) or ["CPUExecutionProvider"]
+    inner.model = ort.InferenceSession(str(path), sess_options=so, providers=providers)
 
 
 @dataclass
 class FastEmbedProvider:
     """
     FastEmbed embeddings via ONNX Runtime (no PyTorch).
+    `runtime` selects threads / providers / CPU affinity / graph optimization / int8 weights (EMBED_PROFILE).
     """
 
     model_name: str
     batch_size: int = 256
+    # размерность из index_meta.json: dim() тогда не трогает модель
+    known_dim: Optional[int] = None
+    runtime: Optional[EmbedRuntimeConfig] = None
 
     _model: Optional[TextEmbedding] = None
     _dim: Optional[int] = None
 
-    def __post_init__(self) -> None:
-        self._model = TextEmbedding(model_name=self.model_name)
+    def _ensure_model(self) -> TextEmbedding:
+        # модель грузим при первом embed: на cache hit она не нужна
+        if self._model is None:
+            from fastembed import TextEmbedding  # импортируем лениво: onnxruntime + tokenizers — сотни мс
+
+            rt = self.runtime or EmbedRuntimeConfig()
+            set_cpu_affinity(rt.cpu_affinity)
+            kwargs: dict[str, Any] = {}
+            if rt.threads:
+                kwargs["threads"] = rt.threads
+            if rt.providers:
+                kwargs["providers"] = list(rt.providers)
+            model = TextEmbedding(model_name=self.model_name, **kwargs)
+            if rt.custom_session:
+                _install_session(model, rt)
+            log.info(
+                "Embedding model %s loaded (profile=%s, threads=%s/%s, graph_opt=%s, quantize=%s)",
+                self.model_name, rt.profile, rt.threads or "auto", rt.inter_threads or "auto", rt.graph_opt, rt.quantize,
+            )
+            self._model = model
+        return self._model
 
     def dim(self) -> int:
+        """
+        Known dim, else the model's registry entry in fastembed, else one probe inference (custom models).
+        """
         if self._dim is not None:
             return self._dim
+        if self.known_dim:
+            self._dim = int(self.known_dim)
+            return self._dim
+        from fastembed import TextEmbedding
+
+        for m in TextEmbedding.list_supported_models():
+            if str(m.get("model", "")).lower() == self.model_name.lower() and m.get("dim"):
+                self._dim = int(m["dim"])
+                return self._dim
         v = self.embed_texts(["ping"])
         self._dim = len(v[0])
         return self._dim
 
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
-        if self._model is None:
-            raise RuntimeError("FastEmbed model is not initialized")
+        import numpy as np
+
+        model = self._ensure_model()
 
         out: List[List[float]] = []
-        for vec in self._model.embed(texts, batch_size=self.batch_size):
+        for vec in model.embed(texts, batch_size=self.batch_size):
             out.append(np.asarray(vec, dtype=np.float32).tolist())
         return out
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import re
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .batch import iter_incidents
+from .bench import latency_summary
+from .reranker_onnx import CrossEncoderReranker
+from .retriever import EmbeddingsProvider, RetrievedChunk, embed_queries, incident_to_query_text, retrieve_topk
+from .store_sqlite import SQLiteStore
+from .vectordb_qdrant import VectorIndex
+
+
+log = logging.getLogger("agent")
+
+# "src/main/java/.../PaymentService.java:143", ":120-180" — диапазон, без номера — весь файл
+_EVIDENCE_RE = re.compile(r"^(?P<path>.+?)(?::(?P<start>\d+)(?:-(?P<end>\d+))?)?$")
+
+# запросов под tracemalloc на точку: он замедляет Python в разы, поэтому латентность меряется отдельно
+_MEMORY_QUERIES = 10
+
+
+@dataclass(frozen=True)
+class Evidence:
+    path: str
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+
+    def covered_by(self, r: RetrievedChunk) -> bool:
+        c = r.chunk
+        # путь из метки может быть короче пути в индексе (без модуля/префикса)
+        if c.path != self.path and not c.path.endswith("/" + self.path):
+            return False
+        if self.start_line is None:
+            return True
+        end = self.end_line if self.end_line is not None else self.start_line
+        return c.start_line <= end and self.start_line <= c.end_line
+
+
+def parse_evidence(raw: Any) -> Evidence:
+    """
+    "path", "path:line", "path:start-end", or {"path": ..., "line": ...} / {"path", "start_line", "end_line"}.
+    """
+    if isinstance(raw, dict):
+        start = raw.get("line", raw.get("start_line"))
+        end = raw.get("end_line", start)
+        path = str(raw["path"])
+    else:
+        m = _EVIDENCE_RE.match(str(raw).strip())
+        if m is None:
+            raise ValueError(f"bad evidence {raw!r}")
+        path, start, end = m.group("path"), m.group("start"), m.group("end") or m.group("start")
+    path = path.replace("\\", "/")
+    if path.startswith("./"):
+        path = path[2:]
+    return Evidence(
+        path=path,
+        start_line=int(start) if start is not None else None,
+        end_line=int(end) if end is not None else None,
+    )
+
+
+@dataclass(frozen=True)
+class LabelledIncident:
+    name: str
+    incident: Dict[str, Any]
+    expected: Tuple[Evidence, ...]
+
+
+def load_labelled_incidents(source: Path) -> List[LabelledIncident]:
+    """
+    Incidents (a directory of *.json or a .jsonl, as for analyze-batch) with an "expected" list of
+    evidence locations; `agent bench --workdir` writes such a file (incidents.jsonl).
+    """
+    out: List[LabelledIncident] = []
+    for name, incident in iter_incidents(source):
+        raw = incident.get("expected") or []
+        if not raw:
+            log.warning("eval: incident %s has no \"expected\" evidence, skipped", name)
+            continue
+        try:
+            expected = tuple(parse_evidence(e) for e in (raw if isinstance(raw, list) else [raw]))
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning("eval: incident %s has bad \"expected\" evidence (%s), skipped", name, e)
+            continue
+        out.append(LabelledIncident(name=name, incident=incident, expected=expected))
+    return out
+
+
+def score_ranking(results: List[RetrievedChunk], expected: Sequence[Evidence]) -> Tuple[float, float]:
+    """
+    (recall, reciprocal rank): share of evidence locations covered by the results, 1/rank of the first
+    result that covers any of them (0 when none does).
+    """
+    covered = sum(1 for e in expected if any(e.covered_by(r) for r in results))
+    rr = 0.0
+    for rank, r in enumerate(results, start=1):
+        if any(e.covered_by(r) for e in expected):
+            rr = 1.0 / rank
+            break
+    return covered / len(expected), rr
+
+
+@dataclass(frozen=True)
+class SweepGrid:
+    backends: Tuple[str, ...] = ("qdrant", "numpy")
+    rescore: Tuple[bool, ...] = (True,)
+    top_k: Tuple[int, ...] = (12,)
+    prefetch_k: Tuple[int, ...] = (20, 40, 80, 160)
+    max_per_file: Tuple[int, ...] = (2,)
+    token_candidates_k: Tuple[int, ...] = (20,)
+    rerank_budget_ms: Tuple[float, ...] = (0.0,)
+    rerank_top_n: int = 30
+
+
+@dataclass
+class EvalPoint:
+    index: str
+    params: Dict[str, Any]
+    queries: int
+    recall: float
+    mrr: float
+    hit_rate: float
+    latency: Dict[str, float]
+    peak_alloc_kb: Optional[float]
+    backend_rss_mb: Optional[float]
+    misses: List[str] = field(default_factory=list)
+    pareto: bool = False
+
+    def as_json(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+def current_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+
+
+def _run_point(
+    labelled: List[LabelledIncident],
+    vectors: List[List[float]],
+    *,
+    vectordb: VectorIndex,
+    store: SQLiteStore,
+    embedder: EmbeddingsProvider,
+    reranker: Optional[CrossEncoderReranker],
+    params: Dict[str, Any],
+    repeat: int,
+) -> Tuple[float, float, float, List[str], List[float], Optional[float]]:
+    def query(i: int) -> List[RetrievedChunk]:
+        return retrieve_topk(
+            vectordb=vectordb,
+            store=store,
+            embedder=embedder,
+            incident=labelled[i].incident,
+            top_k=params["top_k"],
+            prefetch_k=params["prefetch_k"],
+            max_per_file=params["max_per_file"],
+            token_candidates_k=params["token_candidates_k"],
+            reranker=reranker if params["rerank_budget_ms"] > 0 else None,
+            rerank_top_n=params["rerank_top_n"],
+            rerank_budget_ms=params["rerank_budget_ms"],
+            query_vector=vectors[i],
+        )
+
+    recall = mrr = hits = 0.0
+    misses: List[str] = []
+    ms: List[float] = []
+    for rep in range(repeat):
+        for i, li in enumerate(labelled):
+            t0 = time.perf_counter()
+            results = query(i)
+            ms.append((time.perf_counter() - t0) * 1000.0)
+            if rep:
+                continue
+            r, rr = score_ranking(results, li.expected)
+            recall += r
+            mrr += rr
+            hits += 1.0 if r > 0 else 0.0
+            if r == 0:
+                misses.append(li.name)
+
+    tracemalloc.start()
+    peak = 0
+    try:
+        for i in range(min(_MEMORY_QUERIES, len(labelled))):
+            tracemalloc.reset_peak()
+            query(i)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+    n = len(labelled)
+    return recall / n, mrr / n, hits / n, misses, ms, round(peak / 1024.0, 1)
+
+
+def sweep_index(
+    index_label: str,
+    labelled: List[LabelledIncident],
+    *,
+    store: SQLiteStore,
+    embedder: EmbeddingsProvider,
+    open_vectordb: Callable[[str, bool], VectorIndex],
+    reduced: bool,
+    grid: SweepGrid,
+    reranker: Optional[CrossEncoderReranker] = None,
+    repeat: int = 1,
+) -> List[EvalPoint]:
+    """
+    Every combination of the grid on one index. Query vectors are embedded once up front, so latency is
+    retrieve_topk alone (vector search, candidate generation, chunk fetch, rerank); no caches.
+    `rescore` only varies for indexes built with EMBED_REDUCE.
+    """
+    t0 = time.perf_counter()
+    vectors = embed_queries(embedder, [incident_to_query_text(li.incident) for li in labelled])
+    log.info("eval %s: embedded %d queries in %.1fs", index_label, len(vectors), time.perf_counter() - t0)
+
+    points: List[EvalPoint] = []
+    for backend in grid.backends:
+        for rescore in (grid.rescore if reduced else (True,)):
+            rss0 = current_rss_mb()
+            vectordb = open_vectordb(backend, rescore)
+            try:
+                # прогрев: первый запрос загружает коллекцию/страницы снимка
+                retrieve_topk(
+                    vectordb=vectordb, store=store, embedder=embedder, incident=labelled[0].incident,
+                    query_vector=vectors[0],
+                )
+                rss1 = current_rss_mb()
+                backend_rss = round(rss1 - rss0, 1) if rss0 is not None and rss1 is not None else None
+                for top_k, prefetch, mpf, tck, budget in itertools.product(
+                    grid.top_k, grid.prefetch_k, grid.max_per_file, grid.token_candidates_k, grid.rerank_budget_ms,
+                ):
+                    params: Dict[str, Any] = {
+                        "backend": backend,
+                        "top_k": top_k,
+                        "prefetch_k": max(prefetch, top_k),
+                        "max_per_file": mpf,
+                        "token_candidates_k": tck,
+                        "rerank_budget_ms": budget,
+                        "rerank_top_n": grid.rerank_top_n,
+                    }
+                    if reduced:
+                        params["rescore"] = rescore
+                    recall, mrr, hit_rate, misses, ms, peak_kb = _run_point(
+                        labelled, vectors, vectordb=vectordb, store=store, embedder=embedder,
+                        reranker=reranker, params=params, repeat=repeat,
+                    )
+                    points.append(EvalPoint(
+                        index=index_label,
+                        params=params,
+                        queries=len(labelled),
+                        recall=round(recall, 4),
+                        mrr=round(mrr, 4),
+                        hit_rate=round(hit_rate, 4),
+                        latency=latency_summary(ms),
+                        peak_alloc_kb=peak_kb,
+                        backend_rss_mb=backend_rss,
+                        misses=misses,
+                    ))
+                    log.info(
+                        "eval %s %s: recall@%d=%.3f mrr=%.3f p95=%.1fms",
+                        index_label, params, top_k, recall, mrr, points[-1].latency.get("p95_ms", 0.0),
+                    )
+            finally:
+                vectordb.close()
+    return points
+
+
+def mark_pareto(points: List[EvalPoint], *, latency: str = "p95_ms", quality: str = "recall") -> List[EvalPoint]:
+    """
+    Marks points not dominated on (lower latency, higher quality); returns the frontier by latency.
+    """
+    def lat(p: EvalPoint) -> float:
+        return float(p.latency.get(latency, float("inf")))
+
+    def q(p: EvalPoint) -> float:
+        return float(getattr(p, quality))
+
+    for p in points:
+        p.pareto = not any(
+            lat(o) <= lat(p) and q(o) >= q(p) and (lat(o) < lat(p) or q(o) > q(p)) for o in points if o is not p
+        )
+    return sorted((p for p in points if p.pareto), key=lat)
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .store_sqlite import SQLiteStore
+from .vectordb_qdrant import VectorIndex
+
+
+log = logging.getLogger("agent")
+
+CURRENT_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+
+
+@dataclass(frozen=True)
+class IndexGeneration:
+    """
+    One immutable build of an index: payload.sqlite, its own Qdrant local storage, the read-only
+    vector snapshot (vectors/), index_meta.json and, with EMBED_REDUCE, projection.npz in generations/<id>/. Queries read the generation named in <index_dir>/CURRENT.
+    A legacy index (files directly in index_dir) is a generation with id "legacy".
+    """
+
+    id: str
+    root: Path
+    qdrant_path: Path
+
+    @property
+    def payload_path(self) -> Path:
+        return self.root / "payload.sqlite"
+
+    @property
+    def snapshot_path(self) -> Path:
+        return self.root / "vectors"
+
+    @property
+    def projection_path(self) -> Path:
+        return self.root / "projection.npz"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.root / "index_meta.json"
+
+    def meta(self) -> Dict[str, Any]:
+        try:
+            return json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+
+def _generation(index_dir: Path, gen_id: str) -> IndexGeneration:
+    root = index_dir / GENERATIONS_DIR / gen_id
+    return IndexGeneration(id=gen_id, root=root, qdrant_path=root / "qdrant")
+
+
+def new_generation(index_dir: Path) -> IndexGeneration:
+    # id сортируется по времени: GC и "какая новее" — простое сравнение строк
+    gen_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ") + f"-{os.getpid()}"
+    gen = _generation(index_dir, gen_id)
+    gen.root.mkdir(parents=True, exist_ok=False)
+    return gen
+
+
+def current_generation_id(index_dir: Path) -> Optional[str]:
+    try:
+        return (index_dir / CURRENT_FILE).read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def resolve_index(index_dir: Path, *, legacy_qdrant_path: str) -> IndexGeneration:
+    """
+    The generation CURRENT points to; without CURRENT — the legacy single-directory layout
+    (Qdrant path from its index_meta.json, else from QDRANT_LOCAL_PATH).
+    """
+    gen_id = current_generation_id(index_dir)
+    if gen_id is not None:
+        return _generation(index_dir, gen_id)
+    legacy = IndexGeneration(id="legacy", root=index_dir, qdrant_path=Path(legacy_qdrant_path))
+    qpath = legacy.meta().get("qdrant_local_path")
+    return IndexGeneration(id="legacy", root=index_dir, qdrant_path=Path(qpath)) if qpath else legacy
+
+
+def validate_generation(
+    gen: IndexGeneration,
+    *,
+    store: SQLiteStore,
+    vectordb: VectorIndex,
+    expected_chunks: int,
+    probe_vector: List[float],
+) -> None:
+    """
+    Before publishing: meta written, chunk and vector counts match, and a stored vector finds itself
+    (cosine ~1; identical chunks may tie, so the top hit only has to resolve to a payload row).
+    """
+    meta = gen.meta()
+    if meta.get("chunks") != expected_chunks:
+        raise ValueError(f"generation {gen.id}: index_meta.json missing or chunks={meta.get('chunks')} != {expected_chunks}")
+    n_rows = store.count_chunks()
+    if n_rows != expected_chunks:
+        raise ValueError(f"generation {gen.id}: payload has {n_rows} chunks, expected {expected_chunks}")
+    n_vecs = vectordb.count()
+    if n_vecs != expected_chunks:
+        raise ValueError(f"generation {gen.id}: {type(vectordb).__name__} has {n_vecs} vectors, expected {expected_chunks}")
+    hits = vectordb.search(query_vector=probe_vector, top_k=1)
+    if not hits or hits[0].score < 0.99 or store.get_chunk(hits[0].chunk_id) is None:
+        raise ValueError(f"generation {gen.id}: probe search did not find a stored vector")
+
+
+def publish_generation(index_dir: Path, gen: IndexGeneration) -> None:
+    """
+    Atomically switch CURRENT to `gen`: write a temp file, fsync, os.replace.
+    Readers see either the old or the new id, never a partial file.
+    """
+    tmp = index_dir / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(gen.id + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, index_dir / CURRENT_FILE)
+    log.info("Published index generation %s", gen.id)
+
+
+def list_generations(index_dir: Path) -> List[str]:
+    d = index_dir / GENERATIONS_DIR
+    if not d.is_dir():
+        return []
+    return sorted(p.name for p in d.iterdir() if p.is_dir())
+
+
+def gc_generations(index_dir: Path, *, keep: int = 2) -> List[str]:
+    """
+    Deletes generations older than CURRENT, keeping the newest `keep` (CURRENT included), so a process
+    that has not switched yet still finds its files. Newer ones (builds in progress) are never touched.
+    """
+    current = current_generation_id(index_dir)
+    if current is None:
+        return []
+    older = [g for g in list_generations(index_dir) if g < current]
+    doomed = older[: max(0, len(older) - max(keep - 1, 0))]
+    for g in doomed:
+        shutil.rmtree(index_dir / GENERATIONS_DIR / g, ignore_errors=True)
+        log.info("Removed old index generation %s", g)
+    return doomed
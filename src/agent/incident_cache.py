@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import time
+from array import array
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from .signals import IncidentSignals
+
+
+log = logging.getLogger("agent")
+
+SCHEMA_SQL = """
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS incidents (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  index_id TEXT NOT NULL,
+  embed_model TEXT NOT NULL,
+  dim INTEGER NOT NULL,
+  name TEXT NOT NULL,
+  created_at REAL NOT NULL,
+  vector BLOB NOT NULL,
+  signals TEXT NOT NULL,
+  report TEXT NOT NULL
+);
+
+-- поиск идёт только среди записей того же индекса и модели (и размерности)
+CREATE INDEX IF NOT EXISTS idx_incidents_scope ON incidents(index_id, embed_model, dim);
+"""
+
+SIGNAL_KINDS = ("endpoints", "exceptions", "frames", "keywords")
+
+
+def signals_fingerprint(signals: IncidentSignals) -> Dict[str, List[str]]:
+    return {kind: sorted(getattr(signals, kind)) for kind in SIGNAL_KINDS}
+
+
+def _typed(fp: Dict[str, List[str]]) -> Set[str]:
+    return {f"{kind}:{v}" for kind in SIGNAL_KINDS for v in fp.get(kind, [])}
+
+
+def signals_similarity(a: Dict[str, List[str]], b: Dict[str, List[str]]) -> Optional[float]:
+    """
+    Jaccard over typed signal tokens; None when both incidents have no signals at all.
+    """
+    ta, tb = _typed(a), _typed(b)
+    union = ta | tb
+    if not union:
+        return None
+    return len(ta & tb) / len(union)
+
+
+def signals_diff(new: Dict[str, List[str]], old: Dict[str, List[str]]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    {"added": {kind: [...]}, "removed": {kind: [...]}} — what the new incident has that the cached one had not, and back.
+    """
+    added: Dict[str, List[str]] = {}
+    removed: Dict[str, List[str]] = {}
+    for kind in SIGNAL_KINDS:
+        n, o = set(new.get(kind, [])), set(old.get(kind, []))
+        if n - o:
+            added[kind] = sorted(n - o)
+        if o - n:
+            removed[kind] = sorted(o - n)
+    return {"added": added, "removed": removed}
+
+
+@dataclass(frozen=True)
+class IncidentMatch:
+    similarity: float
+    vector_score: float
+    signal_score: Optional[float]
+    name: str
+    analyzed_at: float
+    report: Dict[str, Any]
+    diff: Dict[str, Dict[str, List[str]]]
+
+    def as_report(self) -> Dict[str, Any]:
+        """
+        The earlier report, marked as a cached match (with what changed in the signals since).
+        """
+        out = dict(self.report)
+        out["cached_match"] = {
+            "source_incident": self.name,
+            "analyzed_at": datetime.fromtimestamp(self.analyzed_at, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "similarity": round(self.similarity, 4),
+            "vector_similarity": round(self.vector_score, 4),
+            "signal_similarity": None if self.signal_score is None else round(self.signal_score, 4),
+            "signals_diff": self.diff,
+        }
+        return out
+
+
+class IncidentCache:
+    """
+    Past analyses in a small SQLite file: query embedding + signal fingerprint + report, ranked by brute force.
+    similarity = vector_weight * cosine + (1 - vector_weight) * Jaccard(signals); only entries of the same
+    index, embedding model and dimension are compared, and a match needs >= threshold.
+    SQLite (WAL) lets several analyze/serve processes share the cache; if the file cannot be opened the
+    cache is off for the run.
+    """
+
+    def __init__(
+        self,
+        *,
+        path: str | Path,
+        index_id: str,
+        model_name: str,
+        threshold: float = 0.92,
+        vector_weight: float = 0.7,
+        max_entries: int = 5000,
+    ):
+        self.db_path = Path(path)
+        self.index_id = index_id
+        self.model_name = model_name
+        self.threshold = threshold
+        self.vector_weight = vector_weight
+        self.max_entries = max_entries
+        self._ready: Optional[bool] = None
+
+    def connect(self) -> sqlite3.Connection:
+        # analyze-batch и serve пишут из нескольких потоков/процессов: ждём lock, а не падаем
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _open(self) -> bool:
+        if self._ready is None:
+            try:
+                self.db_path.parent.mkdir(parents=True, exist_ok=True)
+                with self.connect() as conn:
+                    conn.executescript(SCHEMA_SQL)
+                self._ready = True
+            except (OSError, sqlite3.Error) as e:
+                log.warning("Incident cache %s unavailable (%s); running without it", self.db_path, e)
+                self._ready = False
+        return self._ready
+
+    def lookup(self, vector: List[float], signals: IncidentSignals) -> Optional[IncidentMatch]:
+        if not vector or not self._open():
+            return None
+        try:
+            with self.connect() as conn:
+                rows = conn.execute(
+                    """
+                    SELECT name, created_at, vector, signals, report FROM incidents
+                    WHERE index_id=? AND embed_model=? AND dim=?
+                    """,
+                    (self.index_id, self.model_name, len(vector)),
+                ).fetchall()
+        except sqlite3.Error as e:
+            log.warning("Incident cache lookup failed: %s", e)
+            return None
+        if not rows:
+            return None
+
+        import numpy as np
+
+        q = np.asarray(vector, dtype=np.float32)
+        m = np.frombuffer(b"".join(r["vector"] for r in rows), dtype=np.float32).reshape(len(rows), len(vector))
+        cosine = (m @ q) / np.maximum(np.linalg.norm(m, axis=1) * float(np.linalg.norm(q)), 1e-12)
+
+        fp = signals_fingerprint(signals)
+        best: Optional[IncidentMatch] = None
+        best_row: Optional[sqlite3.Row] = None
+        for r, score in zip(rows, cosine.tolist()):
+            old_fp = json.loads(r["signals"])
+            sig = signals_similarity(fp, old_fp)
+            sim = score if sig is None else self.vector_weight * score + (1.0 - self.vector_weight) * sig
+            if best is None or sim > best.similarity:
+                best = IncidentMatch(
+                    similarity=sim,
+                    vector_score=score,
+                    signal_score=sig,
+                    name=str(r["name"]),
+                    analyzed_at=float(r["created_at"]),
+                    report={},
+                    diff=signals_diff(fp, old_fp),
+                )
+                best_row = r
+
+        if best is None or best_row is None:
+            return None
+        if best.similarity < self.threshold:
+            log.info(
+                "Incident cache: closest past incident %s, similarity %.3f < threshold %.3f",
+                best.name, best.similarity, self.threshold,
+            )
+            return None
+        log.info(
+            "Incident cache: match %s (similarity %.3f: vector %.3f, signals %s) -> skipping LLM",
+            best.name, best.similarity, best.vector_score,
+            "n/a" if best.signal_score is None else f"{best.signal_score:.3f}",
+        )
+        return replace(best, report=json.loads(best_row["report"]))
+
+    def add(self, *, name: str, vector: List[float], signals: IncidentSignals, report: Dict[str, Any]) -> None:
+        # оборванный (partial) отчёт не переиспользуем; тайминги и пометки относятся к конкретному запуску
+        if report.get("partial") or not vector or not self._open():
+            return
+        report = {k: v for k, v in report.items() if k not in ("llm_timing", "cached_match")}
+        try:
+            with self.connect() as conn:
+                conn.execute(
+                    """
+                    INSERT INTO incidents(index_id, embed_model, dim, name, created_at, vector, signals, report)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        self.index_id,
+                        self.model_name,
+                        len(vector),
+                        name,
+                        time.time(),
+                        array("f", vector).tobytes(),
+                        json.dumps(signals_fingerprint(signals), ensure_ascii=False),
+                        json.dumps(report, ensure_ascii=False),
+                    ),
+                )
+                conn.execute(
+                    "DELETE FROM incidents WHERE id IN (SELECT id FROM incidents ORDER BY id DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+        except sqlite3.Error as e:
+            log.warning("Incident cache write failed: %s", e)
@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import hashlib
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List, Set, Tuple
 
 from .chunking import Chunk, chunk_text_by_lines
 from .config import ChunkingConfig, IndexConfig
+from .config_index import CONFIG_LANGUAGES, ConfigEntry, flatten_config
+from .profiling import count, span
+from .signals import ChunkToken, extract_chunk_tokens
+from .symbols import FileSymbols, extract_file_symbols
 
 
 CODE_EXT = {
@@ -75,15 +81,20 @@ def build_chunks(
     chunks: List[Chunk] = []
     next_id = 1
 
-    for file_path in iter_repo_files(repo_root):
+    with span("scan"):
+        files = list(iter_repo_files(repo_root))
+    for file_path in files:
         rel = str(file_path.relative_to(repo_root)).replace("\\", "/")
         if not _matches_prefixes(rel, index_cfg.include_prefixes):
             continue
 
         try:
-            raw = file_path.read_bytes()
+            with span("read"):
+                raw = file_path.read_bytes()
         except Exception:
             continue
+        count("files_read")
+        count("bytes_read", len(raw))
 
         # simple binary detection
         if b"\x00" in raw[:4096]:
@@ -92,15 +103,90 @@ def build_chunks(
         text = raw.decode("utf-8", errors="replace")
         lang = CODE_EXT.get(file_path.suffix.lower(), "text")
 
-        file_chunks = chunk_text_by_lines(
-            text=text,
-            path=rel,
-            language=lang,
-            chunk_id_start=next_id,
-            max_lines=chunk_cfg.max_lines,
-            overlap=chunk_cfg.overlap,
-        )
+        with span("chunk"):
+            file_chunks = chunk_text_by_lines(
+                text=text,
+                path=rel,
+                language=lang,
+                chunk_id_start=next_id,
+                max_lines=chunk_cfg.max_lines,
+                overlap=chunk_cfg.overlap,
+            )
         chunks.extend(file_chunks)
         next_id += len(file_chunks)
 
     return chunks
+
+
+def content_hash(chunks: List[Chunk]) -> str:
+    """
+    Хэш проиндексированного содержимого (пути, границы и текст чанков, без chunk_id и порядка обхода):
+    переиндексация без изменений в репозитории даёт тот же хэш.
+    """
+    h = hashlib.sha256()
+    for c in sorted(chunks, key=lambda c: (c.path, c.start_line)):
+        h.update(f"{c.path}\0{c.start_line}\0{c.end_line}\0".encode("utf-8"))
+        h.update(c.text.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def iter_chunk_files(chunks: List[Chunk]) -> Iterable[Tuple[str, str, List[str], List[Chunk]]]:
+    """
+    Группирует чанки по файлам и восстанавливает строки файла из чанков (с учётом overlap).
+    Yields (path, language, lines, file_chunks); lines[0] is line 1.
+    """
+    by_path: Dict[str, List[Chunk]] = {}
+    for c in chunks:
+        by_path.setdefault(c.path, []).append(c)
+
+    for path, file_chunks in by_path.items():
+        file_chunks.sort(key=lambda c: c.start_line)
+        lines: List[str] = []
+        for c in file_chunks:
+            chunk_lines = c.text.split("\n")
+            skip = len(lines) - (c.start_line - 1)
+            if skip < len(chunk_lines):
+                lines.extend(chunk_lines[max(skip, 0):])
+        yield path, file_chunks[0].language, lines, file_chunks
+
+
+def _symbols_by_chunk(file_chunks: List[Chunk], fsyms: FileSymbols) -> Dict[int, List[str]]:
+    out: Dict[int, List[str]] = {c.chunk_id: [] for c in file_chunks}
+    for s in fsyms.symbols:
+        for c in file_chunks:
+            if c.start_line <= s.line <= c.end_line:
+                out[c.chunk_id].append(s.name)
+    return out
+
+
+@dataclass
+class LookupTables:
+    """
+    Exact-match tables built next to the vectors: chunk_tokens (inverted index), file_symbols and config_keys.
+    """
+    tokens: Dict[int, Set[ChunkToken]] = field(default_factory=dict)
+    file_symbols: List[Tuple[str, str]] = field(default_factory=list)   # (symbol, path)
+    config_entries: List[Tuple[str, ConfigEntry]] = field(default_factory=list)   # (path, entry)
+
+
+def build_lookup_tables(chunks: List[Chunk]) -> LookupTables:
+    """
+    Index-time signal tokens per chunk (see signals.extract_chunk_tokens) and the symbol table
+    (fqcn and file name -> path) used to resolve stack frames.
+    Symbols are extracted per file so that methods in later chunks still get their enclosing type.
+    Config files (yaml/properties/tf) are additionally flattened into key-path -> value entries.
+    """
+    out = LookupTables()
+    for path, lang, lines, file_chunks in iter_chunk_files(chunks):
+        fsyms = extract_file_symbols(text_lines=lines, language=lang, path=path)
+        syms = _symbols_by_chunk(file_chunks, fsyms)
+        for c in file_chunks:
+            out.tokens[c.chunk_id] = extract_chunk_tokens(c.text, syms[c.chunk_id])
+
+        out.file_symbols.append((path.rsplit("/", 1)[-1], path))
+        out.file_symbols.extend((fqcn, path) for fqcn in fsyms.fqcns())
+
+        if lang in CONFIG_LANGUAGES:
+            out.config_entries.extend((path, e) for e in flatten_config(text_lines=lines, language=lang))
+    return out
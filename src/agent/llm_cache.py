@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+SCHEMA_SQL = """
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS llm_responses (
+  key TEXT PRIMARY KEY,
+  model TEXT NOT NULL,
+  raw TEXT NOT NULL,
+  report TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  created_at REAL NOT NULL,
+  last_used REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_llm_responses_last_used ON llm_responses(last_used);
+"""
+
+
+def llm_cache_key(*, model: str, system: str, user: str, temperature: float) -> str:
+    raw = json.dumps([model, system, user, round(float(temperature), 4)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    raw: str
+    report: Dict[str, Any]
+    created_at: float
+
+
+@dataclass
+class LLMCache:
+    """
+    Content-addressed on-disk cache of LLM responses: sha256(model, system, user prompt, temperature) ->
+    raw response + parsed report. Entries expire after ttl_s; beyond max_entries / max_bytes
+    the least recently used are evicted. read=False (--no-cache) skips lookups but still stores fresh answers.
+    """
+
+    db_path: Path
+    ttl_s: float = 7 * 24 * 3600.0
+    max_entries: int = 512
+    max_bytes: int = 256 * 1024 * 1024
+    read: bool = True
+
+    hits: int = field(default=0, init=False)
+    misses: int = field(default=0, init=False)
+
+    def init(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as conn:
+            conn.executescript(SCHEMA_SQL)
+
+    def connect(self) -> sqlite3.Connection:
+        # analyze-batch пишет из нескольких потоков: ждём lock, а не падаем
+        conn = sqlite3.connect(str(self.db_path), timeout=30.0)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        if not self.read:
+            return None
+        now = time.time()
+        with self.connect() as conn:
+            row = conn.execute("SELECT raw, report, created_at FROM llm_responses WHERE key=?", (key,)).fetchone()
+            if row is not None and now - float(row["created_at"]) > self.ttl_s:
+                conn.execute("DELETE FROM llm_responses WHERE key=?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE llm_responses SET last_used=? WHERE key=?", (now, key))
+        self.hits += 1
+        return CachedResponse(raw=str(row["raw"]), report=json.loads(row["report"]), created_at=float(row["created_at"]))
+
+    def put(self, key: str, *, model: str, raw: str, report: Dict[str, Any]) -> None:
+        report_json = json.dumps(report, ensure_ascii=False)
+        size = len(raw.encode("utf-8")) + len(report_json.encode("utf-8"))
+        now = time.time()
+        with self.connect() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO llm_responses(key, model, raw, report, size, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (key, model, raw, report_json, size, now, now),
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_s,))
+        conn.execute(
+            """
+            DELETE FROM llm_responses WHERE key IN (
+              SELECT key FROM llm_responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (self.max_entries,),
+        )
+        # по размеру: оставляем самые свежие записи, пока их суммарный размер влезает в max_bytes
+        conn.execute(
+            """
+            DELETE FROM llm_responses WHERE key IN (
+              SELECT key FROM (
+                SELECT key, SUM(size) OVER (ORDER BY last_used DESC, key) AS total FROM llm_responses
+              ) WHERE total > ?
+            )
+            """,
+            (self.max_bytes,),
+        )
@@ -1,9 +1,22 @@
 from __future__ import annotations
 
+import http.client
+import json
 import logging
 import os
+import ssl
+import threading
+import time
+import uuid
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from .profiling import count
+
+
+log = logging.getLogger("agent")
+
 
 @dataclass(frozen=True)
 class LLMConfig:
@@ -11,11 +24,19 @@ class LLMConfig:
     scope: Optional[str] = None
     verify_ssl_certs: bool = True
     temperature: float = 0.1
+    model: str = "GigaChat"
+    base_url: str = "https://gigachat.devices.sberbank.ru/api/v1"
+    auth_url: str = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
+    timeout_s: float = 120.0
+    pool_size: int = 4
+    # ответ по SSE (stream=true): гипотезы видны до конца генерации
+    stream: bool = True
+    # токен обновляем заранее, за столько секунд до expires_at
+    token_refresh_margin_s: float = 60.0
 
 
 def load_llm_config() -> LLMConfig:
-    credentials = os.getenv("GIGACHAT_CREDENTIALS", "MGFlN2NiMjYtM2RmYy00NDkzLWI0OWUtNjgzOTdkNTdhYzUzOmI4NDUyYzdkLTg1YjYtNDM5OC1iMDM1LTFmMzVlNGZhNTgzMQ==").strip()
-    logging.info("credentials: %s", credentials)
+    credentials = os.getenv("GIGACHAT_CREDENTIALS", "").strip()
     if not credentials:
         raise ValueError("GIGACHAT_CREDENTIALS is not set")
 
@@ -24,31 +45,393 @@ def load_llm_config() -> LLMConfig:
         scope=os.getenv("GIGACHAT_SCOPE"),
         verify_ssl_certs=os.getenv("GIGACHAT_VERIFY_SSL_CERTS", "false").lower() == "true",
         temperature=float(os.getenv("GIGACHAT_TEMPERATURE", "0.1")),
+        model=os.getenv("GIGACHAT_MODEL", "GigaChat"),
+        base_url=os.getenv("GIGACHAT_BASE_URL", "https://gigachat.devices.sberbank.ru/api/v1").rstrip("/"),
+        auth_url=os.getenv("GIGACHAT_AUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"),
+        timeout_s=float(os.getenv("GIGACHAT_TIMEOUT", "120")),
+        pool_size=int(os.getenv("GIGACHAT_POOL_SIZE", "4")),
+        stream=os.getenv("GIGACHAT_STREAM", "true").lower() == "true",
     )
 
 
+class LLMError(RuntimeError):
+    def __init__(self, message: str, status: int = 0):
+        super().__init__(message)
+        self.status = status
+
+
+def _count_usage(usage: Any) -> None:
+    if isinstance(usage, dict):
+        count("llm_prompt_tokens", int(usage.get("prompt_tokens") or 0))
+        count("llm_completion_tokens", int(usage.get("completion_tokens") or 0))
+
+
+@dataclass(frozen=True)
+class RequestTiming:
+    """
+    Milliseconds per phase of one chat call: auth is 0 when the cached token was used,
+    connect is 0 when a pooled keep-alive connection was reused. first_token_ms is set for streamed calls.
+    """
+    auth_ms: float
+    connect_ms: float
+    ttfb_ms: float
+    total_ms: float
+    reused_connection: bool
+    retries: int = 0
+    first_token_ms: Optional[float] = None
+
+
+@dataclass
+class _Response:
+    status: int
+    body: bytes
+    connect_ms: float
+    ttfb_ms: float
+    reused: bool
+
+
+class HTTPPool:
+    """
+    Keep-alive connections per (scheme, host, port); thread-safe, at most `max_idle` idle connections per host.
+    http:// is allowed so a local stand-in server can replace the real endpoints.
+    """
+
+    def __init__(self, *, verify_ssl: bool, timeout_s: float, max_idle: int = 4):
+        self.timeout_s = timeout_s
+        self.max_idle = max(1, max_idle)
+        self._ssl = ssl.create_default_context() if verify_ssl else ssl._create_unverified_context()
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _new(self, scheme: str, host: str, port: int) -> http.client.HTTPConnection:
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout_s, context=self._ssl)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout_s)
+
+    def request(self, method: str, url: str, *, body: bytes, headers: Dict[str, str]) -> _Response:
+        s = self.open(method, url, body=body, headers=headers)
+        try:
+            data = s.read()
+        finally:
+            s.close()
+        return _Response(status=s.status, body=data, connect_ms=s.connect_ms, ttfb_ms=s.ttfb_ms, reused=s.reused)
+
+    def open(self, method: str, url: str, *, body: bytes, headers: Dict[str, str]) -> "_Stream":
+        """
+        Sends the request and returns once the response headers arrive; the body is read by the caller.
+        """
+        u = urlsplit(url)
+        scheme = u.scheme or "https"
+        port = u.port or (443 if scheme == "https" else 80)
+        key = (scheme, u.hostname or "", port)
+        path = u.path + (f"?{u.query}" if u.query else "")
+
+        # повторяем один раз, если сервер закрыл keep-alive соединение, пока оно лежало в пуле
+        for attempt in (0, 1):
+            with self._lock:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle and attempt == 0 else None
+            reused = conn is not None
+
+            connect_ms = 0.0
+            if conn is None:
+                conn = self._new(*key)
+                t0 = time.perf_counter()
+                conn.connect()  # TCP + TLS handshake
+                connect_ms = (time.perf_counter() - t0) * 1000.0
+
+            try:
+                t1 = time.perf_counter()
+                conn.request(method, path, body=body, headers=headers)
+                resp = conn.getresponse()
+                ttfb_ms = (time.perf_counter() - t1) * 1000.0
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+            return _Stream(self, key, conn, resp, connect_ms=connect_ms, ttfb_ms=ttfb_ms, reused=reused)
+
+        raise LLMError(f"connection to {key[1]}:{key[2]} closed")
+
+    def _release(self, key: Tuple[str, str, int], conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for c in conns:
+            c.close()
+
+
+class _Stream:
+    """
+    Response whose body has not been read yet. close() returns the connection to the pool
+    only if the body was read to the end; otherwise the connection is dropped.
+    """
+
+    def __init__(
+        self,
+        pool: HTTPPool,
+        key: Tuple[str, str, int],
+        conn: http.client.HTTPConnection,
+        resp: http.client.HTTPResponse,
+        *,
+        connect_ms: float,
+        ttfb_ms: float,
+        reused: bool,
+    ):
+        self._pool = pool
+        self._key = key
+        self._conn: Optional[http.client.HTTPConnection] = conn
+        self._resp = resp
+        self.status = resp.status
+        self.connect_ms = connect_ms
+        self.ttfb_ms = ttfb_ms
+        self.reused = reused
+
+    def read(self) -> bytes:
+        return self._resp.read()
+
+    def lines(self) -> Iterator[bytes]:
+        while True:
+            line = self._resp.readline()
+            if not line:
+                return
+            yield line
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        if self._resp.isclosed() and not self._resp.will_close:
+            self._pool._release(self._key, conn)
+        else:
+            conn.close()
+
+
+class TokenCache:
+    """
+    Access token shared by all threads; refreshed once (under a lock) shortly before it expires.
+    """
+
+    def __init__(self, fetch: Callable[[], Tuple[str, float]], *, margin_s: float = 60.0):
+        self._fetch = fetch            # -> (token, expires_at epoch seconds)
+        self.margin_s = margin_s
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> Tuple[str, float]:
+        """
+        Returns (token, ms spent fetching it; 0 when cached).
+        """
+        token = self._token
+        if token is not None and time.time() < self._expires_at - self.margin_s:
+            return token, 0.0
+        with self._lock:
+            # другой поток мог уже обновить токен, пока мы ждали lock
+            if self._token is not None and time.time() < self._expires_at - self.margin_s:
+                return self._token, 0.0
+            t0 = time.perf_counter()
+            self._token, self._expires_at = self._fetch()
+            return self._token, (time.perf_counter() - t0) * 1000.0
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            if self._token == token:
+                self._token = None
+
+
 class LLMClient:
     """
-    Корректная обёртка над официальным gigachat SDK.
-    Без передачи неподдерживаемых kwargs.
+    Long-lived GigaChat REST client: pooled keep-alive connections and a cached OAuth token,
+    so only the first call pays for the TLS handshake and the token exchange.
     """
 
     def __init__(self, cfg: LLMConfig):
         self.cfg = cfg
-        from gigachat import GigaChat  # импортируем лениво
-        self._GigaChat = GigaChat
-
-    def chat_text(self, *, system: str, user: str) -> str:
-        prompt = f"SYSTEM:\n{system}\n\nUSER:\n{user}"
-
-        with self._GigaChat(
-            credentials=self.cfg.credentials,
-            scope=self.cfg.scope,
-            verify_ssl_certs=self.cfg.verify_ssl_certs,
-        ) as client:
-            response = client.chat(
-                prompt,
-                # temperature=self.cfg.temperature,
+        self.pool = HTTPPool(verify_ssl=cfg.verify_ssl_certs, timeout_s=cfg.timeout_s, max_idle=cfg.pool_size)
+        self.tokens = TokenCache(self._fetch_token, margin_s=cfg.token_refresh_margin_s)
+
+    def __enter__(self) -> "LLMClient":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def _fetch_token(self) -> Tuple[str, float]:
+        resp = self.pool.request(
+            "POST",
+            self.cfg.auth_url,
+            body=urlencode({"scope": self.cfg.scope or "GIGACHAT_API_PERS"}).encode("utf-8"),
+            headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+                "RqUID": str(uuid.uuid4()),
+                "Authorization": f"Basic {self.cfg.credentials}",
+            },
+        )
+        if resp.status != 200:
+            raise LLMError(f"GigaChat auth failed: HTTP {resp.status} {resp.body[:200]!r}", resp.status)
+        data = json.loads(resp.body)
+        # expires_at в миллисекундах epoch; у совместимых серверов бывает expires_in (секунды)
+        if "expires_at" in data:
+            expires_at = float(data["expires_at"]) / 1000.0
+        else:
+            expires_at = time.time() + float(data.get("expires_in", 1800))
+        return str(data["access_token"]), expires_at
+
+    def _open_chat(
+        self, *, system: str, user: str, temperature: Optional[float], stream: bool
+    ) -> Tuple[_Stream, float, int]:
+        """
+        Sends a chat request (with one token refresh on 401); returns (response with unread body, auth ms, retries).
+        """
+        body = json.dumps(
+            {
+                "model": self.cfg.model,
+                "messages": [
+                    {"role": "system", "content": system},
+                    {"role": "user", "content": user},
+                ],
+                "temperature": self.cfg.temperature if temperature is None else temperature,
+                "stream": stream,
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+        count("llm_bytes_sent", len(body))
+
+        auth_ms = 0.0
+        retries = 0
+        while True:
+            token, spent = self.tokens.get()
+            auth_ms += spent
+            resp = self.pool.open(
+                "POST",
+                f"{self.cfg.base_url}/chat/completions",
+                body=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept": "text/event-stream" if stream else "application/json",
+                    "Authorization": f"Bearer {token}",
+                },
             )
+            if resp.status == 200:
+                return resp, auth_ms, retries
+            try:
+                err = resp.read()
+            finally:
+                resp.close()
+            # токен отозван/протух раньше expires_at: берём новый один раз
+            if resp.status == 401 and retries == 0:
+                self.tokens.invalidate(token)
+                retries += 1
+                continue
+            raise LLMError(f"GigaChat chat failed: HTTP {resp.status} {err[:200]!r}", resp.status)
+
+    @staticmethod
+    def _record_timing(
+        resp: _Stream,
+        on_timing: Optional[Callable[[RequestTiming], None]],
+        *,
+        t0: float,
+        auth_ms: float,
+        retries: int,
+        first_token_ms: Optional[float] = None,
+    ) -> None:
+        timing = RequestTiming(
+            auth_ms=auth_ms,
+            connect_ms=resp.connect_ms,
+            ttfb_ms=resp.ttfb_ms,
+            total_ms=(time.perf_counter() - t0) * 1000.0,
+            reused_connection=resp.reused,
+            retries=retries,
+            first_token_ms=first_token_ms,
+        )
+        log.info(
+            "LLM request: auth=%.0fms connect=%.0fms ttfb=%.0fms first_token=%s total=%.0fms reused=%s",
+            auth_ms, resp.connect_ms, resp.ttfb_ms,
+            "-" if first_token_ms is None else f"{first_token_ms:.0f}ms",
+            timing.total_ms, resp.reused,
+        )
+        if on_timing is not None:
+            on_timing(timing)
+
+    def chat_text(
+        self,
+        *,
+        system: str,
+        user: str,
+        temperature: Optional[float] = None,
+        on_timing: Optional[Callable[[RequestTiming], None]] = None,
+    ) -> str:
+        """
+        on_timing receives this call's RequestTiming: the client is shared between threads, so timings are per call.
+        """
+        t0 = time.perf_counter()
+        resp, auth_ms, retries = self._open_chat(system=system, user=user, temperature=temperature, stream=False)
+        try:
+            raw = resp.read()
+        finally:
+            resp.close()
+        self._record_timing(resp, on_timing, t0=t0, auth_ms=auth_ms, retries=retries)
+        count("llm_bytes_received", len(raw))
+        data = json.loads(raw)
+        _count_usage(data.get("usage"))
+        return data["choices"][0]["message"]["content"]
 
-        return response.choices[0].message.content
+    def chat_stream(
+        self,
+        *,
+        system: str,
+        user: str,
+        temperature: Optional[float] = None,
+        on_timing: Optional[Callable[[RequestTiming], None]] = None,
+    ) -> Iterator[str]:
+        """
+        Streams content deltas (SSE `data: {...}` events until `data: [DONE]`).
+        If the stream breaks midway the error propagates after the deltas already yielded.
+        on_timing receives the call's RequestTiming once the stream is closed.
+        """
+        t0 = time.perf_counter()
+        resp, auth_ms, retries = self._open_chat(system=system, user=user, temperature=temperature, stream=True)
+        first_token_ms: Optional[float] = None
+        try:
+            for raw in resp.lines():
+                count("llm_bytes_received", len(raw))
+                line = raw.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == b"[DONE]":
+                    # дочитываем тело, чтобы соединение вернулось в пул
+                    resp.read()
+                    break
+                event = json.loads(payload)
+                # usage приходит в последнем событии
+                _count_usage(event.get("usage"))
+                choice = (event.get("choices") or [{}])[0]
+                delta = (choice.get("delta") or {}).get("content") or ""
+                if choice.get("finish_reason") == "length":
+                    log.warning("LLM response truncated by max tokens")
+                if delta:
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - t0) * 1000.0
+                    yield delta
+        finally:
+            resp.close()
+            self._record_timing(resp, on_timing, t0=t0, auth_ms=auth_ms, retries=retries, first_token_ms=first_token_ms)
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import gzip
+import io
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .signals import ENDPOINT_RE, EXC_RE, KEY_TOKENS_RE, STACK_FRAME_RE
+
+
+log = logging.getLogger("agent")
+
+
+TIMESTAMP_PREFIX_RE = re.compile(
+    r"^\s*\[?\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?\]?\s*"
+)
+# маскирование переменных частей (Drain preprocessing): только числа — это самый дешёвый regex,
+# а uuid/hex id всё равно превращаются в <*> самим Drain, т.к. отличаются от строки к строке
+MASK_RE = re.compile(r"\d+(?:\.\d+)?")
+WILDCARD = "<*>"
+# кэши по маскированной строке: повторяющиеся сообщения не гоняем через regex/Drain заново
+_CACHE_LIMIT = 100_000
+
+# поля JSON-логов, из которых берём текст
+JSON_MESSAGE_FIELDS = ("message", "msg", "log", "error", "exception", "stack_trace", "stacktrace")
+
+
+def open_text(path: Path) -> io.TextIOBase:
+    """
+    Text stream for plain or .gz files; undecodable bytes are replaced, never fatal.
+    """
+    if path.suffix.lower() == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def strip_timestamp(line: str) -> str:
+    # дешёвая проверка до regex: большинство строк без timestamp не начинаются с цифры / "["
+    head = line[:2].lstrip()
+    if head and (head[0].isdigit() or head[0] == "["):
+        return TIMESTAMP_PREFIX_RE.sub("", line, count=1)
+    return line
+
+
+def mask_line(line: str) -> str:
+    return MASK_RE.sub(WILDCARD, strip_timestamp(line))
+
+
+def has_signal(line: str) -> bool:
+    return bool(
+        STACK_FRAME_RE.search(line)
+        or EXC_RE.search(line)
+        or ENDPOINT_RE.search(line)
+        or KEY_TOKENS_RE.search(line)
+    )
+
+
+def _json_log_lines(line: str) -> Optional[List[str]]:
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(obj, dict):
+        return None
+    out: List[str] = []
+    for k in JSON_MESSAGE_FIELDS:
+        v = obj.get(k)
+        if isinstance(v, str) and v:
+            out.extend(v.splitlines())
+    return out
+
+
+class BoundedCounter:
+    """
+    Counter with a hard size limit: when full, the less frequent half is dropped.
+    Keeps memory constant on unbounded streams; heavy hitters survive.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max(2, int(max_size))
+        self.counts: Dict[str, int] = {}
+
+    def add(self, key: str, n: int = 1) -> None:
+        c = self.counts.get(key)
+        if c is not None:
+            self.counts[key] = c + n
+            return
+        if len(self.counts) >= self.max_size:
+            keep = sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[: self.max_size // 2]
+            self.counts = dict(keep)
+        self.counts[key] = n
+
+    def most_common(self, n: int) -> List[Tuple[str, int]]:
+        return sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+
+@dataclass
+class _Cluster:
+    tokens: List[str]
+    count: int
+    sample: str
+    alive: bool = True
+
+
+class LogTemplateMiner:
+    """
+    Drain-style online template miner: lines are grouped by (token count, leading tokens),
+    matched to the most similar cluster, and differing positions become <*>.
+    The number of clusters is bounded (rare ones are evicted), so memory does not grow with the input.
+    """
+
+    def __init__(self, *, sim_threshold: float = 0.5, max_clusters: int = 5000, max_tokens: int = 64):
+        self.sim_threshold = sim_threshold
+        self.max_clusters = max_clusters
+        self.max_tokens = max_tokens
+        self._groups: Dict[Tuple[Any, ...], List[_Cluster]] = {}
+        self._n = 0
+        # masked line -> cluster: шаблон только обобщается, поэтому повторная строка всегда попадает в тот же кластер
+        self._seen: Dict[str, _Cluster] = {}
+
+    def add(self, masked: str, line: str) -> None:
+        hit = self._seen.get(masked)
+        if hit is not None and hit.alive:
+            hit.count += 1
+            return
+
+        tokens = masked.split()[: self.max_tokens]
+        if not tokens:
+            return
+
+        second = tokens[1] if len(tokens) > 1 else ""
+        key = (len(tokens), tokens[0], WILDCARD if WILDCARD in second else second)
+        group = self._groups.setdefault(key, [])
+
+        best: Optional[_Cluster] = None
+        best_sim = -1.0
+        for c in group:
+            same = sum(1 for a, b in zip(c.tokens, tokens) if a == b or a == WILDCARD)
+            sim = same / len(tokens)
+            if sim > best_sim:
+                best, best_sim = c, sim
+
+        if best is not None and best_sim >= self.sim_threshold:
+            best.tokens = [a if a == b else WILDCARD for a, b in zip(best.tokens, tokens)]
+            best.count += 1
+            self._remember(masked, best)
+            return
+
+        cluster = _Cluster(tokens=tokens, count=1, sample=line[:500])
+        group.append(cluster)
+        self._remember(masked, cluster)
+        self._n += 1
+        if self._n > self.max_clusters:
+            self._evict()
+
+    def _evict(self) -> None:
+        # выбрасываем 10% самых редких кластеров
+        ranked = sorted((c for g in self._groups.values() for c in g), key=lambda c: c.count)
+        drop = {id(c) for c in ranked[: max(1, len(ranked) // 10)]}
+        for c in ranked[: max(1, len(ranked) // 10)]:
+            c.alive = False
+        for key in list(self._groups):
+            kept = [c for c in self._groups[key] if id(c) not in drop]
+            if kept:
+                self._groups[key] = kept
+            else:
+                del self._groups[key]
+        self._n = sum(len(g) for g in self._groups.values())
+
+    def _remember(self, masked: str, cluster: _Cluster) -> None:
+        if len(self._seen) >= _CACHE_LIMIT:
+            self._seen.clear()
+        self._seen[masked] = cluster
+
+    def templates(self) -> List[_Cluster]:
+        out = [c for g in self._groups.values() for c in g]
+        out.sort(key=lambda c: c.count, reverse=True)
+        return out
+
+
+@dataclass
+class LogTemplate:
+    template: str
+    count: int
+    sample: str
+
+
+@dataclass
+class LogDigest:
+    lines: int = 0
+    bytes: int = 0
+    elapsed_s: float = 0.0
+    templates: List[LogTemplate] = field(default_factory=list)
+    # различные сырые строки с сигналами (stack frames, исключения, endpoints), по частоте
+    signal_lines: List[Tuple[str, int]] = field(default_factory=list)
+
+
+def iter_log_lines(path: Path) -> Iterator[str]:
+    with open_text(path) as f:
+        for raw in f:
+            line = raw.rstrip("\r\n")
+            if not line.strip():
+                continue
+            if line.lstrip().startswith("{"):
+                parsed = _json_log_lines(line)
+                if parsed is not None:
+                    yield from parsed
+                    continue
+            yield line
+
+
+def ingest_logs(
+    paths: List[Path],
+    *,
+    max_clusters: int = 5000,
+    max_signal_lines: int = 2000,
+    top_templates: int = 200,
+) -> LogDigest:
+    """
+    Streams log files (plain or .gz) line by line: mines templates with counts and collects
+    frequency-ranked signal lines. Memory is bounded by max_clusters/max_signal_lines, not file size.
+    """
+    miner = LogTemplateMiner(max_clusters=max_clusters)
+    signal_lines = BoundedCounter(max_signal_lines)
+    digest = LogDigest()
+
+    signal_cache: Dict[str, bool] = {}
+
+    t0 = time.perf_counter()
+    for path in paths:
+        digest.bytes += path.stat().st_size
+        for line in iter_log_lines(path):
+            digest.lines += 1
+            body = strip_timestamp(line)
+            masked = MASK_RE.sub(WILDCARD, body)
+            miner.add(masked, line)
+
+            # маскирование не трогает сигналы (имена исключений, классов, /api/...), поэтому кэшируем по masked
+            sig = signal_cache.get(masked)
+            if sig is None:
+                if len(signal_cache) >= _CACHE_LIMIT:
+                    signal_cache.clear()
+                sig = signal_cache[masked] = has_signal(line)
+            if sig:
+                signal_lines.add(body.strip()[:500])
+    digest.elapsed_s = time.perf_counter() - t0
+
+    digest.templates = [
+        LogTemplate(template=" ".join(c.tokens), count=c.count, sample=c.sample)
+        for c in miner.templates()[:top_templates]
+    ]
+    digest.signal_lines = signal_lines.most_common(max_signal_lines)
+
+    log.info(
+        "Ingested logs: lines=%d bytes=%d templates=%d signal_lines=%d in %.2fs (%.0f lines/s)",
+        digest.lines, digest.bytes, len(digest.templates), len(digest.signal_lines),
+        digest.elapsed_s, digest.lines / max(digest.elapsed_s, 1e-9),
+    )
+    return digest
+
+
+def attach_log_digest(
+    incident: Dict[str, Any],
+    digest: LogDigest,
+    *,
+    max_templates: int = 50,
+    max_signal_lines: int = 60,
+) -> Dict[str, Any]:
+    """
+    Returns a copy of the incident with deduplicated log templates and top signal lines,
+    which incident_to_query_text and the prompt pick up.
+    """
+    out = dict(incident)
+    out["log_templates"] = [
+        {"template": t.template, "count": t.count} for t in digest.templates[:max_templates]
+    ]
+    out["log_signal_lines"] = [line for line, _ in digest.signal_lines[:max_signal_lines]]
+    out["log_stats"] = {"lines": digest.lines, "templates": len(digest.templates)}
+    return out
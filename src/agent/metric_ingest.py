@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import csv
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .log_ingest import open_text
+from .signals import KEY_TOKENS_NORM
+
+
+log = logging.getLogger("agent")
+
+
+@dataclass
+class MetricMatrix:
+    """
+    Series aligned on a common time grid: values[series, point], NaN where a series has no sample.
+    """
+    names: List[str]
+    ts: np.ndarray          # (T,) epoch seconds
+    values: np.ndarray      # (S, T) float64
+
+
+@dataclass(frozen=True)
+class MetricAnomaly:
+    metric: str
+    score: float            # устойчивый robust z-score (минимум по 3 подряд точкам)
+    direction: str          # "up" | "down"
+    baseline: float
+    peak: float
+    onset: Optional[float]          # epoch seconds первой устойчивой аномальной точки
+    change_point: Optional[float]   # epoch seconds наиболее вероятного сдвига среднего
+    keywords: Tuple[str, ...] = ()
+
+
+@dataclass
+class MetricDigest:
+    series: int = 0
+    points: int = 0
+    load_s: float = 0.0
+    detect_s: float = 0.0
+    anomalies: List[MetricAnomaly] = field(default_factory=list)
+
+
+def _parse_ts(v: Any) -> float:
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = str(v).strip()
+    try:
+        return float(s)
+    except ValueError:
+        dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt.timestamp()
+
+
+def parse_time_window(window: Any) -> Tuple[Optional[float], Optional[float]]:
+    """
+    "2026-01-15T10:00:00Z/2026-01-15T10:30:00Z" -> (start, end) epoch seconds.
+    """
+    if not isinstance(window, str) or "/" not in window:
+        return None, None
+    a, b = window.split("/", 1)
+    try:
+        return _parse_ts(a), _parse_ts(b)
+    except ValueError:
+        return None, None
+
+
+def series_name(labels: Dict[str, Any]) -> str:
+    name = str(labels.get("__name__", ""))
+    rest = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()) if k != "__name__")
+    return f"{name}{{{rest}}}" if rest else name
+
+
+def _align(raw: List[Tuple[str, np.ndarray, np.ndarray]]) -> MetricMatrix:
+    if not raw:
+        return MetricMatrix(names=[], ts=np.zeros(0), values=np.zeros((0, 0)))
+    grid = np.unique(np.concatenate([ts for _, ts, _ in raw]))
+    values = np.full((len(raw), grid.size), np.nan, dtype=np.float64)
+    for i, (_, ts, vals) in enumerate(raw):
+        values[i, np.searchsorted(grid, ts)] = vals
+    return MetricMatrix(names=[n for n, _, _ in raw], ts=grid, values=values)
+
+
+def _load_prometheus(path: Path) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    with open_text(path) as f:
+        doc = json.load(f)
+    result = (doc.get("data") or {}).get("result") or [] if isinstance(doc, dict) else []
+    out: List[Tuple[str, np.ndarray, np.ndarray]] = []
+    for r in result:
+        pairs = r.get("values") or ([r["value"]] if "value" in r else [])
+        if not pairs:
+            continue
+        arr = np.asarray(pairs, dtype=object)
+        ts = arr[:, 0].astype(np.float64)
+        # Prometheus отдаёт значения строками, включая "NaN" / "+Inf"
+        vals = arr[:, 1].astype(np.float64)
+        out.append((series_name(r.get("metric") or {}), ts, vals))
+    return out
+
+
+def _load_csv(path: Path) -> List[Tuple[str, np.ndarray, np.ndarray]]:
+    """
+    Wide: timestamp,series_a,series_b,...  Long: timestamp,metric,value (header names metric/series/name).
+    """
+    with open_text(path) as f:
+        rows = list(csv.reader(f))
+    if len(rows) < 2:
+        return []
+    header = [h.strip() for h in rows[0]]
+    body = rows[1:]
+
+    lower = [h.lower() for h in header]
+    if len(header) == 3 and lower[1] in ("metric", "series", "name"):
+        by_name: Dict[str, Tuple[List[float], List[float]]] = {}
+        for r in body:
+            if len(r) < 3:
+                continue
+            ts_l, v_l = by_name.setdefault(r[1], ([], []))
+            ts_l.append(_parse_ts(r[0]))
+            v_l.append(float(r[2]) if r[2].strip() else np.nan)
+        return [(n, np.asarray(t), np.asarray(v, dtype=np.float64)) for n, (t, v) in by_name.items()]
+
+    ts = np.asarray([_parse_ts(r[0]) for r in body], dtype=np.float64)
+    cols = np.genfromtxt([",".join(r[1:]) for r in body], delimiter=",", dtype=np.float64, ndmin=2)
+    return [(header[j + 1], ts, cols[:, j]) for j in range(cols.shape[1])]
+
+
+def load_metrics(paths: List[Path]) -> MetricMatrix:
+    raw: List[Tuple[str, np.ndarray, np.ndarray]] = []
+    for p in paths:
+        name = p.name.lower()
+        if name.endswith(".csv") or name.endswith(".csv.gz"):
+            raw.extend(_load_csv(p))
+        else:
+            raw.extend(_load_prometheus(p))
+    return _align(raw)
+
+
+def metric_keywords(name: str) -> Tuple[str, ...]:
+    """
+    Keywords from KEY_TOKENS found in a metric name (hikaricp_connections_timeout_total -> hikari, timeout).
+    """
+    parts = [p for p in re.split(r"[^a-z0-9]+", name.lower().split("{", 1)[0]) if p]
+    return tuple(kw for kw in KEY_TOKENS_NORM if " " not in kw and any(p.startswith(kw) for p in parts))
+
+
+def _row_median(a: np.ndarray) -> np.ndarray:
+    """
+    Per-row median; np.nanmedian is several times slower than np.median, so it is used only for rows with gaps.
+    """
+    gaps = np.isnan(a).any(axis=1)
+    out = np.median(a, axis=1)
+    if gaps.any():
+        with np.errstate(all="ignore"):
+            out[gaps] = np.nanmedian(a[gaps], axis=1)
+    return out
+
+
+def _change_points(x: np.ndarray) -> np.ndarray:
+    """
+    Index of the most likely mean shift per row: argmax over k of |mean(x[k:]) - mean(x[:k])| * sqrt(k(T-k)/T),
+    all splits at once from cumulative sums.
+    """
+    T = x.shape[1]
+    c = np.cumsum(x, axis=1)
+    k = np.arange(1, T)
+    before = c[:, :-1] / k
+    after = (c[:, -1:] - c[:, :-1]) / (T - k)
+    stat = np.abs(after - before) * np.sqrt(k * (T - k) / T)
+    return stat.argmax(axis=1) + 1
+
+
+def detect_anomalies(
+    m: MetricMatrix,
+    *,
+    window: Tuple[Optional[float], Optional[float]] = (None, None),
+    z_threshold: float = 3.5,
+    persist: int = 3,
+    top_n: int = 20,
+) -> List[MetricAnomaly]:
+    """
+    Vectorized over all series at once:
+      * baseline = points before the incident window (or the first 30% if the window is unknown);
+      * robust z-score against baseline median/MAD, required to hold for `persist` consecutive points;
+      * mean-shift change point from cumulative sums (max of the two-sample t-like statistic).
+    """
+    S, T = m.values.shape
+    if S == 0 or T < persist + 2:
+        return []
+
+    start, end = window
+    if start is not None and (m.ts < start).sum() >= 3:
+        base_mask = m.ts < start
+        win_mask = (m.ts >= start) & (m.ts <= end if end is not None else True)
+    else:
+        cut = max(3, int(T * 0.3))
+        base_mask = np.arange(T) < cut
+        win_mask = ~base_mask
+    if win_mask.sum() < persist:
+        return []
+
+    v = m.values
+    with np.errstate(all="ignore"):
+        base = v[:, base_mask]
+        med = _row_median(base)
+        mad = _row_median(np.abs(base - med[:, None])) * 1.4826
+        # плоский baseline (MAD=0): масштаб от уровня, чтобы не делить на ноль
+        scale = np.maximum(np.nan_to_num(mad), np.maximum(np.abs(np.nan_to_num(med)) * 0.05, 1e-9))
+
+        # |z| считаем в float32 и на месте: это самая большая матрица (S x окно)
+        win = v[:, win_mask]
+        az = (win - med[:, None]).astype(np.float32)
+        az /= scale[:, None]
+        np.abs(az, out=az)
+        np.nan_to_num(az, copy=False, nan=0.0)
+        # устойчивость: минимум |z| по `persist` подряд идущим точкам, одиночные выбросы не считаются
+        width = az.shape[1] - persist + 1
+        sustained = az[:, :width].copy()
+        for k in range(1, persist):
+            np.minimum(sustained, az[:, k: k + width], out=sustained)
+        score = sustained.max(axis=1)
+
+    # дальше работаем только с кандидатами (top_n), а не со всеми сериями
+    top = np.argsort(-score)[:top_n]
+    top = top[score[top] > z_threshold]
+    if top.size == 0:
+        return []
+
+    over = sustained[top] > z_threshold
+    onset_idx = over.argmax(axis=1)
+    peak = win[top, az[top].argmax(axis=1)]
+    cp_idx = _change_points(np.where(np.isnan(v[top]), np.nan_to_num(med[top])[:, None], v[top]))
+
+    win_ts = m.ts[win_mask]
+    out: List[MetricAnomaly] = []
+    for j, i in enumerate(top):
+        out.append(
+            MetricAnomaly(
+                metric=m.names[i],
+                score=float(score[i]),
+                direction="up" if peak[j] >= med[i] else "down",
+                baseline=float(med[i]),
+                peak=float(peak[j]),
+                onset=float(win_ts[onset_idx[j]]),
+                change_point=float(m.ts[cp_idx[j]]),
+                keywords=metric_keywords(m.names[i]),
+            )
+        )
+    return out
+
+
+def ingest_metrics(paths: List[Path], *, time_window: Any = None, top_n: int = 20) -> MetricDigest:
+    d = MetricDigest()
+    t0 = time.perf_counter()
+    m = load_metrics(paths)
+    d.load_s = time.perf_counter() - t0
+    d.series, d.points = m.values.shape
+
+    t1 = time.perf_counter()
+    d.anomalies = detect_anomalies(m, window=parse_time_window(time_window), top_n=top_n)
+    d.detect_s = time.perf_counter() - t1
+
+    log.info(
+        "Ingested metrics: series=%d points=%d anomalies=%d (load %.2fs, detect %.3fs)",
+        d.series, d.points, len(d.anomalies), d.load_s, d.detect_s,
+    )
+    return d
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def attach_metric_digest(incident: Dict[str, Any], digest: MetricDigest, *, max_symptoms: int = 10) -> Dict[str, Any]:
+    """
+    Returns a copy of the incident with ranked anomalies ("metric_anomalies") and the top ones
+    folded into the flat "symptoms" dict.
+    """
+    out = dict(incident)
+    symptoms = dict(out.get("symptoms") or {})
+    for a in digest.anomalies[:max_symptoms]:
+        symptoms[a.metric] = (
+            f"{a.peak:g} ({a.direction}, baseline {a.baseline:g}, z={a.score:.1f}, onset {_iso(a.onset) or '?'})"
+        )
+    out["symptoms"] = symptoms
+    out["metric_anomalies"] = [
+        {
+            "metric": a.metric,
+            "score": round(a.score, 2),
+            "direction": a.direction,
+            "baseline": a.baseline,
+            "peak": a.peak,
+            "onset": _iso(a.onset),
+            "change_point": _iso(a.change_point),
+            "keywords": list(a.keywords),
+        }
+        for a in digest.anomalies
+    ]
+    return out
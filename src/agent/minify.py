@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import re
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Pattern
+
+from .analyzer import ContextItem
+
+
+# Строки оставляем как есть (внутри них могут быть "//" и "#"), комментарии вырезаем с сохранением переводов строк.
+_C_STRINGS = r'"""[\s\S]*?"""|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\''
+_BLOCK = r"/\*[\s\S]*?(?:\*/|$)"
+
+COMMENT_RES: Dict[str, Pattern[str]] = {
+    "java": re.compile(rf"{_C_STRINGS}|//[^\n]*|{_BLOCK}"),
+    "kotlin": re.compile(rf"{_C_STRINGS}|//[^\n]*|{_BLOCK}"),
+    "python": re.compile(r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|#[^\n]*'),
+    "sql": re.compile(rf"'(?:''|[^'])*'|--[^\n]*|{_BLOCK}"),
+    "terraform": re.compile(rf'"(?:\\.|[^"\\\n])*"|#[^\n]*|//[^\n]*|{_BLOCK}'),
+    "helm": re.compile(r'\{\{-?\s*/\*[\s\S]*?\*/\s*-?\}\}|"(?:\\.|[^"\\\n])*"|(?:^|(?<=\s))#[^\n]*', re.MULTILINE),
+    "yaml": re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\'\'|[^\'\n])*\'|(?:^|(?<=\s))#[^\n]*', re.MULTILINE),
+    "properties": re.compile(r"^[ \t]*[#!][^\n]*", re.MULTILINE),
+    "xml": re.compile(r"<!--[\s\S]*?(?:-->|$)"),
+}
+
+# строки, которые LLM не нужны: package/import
+SKIP_LINE_RES: Dict[str, Pattern[str]] = {
+    "java": re.compile(r"^\s*(?:package|import)\s+[\w.*]+\s*;?\s*$"),
+    "kotlin": re.compile(r"^\s*(?:package|import)\s+[\w.*`]+(?:\s+as\s+\w+)?\s*$"),
+    "python": re.compile(r"^\s*(?:import\s+\S|from\s+\S+\s+import\s)"),
+}
+
+# в этих форматах отступ — часть синтаксиса
+INDENT_SENSITIVE = {"python", "yaml", "helm", "markdown"}
+
+
+def _strip_comments(text: str, pattern: Pattern[str]) -> str:
+    def repl(m: "re.Match[str]") -> str:
+        s = m.group(0)
+        if s[0] in "\"'":
+            return s
+        # комментарий: оставляем только переводы строк, чтобы не сдвинуть нумерацию
+        return "\n" * s.count("\n")
+
+    return pattern.sub(repl, text)
+
+
+def _python_import_continuations(lines: List[str]) -> List[bool]:
+    """
+    Marks continuation lines of `from x import (\n a,\n b)` so they are dropped together with the import.
+    """
+    skip = [False] * len(lines)
+    open_import = False
+    for i, line in enumerate(lines):
+        if open_import:
+            skip[i] = True
+            if ")" in line:
+                open_import = False
+            continue
+        if SKIP_LINE_RES["python"].match(line) and "(" in line and ")" not in line:
+            open_import = True
+    return skip
+
+
+def minify_code(text: str, *, language: str, start_line: int) -> str:
+    """
+    Strips comments, package/import lines, blank lines and (where it is not syntax) indentation.
+    Every kept line is prefixed with its original line number ("143|...") so the report can still
+    cite `start-end` ranges of the source file.
+    """
+    pattern = COMMENT_RES.get(language)
+    body = _strip_comments(text, pattern) if pattern is not None else text
+    lines = body.split("\n")
+
+    skip_re: Optional[Pattern[str]] = SKIP_LINE_RES.get(language)
+    continuation = _python_import_continuations(lines) if language == "python" else [False] * len(lines)
+    keep_indent = language in INDENT_SENSITIVE
+
+    out: List[str] = []
+    for i, line in enumerate(lines):
+        line = line.rstrip()
+        if not line.strip() or continuation[i]:
+            continue
+        if skip_re is not None and skip_re.match(line):
+            continue
+        if not keep_indent:
+            line = line.lstrip()
+        out.append(f"{start_line + i}|{line}")
+    return "\n".join(out)
+
+
+def minify_context(item: ContextItem) -> ContextItem:
+    return replace(
+        item,
+        text=minify_code(item.text, language=item.language, start_line=item.start_line),
+        numbered=True,
+    )
+
+
+def minify_contexts(
+    items: List[ContextItem],
+    *,
+    count_tokens: Callable[[str], int],
+) -> tuple[List[ContextItem], int, int]:
+    """
+    Returns (minified items, tokens before, tokens after).
+    """
+    before = sum(count_tokens(it.text) for it in items)
+    out = [minify_context(it) for it in items]
+    after = sum(count_tokens(it.text) for it in out)
+    return out, before, after
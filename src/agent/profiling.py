@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, ContextManager, Dict, List, Optional
+
+
+# выключенный профайлер: span() отдаёт этот объект, count() сразу выходит — одна проверка глобала
+_NULL_SPAN: ContextManager[None] = nullcontext()
+_active: Optional["Profiler"] = None
+_stack = threading.local()
+
+_METRIC_RE = re.compile(r"[^a-zA-Z0-9_]+")
+
+
+@dataclass
+class SpanStat:
+    calls: int = 0
+    total_s: float = 0.0
+    max_s: float = 0.0
+
+
+class _Span:
+    __slots__ = ("_prof", "_name", "_key", "_t0")
+
+    def __init__(self, prof: "Profiler", name: str):
+        self._prof = prof
+        self._name = name
+
+    def __enter__(self) -> None:
+        names = getattr(_stack, "names", None)
+        if names is None:
+            names = _stack.names = []
+        names.append(self._name)
+        self._key = "/".join(names)
+        self._t0 = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        elapsed = time.perf_counter() - self._t0
+        _stack.names.pop()
+        self._prof.record(self._key, elapsed)
+
+
+class Profiler:
+    """
+    Aggregated wall-time spans and counters of one command. Spans nest per thread and are keyed by
+    their path ("analyze/retrieve/vector_search"); spans opened in worker threads start a new path.
+    """
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: Dict[str, SpanStat] = {}
+        self.counters: Dict[str, float] = {}
+
+    def record(self, key: str, elapsed_s: float) -> None:
+        with self._lock:
+            st = self.spans.get(key)
+            if st is None:
+                st = self.spans[key] = SpanStat()
+            st.calls += 1
+            st.total_s += elapsed_s
+            st.max_s = max(st.max_s, elapsed_s)
+
+    def add(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def report(self, *, command: str = "") -> Dict[str, Any]:
+        wall = time.perf_counter() - self._t0
+        with self._lock:
+            spans = {k: SpanStat(v.calls, v.total_s, v.max_s) for k, v in self.spans.items()}
+            counters = dict(self.counters)
+        rows: List[Dict[str, Any]] = []
+        for key in sorted(spans):
+            st = spans[key]
+            # self: время спана минус время его прямых детей
+            children = sum(v.total_s for k, v in spans.items() if k.startswith(key + "/") and "/" not in k[len(key) + 1:])
+            rows.append({
+                "span": key,
+                "calls": st.calls,
+                "total_ms": round(st.total_s * 1000.0, 3),
+                "self_ms": round(max(st.total_s - children, 0.0) * 1000.0, 3),
+                "mean_ms": round(st.total_s * 1000.0 / st.calls, 3),
+                "max_ms": round(st.max_s * 1000.0, 3),
+                "share": round(st.total_s / wall, 4) if wall > 0 else 0.0,
+            })
+        return {
+            "command": command,
+            "started_at": self.started_at,
+            "wall_ms": round(wall * 1000.0, 3),
+            "spans": rows,
+            "counters": {k: (int(v) if float(v).is_integer() else v) for k, v in sorted(counters.items())},
+        }
+
+    def write_json(self, path: Path, *, command: str = "") -> None:
+        _write_atomic(path, json.dumps(self.report(command=command), ensure_ascii=False, indent=2) + "\n")
+
+    def write_prometheus(self, path: Path, *, command: str = "") -> None:
+        """
+        node_exporter textfile-collector format: gauges of the last run, labelled by command and span.
+        """
+        rep = self.report(command=command)
+        cmd = _label(command)
+        out = [
+            "# HELP agent_last_run_timestamp_seconds Start of the last profiled run.",
+            "# TYPE agent_last_run_timestamp_seconds gauge",
+            f'agent_last_run_timestamp_seconds{{command="{cmd}"}} {rep["started_at"]:.3f}',
+            "# HELP agent_last_run_wall_seconds Wall time of the last profiled run.",
+            "# TYPE agent_last_run_wall_seconds gauge",
+            f'agent_last_run_wall_seconds{{command="{cmd}"}} {rep["wall_ms"] / 1000.0:.6f}',
+        ]
+        for metric, field, help_text in (
+            ("agent_span_seconds", "total_ms", "Wall time spent in the span during the last run."),
+            ("agent_span_self_seconds", "self_ms", "Span wall time not covered by its child spans."),
+            ("agent_span_max_seconds", "max_ms", "Longest single call of the span."),
+            ("agent_span_calls", "calls", "Calls of the span during the last run."),
+        ):
+            out += [f"# HELP {metric} {help_text}", f"# TYPE {metric} gauge"]
+            for r in rep["spans"]:
+                value = r[field] if field == "calls" else f"{r[field] / 1000.0:.6f}"
+                out.append(f'{metric}{{command="{cmd}",span="{_label(r["span"])}"}} {value}')
+        for name, value in rep["counters"].items():
+            metric = "agent_" + _METRIC_RE.sub("_", name).strip("_")
+            out += [f"# TYPE {metric} gauge", f'{metric}{{command="{cmd}"}} {value}']
+        _write_atomic(path, "\n".join(out) + "\n")
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    # textfile collector не должен прочитать полфайла
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def span(name: str) -> ContextManager[None]:
+    """
+    `with span("vector_search"): ...` — timed while profiling is on, a shared no-op otherwise.
+    """
+    prof = _active
+    if prof is None:
+        return _NULL_SPAN
+    return _Span(prof, name)
+
+
+def count(name: str, value: float = 1) -> None:
+    prof = _active
+    if prof is not None:
+        prof.add(name, value)
+
+
+def profiling_enabled() -> bool:
+    return _active is not None
+
+
+def start_profiling() -> Profiler:
+    global _active
+    _active = Profiler()
+    return _active
+
+
+def stop_profiling() -> Optional[Profiler]:
+    global _active
+    prof, _active = _active, None
+    return prof
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List
+import json
+from typing import Any, Dict, List, Optional
 
 
 SYSTEM_PROMPT = """Ты — ведущий инженер по производительности и надежности (SRE / Performance Engineer).
@@ -20,11 +21,36 @@ SYSTEM_PROMPT = """Ты — ведущий инженер по производ
 """
 
 
-def build_user_prompt(*, incident: Dict[str, Any], contexts: List[Dict[str, Any]]) -> str:
+NUMBERED_CONTEXT_NOTE = (
+    "Строки фрагментов имеют вид `N|код`, где N — номер строки в исходном файле "
+    "(комментарии, импорты и пустые строки удалены). Ссылайся на строки по этим номерам.\n"
+)
+
+
+def build_config_section(facts: List[Dict[str, Any]]) -> str:
+    if not facts:
+        return ""
+    return (
+        "КОНФИГУРАЦИЯ (точные значения ключей из файлов репозитория, `путь:строка ключ = значение`; "
+        "в evidence указывай этот путь и строку):\n"
+        + "\n".join(f"{f['path']}:{f['line']} {f['key']} = {f['value']}" for f in facts)
+        + "\n\n"
+    )
+
+
+def build_user_prompt(
+    *,
+    incident: Dict[str, Any],
+    contexts: List[Dict[str, Any]],
+    config_facts: Optional[List[Dict[str, Any]]] = None,
+) -> str:
+    numbered = any(c.get("numbered") for c in contexts)
     return (
         "ИНЦИДЕНТ (JSON):\n"
-        f"{incident}\n\n"
-        "КОНТЕКСТ (фрагменты кода и конфигурации — это единственный источник истины):\n"
+        f"{json.dumps(incident, ensure_ascii=False, separators=(',', ':'), default=str)}\n\n"
+        + build_config_section(config_facts or [])
+        + "КОНТЕКСТ (фрагменты кода и конфигурации — это единственный источник истины):\n"
+        + (NUMBERED_CONTEXT_NOTE if numbered else "")
         + "\n\n".join(
             [
                 (
@@ -66,3 +92,21 @@ def build_user_prompt(*, incident: Dict[str, Any], contexts: List[Dict[str, Any]
         '  "missing_data": ["каких данных не хватает для уверенного вывода"]\n'
         "}\n"
     )
+
+
+def build_reduce_prompt(*, incident: Dict[str, Any], merged: Dict[str, Any], shards: int) -> str:
+    return (
+        "ИНЦИДЕНТ (JSON):\n"
+        f"{json.dumps(incident, ensure_ascii=False, separators=(',', ':'), default=str)}\n\n"
+        f"ЧАСТИЧНЫЕ ОТЧЁТЫ: контекст не поместился в одно окно, поэтому его разбили на {shards} частей "
+        "и проанализировали каждую отдельно. Ниже — их гипотезы, hotspots и проверки, уже сведённые вместе (JSON):\n"
+        f"{json.dumps(merged, ensure_ascii=False, separators=(',', ':'), default=str)}\n\n"
+        "ЗАДАЧА:\n"
+        "1) Объедини гипотезы, описывающие одну и ту же причину, в одну; evidence и fixes объединённых гипотез сохрани.\n"
+        "2) Убери дубликаты hotspots и checks.\n"
+        "3) Пересчитай confidence с учётом всех частей и упорядочи гипотезы по убыванию confidence.\n"
+        "4) Напиши общее summary и classification.\n"
+        "5) Используй ТОЛЬКО evidence (пути и строки) из частичных отчётов — новых не добавляй.\n\n"
+        "ФОРМАТ ОТВЕТА (СТРОГО JSON): та же схема, что у частичных отчётов — "
+        '"summary", "classification", "hypotheses", "hotspots", "checks", "missing_data".\n'
+    )
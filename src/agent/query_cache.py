@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+SCHEMA_SQL = """
+PRAGMA journal_mode=WAL;
+
+CREATE TABLE IF NOT EXISTS cache_meta (
+  k TEXT PRIMARY KEY,
+  v TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS query_vectors (
+  key TEXT PRIMARY KEY,
+  vector BLOB NOT NULL,
+  last_used REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS retrieval_results (
+  key TEXT PRIMARY KEY,
+  results TEXT NOT NULL,
+  last_used REAL NOT NULL
+);
+"""
+
+
+def normalize_query_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def index_version(index_dir: Path) -> str:
+    """
+    Версия индекса = хэш index_meta.json: любая переиндексация перезаписывает meta и инвалидирует кэш.
+    """
+    meta = index_dir / "index_meta.json"
+    try:
+        return hashlib.sha1(meta.read_bytes()).hexdigest()
+    except OSError:
+        return "no-meta"
+
+
+@dataclass
+class QueryCache:
+    """
+    On-disk LRU cache of query vectors and ranked retrieval results, stored next to the index.
+    Keys include the index version and the embedding model, so a rebuilt index never serves stale hits.
+    """
+
+    db_path: Path
+    version: str
+    model_name: str
+    max_entries: int = 256
+
+    # по таблицам: промах по результатам почти всегда влечёт обращение к векторам
+    hits: Dict[str, int] = field(default_factory=lambda: {"results": 0, "vectors": 0}, init=False)
+    misses: Dict[str, int] = field(default_factory=lambda: {"results": 0, "vectors": 0}, init=False)
+
+    @classmethod
+    def for_index(cls, index_dir: Path, *, model_name: str, max_entries: int) -> "QueryCache":
+        cache = cls(
+            db_path=index_dir / "query_cache.sqlite",
+            version=index_version(index_dir),
+            model_name=model_name,
+            max_entries=max_entries,
+        )
+        cache.init()
+        return cache
+
+    def connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path))
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as conn:
+            conn.executescript(SCHEMA_SQL)
+            row = conn.execute("SELECT v FROM cache_meta WHERE k='index_version'").fetchone()
+            if row is None or row["v"] != self.version:
+                conn.execute("DELETE FROM query_vectors")
+                conn.execute("DELETE FROM retrieval_results")
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_meta(k, v) VALUES ('index_version', ?)",
+                    (self.version,),
+                )
+
+    def _key(self, query_text: str, params: Dict[str, Any]) -> str:
+        raw = json.dumps(
+            [self.version, self.model_name, normalize_query_text(query_text), params],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _get(self, table: str, column: str, key: str, *, stat: str) -> Optional[Any]:
+        with self.connect() as conn:
+            row = conn.execute(f"SELECT {column} FROM {table} WHERE key=?", (key,)).fetchone()
+            if row is None:
+                self.misses[stat] += 1
+                return None
+            conn.execute(f"UPDATE {table} SET last_used=? WHERE key=?", (time.time(), key))
+            self.hits[stat] += 1
+            return row[column]
+
+    def _put(self, table: str, column: str, key: str, value: Any) -> None:
+        with self.connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {table}(key, {column}, last_used) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            # LRU eviction
+            conn.execute(
+                f"""
+                DELETE FROM {table} WHERE key IN (
+                  SELECT key FROM {table} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def get_vector(self, query_text: str) -> Optional[List[float]]:
+        blob = self._get("query_vectors", "vector", self._key(query_text, {}), stat="vectors")
+        if blob is None:
+            return None
+        return array("f", blob).tolist()
+
+    def put_vector(self, query_text: str, vector: List[float]) -> None:
+        self._put("query_vectors", "vector", self._key(query_text, {}), array("f", vector).tobytes())
+
+    def get_results(self, query_text: str, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        raw = self._get("retrieval_results", "results", self._key(query_text, params), stat="results")
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    def put_results(self, query_text: str, params: Dict[str, Any], results: List[Dict[str, Any]]) -> None:
+        self._put("retrieval_results", "results", self._key(query_text, params), json.dumps(results))
@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .vectordb_numpy import REDUCED_FILE, NumpyVectorDB
+from .vectordb_qdrant import VectorHit, VectorIndex
+
+
+log = logging.getLogger("agent")
+
+_BLOCK_ROWS = 65536
+
+
+@dataclass(frozen=True)
+class Projection:
+    """
+    Linear map full-dim -> search-dim, followed by L2 normalization.
+    "pca": top eigenvectors of the uncentered second-moment matrix, which best preserve dot products
+    (centering would change cosine ranking). "truncate": first `dim` coordinates (Matryoshka models only).
+    """
+
+    method: str
+    matrix: np.ndarray              # (full_dim, dim) float32
+
+    @property
+    def dim(self) -> int:
+        return int(self.matrix.shape[1])
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        out = np.asarray(vectors, dtype=np.float32) @ self.matrix
+        out /= np.linalg.norm(out, axis=-1, keepdims=True) + 1e-12
+        return out
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp, method=np.array(self.method), matrix=self.matrix)
+        tmp.replace(path)
+
+
+def load_projection(path: Path) -> Optional[Projection]:
+    if not path.exists():
+        return None
+    with np.load(path) as z:
+        return Projection(method=str(z["method"]), matrix=z["matrix"].astype(np.float32))
+
+
+def fit_projection(vectors: np.ndarray, *, method: str, dim: int, sample: int, seed: int = 0) -> Projection:
+    full_dim = int(vectors.shape[1])
+    if not 0 < dim < full_dim:
+        raise ValueError(f"reduced dim must be in 1..{full_dim - 1}, got {dim}")
+    if method == "truncate":
+        return Projection(method=method, matrix=np.eye(full_dim, dim, dtype=np.float32))
+    if method != "pca":
+        raise ValueError(f"unknown reduction method {method!r} (pca | truncate)")
+
+    n = int(vectors.shape[0])
+    rows = np.sort(np.random.default_rng(seed).choice(n, size=min(n, sample), replace=False))
+    x = np.asarray(vectors[rows], dtype=np.float64)
+    eigval, eigvec = np.linalg.eigh(x.T @ x)          # по возрастанию
+    top = np.argsort(eigval)[::-1][:dim]
+    kept = float(eigval[top].sum() / max(eigval.sum(), 1e-12))
+    log.info("PCA %d -> %d on %d vectors: %.1f%% of energy kept", full_dim, dim, len(rows), 100.0 * kept)
+    return Projection(method=method, matrix=eigvec[:, top].astype(np.float32))
+
+
+def write_reduced(snapshot_dir: Path, vectors: np.ndarray, projection: Projection) -> None:
+    out = np.lib.format.open_memmap(
+        snapshot_dir / REDUCED_FILE, mode="w+", dtype=np.float32, shape=(vectors.shape[0], projection.dim),
+    )
+    for s in range(0, vectors.shape[0], _BLOCK_ROWS):
+        out[s:s + _BLOCK_ROWS] = projection.apply(vectors[s:s + _BLOCK_ROWS])
+    out.flush()
+    del out
+
+
+def _topk_rows(vectors: np.ndarray, queries: np.ndarray, k: int, *, projection: Optional[Projection], exclude: np.ndarray) -> np.ndarray:
+    # блоками по строкам: матрица сходств N x Q целиком не материализуется
+    q = projection.apply(queries) if projection is not None else queries
+    best_s = np.full((len(q), 0), -np.inf, dtype=np.float32)
+    best_i = np.zeros((len(q), 0), dtype=np.int64)
+    for s in range(0, vectors.shape[0], _BLOCK_ROWS):
+        block = np.asarray(vectors[s:s + _BLOCK_ROWS], dtype=np.float32)
+        if projection is not None:
+            block = projection.apply(block)
+        scores = q @ block.T
+        idx = np.arange(s, s + block.shape[0])
+        scores[idx[None, :] == exclude[:, None]] = -np.inf      # сам себя запрос не находит
+        all_s = np.concatenate([best_s, scores], axis=1)
+        all_i = np.concatenate([best_i, np.broadcast_to(idx, scores.shape)], axis=1)
+        if all_s.shape[1] > k:
+            part = np.argpartition(-all_s, k - 1, axis=1)[:, :k]
+            all_s, all_i = np.take_along_axis(all_s, part, 1), np.take_along_axis(all_i, part, 1)
+        best_s, best_i = all_s, all_i
+    return best_i
+
+
+def measure_recall(
+    vectors: np.ndarray,
+    projection: Projection,
+    *,
+    k: int = 10,
+    prefetch: int = 80,
+    queries: int = 100,
+    seed: int = 1,
+) -> Dict[str, Any]:
+    """
+    Recall@k of reduced search against exact full-dim search, with stored chunks as queries (self-match
+    excluded): plain, and after an exact rescore of the reduced top-`prefetch` (what queries do).
+    """
+    n = int(vectors.shape[0])
+    k, prefetch = min(k, n - 1), min(prefetch, n - 1)
+    if k <= 0:
+        return {}
+    qi = np.sort(np.random.default_rng(seed).choice(n, size=min(n, queries), replace=False))
+    qv = np.asarray(vectors[qi], dtype=np.float32)
+    exact = _topk_rows(vectors, qv, k, projection=None, exclude=qi)
+    cand = _topk_rows(vectors, qv, prefetch, projection=projection, exclude=qi)
+
+    plain = rescored = 0.0
+    for j in range(len(qi)):
+        truth = set(exact[j].tolist())
+        c = cand[j]
+        red_scores = projection.apply(np.asarray(vectors[c], dtype=np.float32)) @ projection.apply(qv[j])
+        plain += len(truth & set(c[np.argsort(-red_scores)[:k]].tolist())) / k
+        full_scores = np.asarray(vectors[c], dtype=np.float32) @ qv[j]
+        rescored += len(truth & set(c[np.argsort(-full_scores)[:k]].tolist())) / k
+    return {
+        "k": k,
+        "prefetch": prefetch,
+        "queries": len(qi),
+        "recall": round(plain / len(qi), 4),
+        "recall_rescored": round(rescored / len(qi), 4),
+    }
+
+
+class ReducedVectorDB:
+    """
+    Search over reduced vectors: the full-dim query is projected, and with `full` set the prefetch set
+    is re-scored by exact full-dim cosine from the generation's snapshot, so scores match the unreduced index.
+    """
+
+    def __init__(self, inner: VectorIndex, *, projection: Projection, full: Optional[NumpyVectorDB] = None):
+        self.inner = inner
+        self.projection = projection
+        self.full = full
+
+    def count(self) -> int:
+        return self.inner.count()
+
+    def cache_params(self) -> Dict[str, Any]:
+        return {
+            **self.inner.cache_params(),
+            "reduce": self.projection.method,
+            "reduced_dim": self.projection.dim,
+            "rescore": self.full is not None,
+        }
+
+    def close(self) -> None:
+        self.inner.close()
+        if self.full is not None:
+            self.full.close()
+
+    def search(self, *, query_vector: List[float], top_k: int) -> List[VectorHit]:
+        q = np.asarray(query_vector, dtype=np.float32)
+        hits = self.inner.search(query_vector=self.projection.apply(q).tolist(), top_k=top_k)
+        if self.full is None or not hits:
+            return hits
+        q /= np.linalg.norm(q) + 1e-12
+        scores = self.full.vectors_for([h.chunk_id for h in hits]) @ q
+        rescored = [VectorHit(score=float(s), chunk_id=h.chunk_id, payload=h.payload) for h, s in zip(hits, scores)]
+        rescored.sort(key=lambda h: h.score, reverse=True)
+        return rescored
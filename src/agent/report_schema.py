@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import json
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 
 def extract_json_from_text(text: str) -> Dict[str, Any]:
@@ -37,3 +37,142 @@ def validate_report(report: Dict[str, Any]) -> None:
         raise ValueError("hotspots must be a list")
     if not isinstance(report["checks"], list):
         raise ValueError("checks must be a list")
+
+
+REPORT_LIST_FIELDS = ("hypotheses", "hotspots", "checks", "missing_data")
+
+
+class IncrementalReportParser:
+    """
+    Потоковый разбор отчёта по мере прихода токенов: feed() возвращает гипотезы,
+    чей объект в массиве "hypotheses" только что закрылся. Состояние сканера (глубина,
+    строка/escape) переносится между чанками, поэтому каждый символ просматривается один раз.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.hypotheses: List[Dict[str, Any]] = []
+        self._pos = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = -1
+        self._last_string = ""
+        self._key = ""                              # последний ключ верхнего уровня
+        self._stack: List[Tuple[str, str]] = []     # (открывающая скобка, ключ верхнего уровня)
+        self._item_start = -1
+        # точки, где текст можно обрезать и закрыть скобками: (позиция, закрывающие скобки)
+        self._safe: List[Tuple[int, str]] = []
+
+    def _closers(self) -> str:
+        return "".join("}" if b == "{" else "]" for b, _ in reversed(self._stack))
+
+    def _in_hypotheses(self) -> bool:
+        return len(self._stack) == 2 and self._stack[1] == ("[", "hypotheses")
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        self.text += chunk
+        text = self.text
+        new: List[Dict[str, Any]] = []
+        i = self._pos
+        n = len(text)
+        while i < n:
+            ch = text[i]
+            if not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append(("{", ""))
+                    self._safe.append((i + 1, self._closers()))
+                i += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = text[self._string_start + 1:i]
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and len(self._stack) == 1:
+                self._key = self._last_string
+            elif ch in "{[":
+                if ch == "{" and self._in_hypotheses():
+                    self._item_start = i
+                self._stack.append((ch, self._key if len(self._stack) == 1 else self._stack[-1][1]))
+                self._safe.append((i + 1, self._closers()))
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._in_hypotheses() and self._item_start >= 0:
+                    try:
+                        item = json.loads(text[self._item_start:i + 1])
+                    except ValueError:
+                        item = None
+                    if isinstance(item, dict):
+                        self.hypotheses.append(item)
+                        new.append(item)
+                    self._item_start = -1
+                if not self._stack:
+                    self._pos = n
+                    return new
+                self._safe.append((i + 1, self._closers()))
+            elif ch == ",":
+                self._safe.append((i, self._closers()))
+            i += 1
+        self._pos = n
+        return new
+
+    def repair(self) -> Optional[Dict[str, Any]]:
+        """
+        Оборванный JSON: закрываем открытую строку и скобки; если не парсится —
+        откатываемся к последней безопасной точке (после целого значения). None — спасать нечего.
+        """
+        if not self._started:
+            return None
+        tail = self.text
+        if self._in_string:
+            tail = tail[:-1] if self._escape else tail
+            tail += '"'
+        candidates = [tail + self._closers()] + [self.text[:pos] + closers for pos, closers in reversed(self._safe)]
+        for cand in candidates:
+            start = cand.find("{")
+            try:
+                obj = json.loads(cand[start:])
+            except ValueError:
+                continue
+            if isinstance(obj, dict):
+                return obj
+        return None
+
+    def result(self) -> Tuple[Dict[str, Any], bool]:
+        """
+        (отчёт, partial). Целый ответ разбираем как раньше; оборванный — чиним и
+        дополняем недостающие поля, чтобы полученные гипотезы не терялись. В partial-отчёт
+        идут только гипотезы, чей объект закрылся: оборванная последняя (без confidence/evidence) отбрасывается.
+        """
+        try:
+            report = extract_json_from_text(self.text)
+            validate_report(report)
+            return report, False
+        except ValueError:
+            pass
+
+        report = self.repair() or {}
+        if not report and not self.hypotheses:
+            raise ValueError("No JSON object found in LLM response")
+        report["hypotheses"] = list(self.hypotheses)
+        report.setdefault("summary", "")
+        report.setdefault("classification", {})
+        for k in REPORT_LIST_FIELDS:
+            if not isinstance(report.get(k), list):
+                report[k] = []
+        report["partial"] = True
+        validate_report(report)
+        return report, True
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class RerankStats:
+    candidates: int
+    scored: int
+    elapsed_ms: float
+    exhausted: bool     # бюджет закончился раньше, чем все кандидаты получили оценку
+
+
+@dataclass
+class CrossEncoderReranker:
+    """
+    Second rerank stage: a small ONNX cross-encoder via fastembed (same onnxruntime, CPU-only).
+    Scores the top-N heuristic candidates in batches within a per-query time budget;
+    whatever is left unscored keeps the heuristic order.
+    """
+
+    model_name: str
+    batch_size: int = 8
+    max_query_chars: int = 1000
+    max_doc_chars: int = 2000
+
+    _model: Any = None
+    # оценка стоимости одного документа (EMA), чтобы не выходить за бюджет
+    _ms_per_doc: Optional[float] = None
+
+    def _ensure_model(self) -> Any:
+        if self._model is None:
+            from fastembed.rerank.cross_encoder import TextCrossEncoder  # импортируем лениво
+            model = TextCrossEncoder(model_name=self.model_name)
+            # первый inference медленный (выделение памяти, оптимизация графа): прогреваем вне бюджета запроса,
+            # чтобы он не попал ни в первый батч, ни в оценку стоимости документа
+            list(model.rerank("warmup", ["warmup"], batch_size=1))
+            self._model = model
+        return self._model
+
+    def score(self, query: str, docs: List[str]) -> List[float]:
+        model = self._ensure_model()
+        q = query[: self.max_query_chars]
+        return [float(s) for s in model.rerank(q, [d[: self.max_doc_chars] for d in docs], batch_size=len(docs))]
+
+    def _next_batch_size(self, remaining_ms: float) -> int:
+        if self._ms_per_doc is None:
+            # оценки ещё нет: один документ, дальше бюджет сверяется с его замером
+            return 1
+        return min(self.batch_size, int(remaining_ms // max(self._ms_per_doc, 1e-3)))
+
+    def rerank(self, query: str, docs: List[str], *, budget_ms: float) -> Tuple[List[int], List[Optional[float]], RerankStats]:
+        """
+        Returns (order, scores, stats): `order` is a permutation of range(len(docs)) where the scored
+        prefix is sorted by cross-encoder score and the rest stays in the input (heuristic) order.
+        """
+        self._ensure_model()    # загрузка модели не входит в бюджет запроса
+
+        scores: List[Optional[float]] = [None] * len(docs)
+        t0 = time.perf_counter()
+        done = 0
+        while done < len(docs):
+            remaining = budget_ms - (time.perf_counter() - t0) * 1000.0
+            if remaining <= 0:
+                break
+            bs = min(self._next_batch_size(remaining), len(docs) - done)
+            if bs <= 0:
+                break
+
+            tb = time.perf_counter()
+            batch_scores = self.score(query, docs[done:done + bs])
+            per_doc = (time.perf_counter() - tb) * 1000.0 / bs
+            self._ms_per_doc = per_doc if self._ms_per_doc is None else 0.7 * self._ms_per_doc + 0.3 * per_doc
+
+            scores[done:done + bs] = batch_scores
+            done += bs
+
+        scored = sorted(range(done), key=lambda i: scores[i], reverse=True)
+        order = scored + list(range(done, len(docs)))
+        stats = RerankStats(
+            candidates=len(docs),
+            scored=done,
+            elapsed_ms=(time.perf_counter() - t0) * 1000.0,
+            exhausted=done < len(docs),
+        )
+        return order, scores, stats
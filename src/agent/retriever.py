@@ -1,12 +1,20 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, Dict, List, Protocol
+import logging
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Protocol, Sequence
 
 from .chunking import Chunk
+from .config_index import ConfigFact, query_terms
+from .profiling import count, span
+from .query_cache import QueryCache
+from .reranker_onnx import CrossEncoderReranker
 from .store_sqlite import SQLiteStore
-from .vectordb_qdrant import QdrantVectorDB, VectorHit
-from .signals import extract_signals, score_chunk_text, path_penalty
+from .vectordb_qdrant import VectorHit, VectorIndex
+from .signals import FrameLocation, extract_signals, path_penalty, score_chunk_text, score_chunk_tokens, signal_tokens
+
+
+log = logging.getLogger("agent")
 
 
 def incident_to_query_text(incident: Dict[str, Any]) -> str:
@@ -26,22 +34,61 @@ def incident_to_query_text(incident: Dict[str, Any]) -> str:
         for line in logs[:40]:
             parts.append(str(line))
 
+    # из streaming-ingest логов (log_ingest.attach_log_digest): шаблоны по частоте + строки с сигналами
+    templates = incident.get("log_templates", [])
+    if isinstance(templates, list):
+        for t in templates[:40]:
+            parts.append(str(t.get("template", "")) if isinstance(t, dict) else str(t))
+
+    signal_lines = incident.get("log_signal_lines", [])
+    if isinstance(signal_lines, list):
+        for line in signal_lines[:60]:
+            parts.append(str(line))
+
     traces = incident.get("traces", {})
     if isinstance(traces, dict):
         spans = traces.get("top_spans", [])
         if isinstance(spans, list):
             for s in spans[:30]:
                 parts.append(str(s))
+        # из trace_ingest.attach_trace_digest
+        for k in ("critical_path", "endpoints"):
+            items = traces.get(k, [])
+            if isinstance(items, list):
+                for s in items[:15]:
+                    parts.append(str(s))
+
+    # из metric_ingest.attach_metric_digest: имена аномальных метрик + ключевые слова для extract_signals
+    anomalies = incident.get("metric_anomalies", [])
+    if isinstance(anomalies, list):
+        for a in anomalies[:20]:
+            if isinstance(a, dict):
+                parts.append(" ".join([str(a.get("metric", ""))] + [str(k) for k in a.get("keywords", [])]))
 
     return "\n".join(parts)
 
 
+def find_config_facts(store: SQLiteStore, incident: Dict[str, Any], *, limit: int = 30) -> List[ConfigFact]:
+    """
+    Exact config keys (timeouts, pool sizes, retries...) matching the incident keywords, from the config_keys table.
+    """
+    if not store.has_table("config_keys"):
+        # индекс, собранный до появления таблицы ключей
+        return []
+    terms = query_terms(extract_signals(incident_to_query_text(incident)))
+    return store.find_config_facts(terms, limit=limit)
+
+
 @dataclass(frozen=True)
 class RetrievedChunk:
     score: float
     chunk: Chunk
     base_score: float
     rerank_score: float
+    # chunk resolved directly from a stack frame (file:line), not from vector search
+    pinned: bool = False
+    # cross-encoder score (второй этап rerank), если кандидат успел получить оценку в бюджете
+    ce_score: Optional[float] = None
 
 
 class EmbeddingsProvider(Protocol):
@@ -62,38 +109,230 @@ def _dedup_per_file(items: List[RetrievedChunk], max_per_file: int) -> List[Retr
     return out
 
 
+def _frame_paths(store: SQLiteStore, loc: FrameLocation) -> List[str]:
+    paths = store.find_symbol_paths(loc.fqcn)
+    if paths:
+        return paths
+
+    # нет fqcn (например, Kotlin top-level функции) — по имени файла, предпочитая путь с пакетом
+    paths = store.find_symbol_paths(loc.file)
+    pkg_dir = "/".join(loc.fqcn.split(".")[:-1])
+    in_pkg = [p for p in paths if f"{pkg_dir}/{loc.file}" in p]
+    return in_pkg or paths
+
+
+def resolve_frame_chunks(store: SQLiteStore, locations: Sequence[FrameLocation], *, limit: int) -> List[Chunk]:
+    """
+    Stack frames -> chunks covering the frame line, via the file_symbols table. No vector search involved.
+    """
+    out: List[Chunk] = []
+    seen: set[int] = set()
+    for loc in locations:
+        if len(out) >= limit:
+            break
+        for path in _frame_paths(store, loc)[:1]:
+            chunk = store.find_chunk_at_line(path, loc.line)
+            if chunk and chunk.chunk_id not in seen:
+                seen.add(chunk.chunk_id)
+                out.append(chunk)
+    return out
+
+
+def embed_query(embedder: EmbeddingsProvider, query_text: str, cache: Optional[QueryCache] = None) -> List[float]:
+    if cache is not None:
+        qv = cache.get_vector(query_text)
+        if qv is not None:
+            return qv
+    with span("query_embed"):
+        qv = embedder.embed_texts([query_text])[0]
+    count("query_embeds")
+    if cache is not None:
+        cache.put_vector(query_text, qv)
+    return qv
+
+
+def embed_queries(
+    embedder: EmbeddingsProvider,
+    query_texts: List[str],
+    cache: Optional[QueryCache] = None,
+) -> List[List[float]]:
+    """
+    Batched embed_query: cached vectors are reused, the rest go to the model in one embed_texts call.
+    """
+    out: List[Optional[List[float]]] = [
+        cache.get_vector(t) if cache is not None else None for t in query_texts
+    ]
+    missing = [i for i, v in enumerate(out) if v is None]
+    if missing:
+        with span("query_embed"):
+            vecs = embedder.embed_texts([query_texts[i] for i in missing])
+        count("query_embeds", len(missing))
+        for i, v in zip(missing, vecs):
+            out[i] = v
+            if cache is not None:
+                cache.put_vector(query_texts[i], v)
+    return [v for v in out if v is not None]
+
+
+def _results_from_cache(store: SQLiteStore, cached: List[Dict[str, Any]]) -> Optional[List[RetrievedChunk]]:
+    chunks = store.get_chunks(r["chunk_id"] for r in cached)
+    if len(chunks) != len({r["chunk_id"] for r in cached}):
+        return None
+    return [
+        RetrievedChunk(
+            score=r["score"],
+            base_score=r["base"],
+            rerank_score=r["rr"],
+            chunk=chunks[r["chunk_id"]],
+            pinned=r["pinned"],
+            ce_score=r.get("ce"),
+        )
+        for r in cached
+    ]
+
+
+def _results_to_cache(results: List[RetrievedChunk]) -> List[Dict[str, Any]]:
+    return [
+        {"chunk_id": r.chunk.chunk_id, "score": r.score, "base": r.base_score, "rr": r.rerank_score, "pinned": r.pinned,
+         "ce": r.ce_score}
+        for r in results
+    ]
+
+
 def retrieve_topk(
     *,
-    vectordb: QdrantVectorDB,
+    vectordb: VectorIndex,
     store: SQLiteStore,
     embedder: EmbeddingsProvider,
     incident: Dict[str, Any],
     top_k: int = 12,
     prefetch_k: int = 80,
     max_per_file: int = 2,
+    token_candidates_k: int = 20,
+    max_pinned: int = 4,
+    cache: Optional[QueryCache] = None,
+    reranker: Optional[CrossEncoderReranker] = None,
+    rerank_top_n: int = 30,
+    rerank_budget_ms: float = 0.0,
+    query_vector: Optional[List[float]] = None,
 ) -> List[RetrievedChunk]:
+    """
+    `query_vector` — precomputed embedding of incident_to_query_text(incident) (see embed_queries).
+    """
     query_text = incident_to_query_text(incident)
+
+    params = {
+        **vectordb.cache_params(),
+        "top_k": top_k,
+        "prefetch_k": prefetch_k,
+        "max_per_file": max_per_file,
+        "token_candidates_k": token_candidates_k,
+        "max_pinned": max_pinned,
+    }
+    use_ce = reranker is not None and rerank_budget_ms > 0 and rerank_top_n > 0
+    if use_ce:
+        params.update(rerank_model=reranker.model_name, rerank_top_n=rerank_top_n, rerank_budget_ms=rerank_budget_ms)
+    if cache is not None:
+        cached = cache.get_results(query_text, params)
+        if cached is not None:
+            with span("chunk_fetch"):
+                results = _results_from_cache(store, cached)
+            if results is not None:
+                count("retrieve_cache_hits")
+                return results
+
     signals = extract_signals(query_text)
 
-    qv = embedder.embed_texts([query_text])[0]
-    hits: List[VectorHit] = vectordb.search(query_vector=qv, top_k=prefetch_k)
+    qv = query_vector if query_vector is not None else embed_query(embedder, query_text, cache)
+    with span("vector_search"):
+        hits: List[VectorHit] = vectordb.search(query_vector=qv, top_k=prefetch_k)
+    base_scores: Dict[int, float] = {h.chunk_id: float(h.score) for h in hits}
 
-    candidates: List[RetrievedChunk] = []
-    for h in hits:
-        chunk = store.get_chunk(h.chunk_id)
-        if not chunk:
-            continue
+    # индексы без таблицы chunk_tokens (собранные до inverted index) — rerank по тексту
+    use_tokens = store.has_table("chunk_tokens")
+    wanted = signal_tokens(signals)
+
+    pinned_ids: List[int] = []
+    if signals.locations and max_pinned > 0 and store.has_table("file_symbols"):
+        with span("frame_lookup"):
+            for chunk in resolve_frame_chunks(store, signals.locations, limit=min(max_pinned, top_k)):
+                pinned_ids.append(chunk.chunk_id)
+                base_scores.setdefault(chunk.chunk_id, 0.0)
+
+    # inverted index как генератор кандидатов: чанки с точными совпадениями сигналов, которых нет в vector hits
+    if use_tokens and token_candidates_k > 0:
+        generator_tokens = {t for t in wanted if t[0] != "method"}
+        with span("token_candidates"):
+            for cid, _ in store.find_chunks_by_tokens(generator_tokens, limit=token_candidates_k):
+                base_scores.setdefault(cid, 0.0)
+
+    with span("chunk_fetch"):
+        chunks = store.get_chunks(base_scores.keys())
+        tokens = store.get_chunk_tokens(chunks.keys()) if use_tokens else {}
+    count("chunks_fetched", len(chunks))
 
-        rr = score_chunk_text(chunk.text, signals) + path_penalty(chunk.path)
-        candidates.append(
-            RetrievedChunk(
-                score=float(h.score) + rr,
-                base_score=float(h.score),
+    with span("rerank"):
+        pinned: List[RetrievedChunk] = []
+        candidates: List[RetrievedChunk] = []
+        for cid, base in base_scores.items():
+            chunk = chunks.get(cid)
+            if not chunk:
+                continue
+
+            if use_tokens:
+                rr = score_chunk_tokens(tokens.get(cid, set()), wanted)
+            else:
+                rr = score_chunk_text(chunk.text, signals)
+            rr += path_penalty(chunk.path)
+            item = RetrievedChunk(
+                score=base + rr,
+                base_score=base,
                 rerank_score=float(rr),
                 chunk=chunk,
+                pinned=cid in pinned_ids,
             )
-        )
+            (pinned if item.pinned else candidates).append(item)
+
+        # pinned — в порядке stack trace, сверху; остальные места по score
+        pinned.sort(key=lambda x: pinned_ids.index(x.chunk.chunk_id))
+        candidates.sort(key=lambda x: x.score, reverse=True)
+        candidates = _dedup_per_file(pinned + candidates, max_per_file=max_per_file)
+
+    complete = True
+    if use_ce:
+        with span("rerank_ce"):
+            candidates, complete = _cross_encoder_stage(
+                candidates, query_text, reranker, top_n=rerank_top_n, budget_ms=rerank_budget_ms,
+            )
+    results = candidates[:top_k]
+
+    # частично оценённый (бюджет кончился) результат недетерминирован — не кэшируем
+    if cache is not None and complete:
+        cache.put_results(query_text, params, _results_to_cache(results))
+    return results
+
+
+def _cross_encoder_stage(
+    items: List[RetrievedChunk],
+    query_text: str,
+    reranker: CrossEncoderReranker,
+    *,
+    top_n: int,
+    budget_ms: float,
+) -> tuple[List[RetrievedChunk], bool]:
+    pinned = [it for it in items if it.pinned]
+    rest = [it for it in items if not it.pinned]
+    head, tail = rest[:top_n], rest[top_n:]
+    if not head:
+        return items, True
+
+    docs = [f"{it.chunk.path}\n{it.chunk.text}" for it in head]
+    order, scores, stats = reranker.rerank(query_text, docs, budget_ms=budget_ms)
+    log.info(
+        "Cross-encoder rerank: scored %d / %d in %.1f ms (budget %.0f ms%s)",
+        stats.scored, stats.candidates, stats.elapsed_ms, budget_ms,
+        ", exhausted -> heuristic order for the rest" if stats.exhausted else "",
+    )
 
-    candidates.sort(key=lambda x: x.score, reverse=True)
-    candidates = _dedup_per_file(candidates, max_per_file=max_per_file)
-    return candidates[:top_k]
+    reranked = [replace(head[i], ce_score=scores[i]) for i in order]
+    return pinned + reranked + tail, not stats.exhausted
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import asyncio
+import http.client
+import json
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+log = logging.getLogger("agent")
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+Routes = Dict[Tuple[str, str], Handler]       # (method, path) -> handler
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_address(addr: str) -> Tuple[Optional[str], str, int]:
+    """
+    "unix:/run/agent.sock" (or unix:///run/agent.sock) -> (socket path, "", 0);
+    "host:port" or "http://host:port" -> (None, host, port).
+    """
+    if addr.startswith("unix:"):
+        path = addr[len("unix:"):]
+        return (path[2:] if path.startswith("//") else path), "", 0
+    u = urlsplit(addr if "://" in addr else f"http://{addr}")
+    return None, u.hostname or "127.0.0.1", u.port or 8765
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "malformed request line")
+    headers: Dict[str, str] = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""):
+            break
+        k, _, v = h.decode("latin-1").partition(":")
+        headers[k.strip().lower()] = v.strip()
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"body over {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), urlsplit(target).path, headers, body
+
+
+def _response(status: int, payload: Dict[str, Any], *, keep_alive: bool) -> bytes:
+    data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(data)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + data
+
+
+async def _serve_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, routes: Routes) -> None:
+    try:
+        while True:
+            keep_alive = False
+            try:
+                req = await _read_request(reader)
+                if req is None:
+                    return
+                method, path, headers, body = req
+                keep_alive = headers.get("connection", "").lower() != "close"
+                handler = routes.get((method, path))
+                if handler is None:
+                    known = any(p == path for _, p in routes)
+                    raise HTTPError(405 if known else 404, f"{method} {path}")
+                try:
+                    payload = json.loads(body) if body else {}
+                except ValueError as e:
+                    raise HTTPError(400, f"invalid JSON: {e}")
+                t0 = time.perf_counter()
+                result = await handler(payload)
+                log.info("%s %s -> 200 in %.0fms", method, path, (time.perf_counter() - t0) * 1000.0)
+                out = _response(200, result, keep_alive=keep_alive)
+            except HTTPError as e:
+                out = _response(e.status, {"error": str(e)}, keep_alive=keep_alive)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            except Exception as e:
+                log.exception("Request failed")
+                out = _response(500, {"error": f"{type(e).__name__}: {e}"}, keep_alive=keep_alive)
+            writer.write(out)
+            await writer.drain()
+            if not keep_alive:
+                return
+    finally:
+        writer.close()
+
+
+async def serve(routes: Routes, *, listen: str) -> None:
+    """
+    Minimal JSON-over-HTTP/1.1 front end (keep-alive, Content-Length bodies) on TCP or a Unix socket.
+    Handlers run on the event loop and push blocking work to executors themselves. Stops on SIGINT/SIGTERM.
+    """
+    unix_path, host, port = parse_address(listen)
+    cb = lambda r, w: _serve_connection(r, w, routes)    # noqa: E731
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)          # сокет от упавшего процесса
+        server = await asyncio.start_unix_server(cb, path=unix_path)
+    else:
+        server = await asyncio.start_server(cb, host=host, port=port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass                          # Windows: остановка по Ctrl+C через KeyboardInterrupt
+
+    log.info("Serving on %s", listen)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        if unix_path and os.path.exists(unix_path):
+            os.unlink(unix_path)
+    log.info("Server stopped")
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self) -> None:
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.settimeout(self.timeout)
+        s.connect(self.unix_path)
+        self.sock = s
+
+
+class ServerClient:
+    """
+    Thin client for `agent serve`: "http://host:port", "host:port" or "unix:/path/to.sock".
+    """
+
+    def __init__(self, address: str, *, timeout_s: float = 600.0):
+        self.address = address
+        self.timeout_s = timeout_s
+
+    def _connection(self) -> http.client.HTTPConnection:
+        unix_path, host, port = parse_address(self.address)
+        if unix_path:
+            return _UnixHTTPConnection(unix_path, self.timeout_s)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout_s)
+
+    def call(self, path: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        conn = self._connection()
+        try:
+            if payload is None:
+                conn.request("GET", path, headers={"Connection": "close"})
+            else:
+                body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+                conn.request("POST", path, body=body, headers={"Content-Type": "application/json", "Connection": "close"})
+            resp = conn.getresponse()
+            data = json.loads(resp.read() or b"{}")
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise RuntimeError(f"agent server {path}: HTTP {resp.status} {data.get('error', '')}")
+        return data
@@ -2,21 +2,50 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
-from typing import Dict, Iterable, List, Set
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 
 # Stacktrace
 STACK_FRAME_RE = re.compile(r"\bat\s+([a-zA-Z_][\w$]*(?:\.[a-zA-Z_][\w$]*)+)\(([^)]*)\)")
+# Span/call notation from traces: PaymentService.confirm()
+SPAN_CALL_RE = re.compile(r"\b([A-Z][\w$]*\.[a-z_][\w$]*)\(\)")
 # Endpoint-like: /api/payments/confirm
 ENDPOINT_RE = re.compile(r"(/api/[a-zA-Z0-9/_\-\.]+)")
 # Exception-like tokens: SomethingException / Error
 EXC_RE = re.compile(r"\b([A-Z][A-Za-z0-9_]+(?:Exception|Error))\b")
 # Common infra/perf tokens
+KEY_TOKENS = (
+    "HikariPool", "Hikari", "Timeout", "timeout", "timed out", "Connection is not available", "PSQLException",
+    "deadlock", "lock", "retry", "retries", "circuit", "throttle", "rate limit", "OOM", "OutOfMemory", "GC",
+    "pause", "latency", "p99", "p95",
+)
 KEY_TOKENS_RE = re.compile(
-    r"\b(HikariPool|Hikari|Timeout|timeout|timed out|Connection is not available|PSQLException|deadlock|lock|"
-    r"retry|retries|circuit|throttle|rate limit|OOM|OutOfMemory|GC|pause|latency|p99|p95)\b",
+    r"\b(" + "|".join(re.escape(t) for t in KEY_TOKENS) + r")\b",
     re.IGNORECASE,
 )
+# lowercase vocabulary: score_chunk_text matches keywords as substrings of the lowercased chunk
+KEY_TOKENS_NORM = tuple(sorted(set(t.lower() for t in KEY_TOKENS)))
+
+# Веса эвристического reranker'а (score_chunk_text и score_chunk_tokens должны совпадать)
+TOKEN_WEIGHTS: Dict[str, float] = {
+    "keyword": 1.0,
+    "exception": 1.5,
+    "method": 0.75,
+    "endpoint": 1.25,
+    "symbol": 1.0,
+}
+
+
+# "PaymentService.java:143" из скобок stack frame
+FRAME_LOCATION_RE = re.compile(r"^([\w$.\-]+\.\w+):(\d+)$")
+
+
+@dataclass(frozen=True)
+class FrameLocation:
+    fqcn: str                 # com.acme.payments.service.PaymentService (outer class)
+    method: str
+    file: str                 # PaymentService.java
+    line: int
 
 
 @dataclass(frozen=True)
@@ -25,6 +54,20 @@ class IncidentSignals:
     exceptions: Set[str]
     frames: Set[str]          # fqcn.method or fqcn
     keywords: Set[str]
+    # frames with file:line, in incident order (top of the stack first)
+    locations: Tuple[FrameLocation, ...] = ()
+
+
+def parse_frame_location(frame: str, location: str) -> Optional[FrameLocation]:
+    m = FRAME_LOCATION_RE.match(location.strip())
+    if not m:
+        # "Native Method", "Unknown Source"
+        return None
+    parts = frame.split(".")
+    if len(parts) < 2:
+        return None
+    fqcn = ".".join(parts[:-1]).split("$")[0]
+    return FrameLocation(fqcn=fqcn, method=parts[-1], file=m.group(1), line=int(m.group(2)))
 
 
 def extract_signals(text: str) -> IncidentSignals:
@@ -33,9 +76,15 @@ def extract_signals(text: str) -> IncidentSignals:
     exceptions = set(m.group(1) for m in EXC_RE.finditer(text))
 
     frames: Set[str] = set()
+    locations: List[FrameLocation] = []
     for m in STACK_FRAME_RE.finditer(text):
         fq = m.group(1)
         frames.add(fq)
+        loc = parse_frame_location(fq, m.group(2))
+        if loc and loc not in locations:
+            locations.append(loc)
+    for m in SPAN_CALL_RE.finditer(text):
+        frames.add(m.group(1))
 
     keywords = set(m.group(0) for m in KEY_TOKENS_RE.finditer(text))
 
@@ -46,6 +95,7 @@ def extract_signals(text: str) -> IncidentSignals:
         exceptions=exceptions,
         frames=frames,
         keywords=keywords_norm,
+        locations=tuple(locations),
     )
 
 
@@ -60,28 +110,102 @@ def score_chunk_text(chunk_text: str, signals: IncidentSignals) -> float:
     # keywords are usually strongest
     for kw in signals.keywords:
         if kw and kw in text:
-            score += 1.0
+            score += TOKEN_WEIGHTS["keyword"]
 
     # exceptions
     for exc in signals.exceptions:
         if exc and exc.lower() in text:
-            score += 1.5
+            score += TOKEN_WEIGHTS["exception"]
 
     # stack frames (fqcn/method)
     for fr in signals.frames:
         # match by last segment to avoid missing due to imports / formatting
         last = fr.split(".")[-1].lower()
         if last and last in text:
-            score += 0.75
+            score += TOKEN_WEIGHTS["method"]
 
     # endpoints
     for ep in signals.endpoints:
         if ep and ep.lower() in text:
-            score += 1.25
+            score += TOKEN_WEIGHTS["endpoint"]
 
     return score
 
 
+# (kind, token) — нормализованные токены чанка для inverted index
+ChunkToken = Tuple[str, str]
+
+# "name(" — вызовы и объявления методов; keywords языка отсекаем
+CALL_RE = re.compile(r"\b([a-zA-Z_$][\w$]*)\s*\(")
+_NOT_CALLS = {
+    "if", "for", "while", "switch", "catch", "return", "new", "throw", "synchronized", "try", "super", "this",
+    "assert", "print", "elif", "and", "or", "not", "in", "with", "except", "lambda", "yield",
+}
+
+
+def frame_method(frame: str) -> str:
+    return frame.split(".")[-1]
+
+
+def frame_symbol(frame: str) -> str:
+    """
+    "com.acme.PaymentService.confirm" -> "PaymentService.confirm" (inner classes: "Outer$Inner.m" -> "Inner.m").
+    """
+    parts = frame.split(".")
+    if len(parts) < 2:
+        return frame
+    cls = parts[-2].split("$")[-1]
+    return f"{cls}.{parts[-1]}"
+
+
+def extract_chunk_tokens(chunk_text: str, symbols: Iterable[str] = ()) -> Set[ChunkToken]:
+    """
+    Index-time counterpart of score_chunk_text: everything the reranker looks for, precomputed.
+    `symbols` — types/methods defined in the chunk ("PaymentService", "PaymentService.confirm").
+    """
+    text = chunk_text.lower()
+    tokens: Set[ChunkToken] = set()
+
+    for kw in KEY_TOKENS_NORM:
+        if kw in text:
+            tokens.add(("keyword", kw))
+
+    for m in EXC_RE.finditer(chunk_text):
+        tokens.add(("exception", m.group(1).lower()))
+
+    for m in ENDPOINT_RE.finditer(chunk_text):
+        tokens.add(("endpoint", m.group(1).lower()))
+
+    for m in CALL_RE.finditer(chunk_text):
+        name = m.group(1)
+        if name not in _NOT_CALLS:
+            tokens.add(("method", name.lower()))
+
+    for s in symbols:
+        tokens.add(("symbol", s.lower()))
+        tokens.add(("method", s.split(".")[-1].lower()))
+
+    return tokens
+
+
+def signal_tokens(signals: IncidentSignals) -> Set[ChunkToken]:
+    tokens: Set[ChunkToken] = set()
+    tokens.update(("keyword", kw) for kw in signals.keywords if kw)
+    tokens.update(("exception", exc.lower()) for exc in signals.exceptions if exc)
+    tokens.update(("endpoint", ep.lower()) for ep in signals.endpoints if ep)
+    for fr in signals.frames:
+        tokens.add(("method", frame_method(fr).lower()))
+        tokens.add(("symbol", frame_symbol(fr).lower()))
+    return tokens
+
+
+def score_chunk_tokens(chunk_tokens: Set[ChunkToken], wanted: Set[ChunkToken]) -> float:
+    """
+    Same reranker as score_chunk_text, but over precomputed chunk tokens: a set intersection.
+    """
+    return sum(TOKEN_WEIGHTS.get(kind, 0.0) for kind, _ in chunk_tokens & wanted)
+
+
 def path_penalty(path: str) -> float:
     """
     Penalize low-value paths for performance root-cause analysis.
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
 import sqlite3
-from dataclasses import dataclass
+import threading
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
 from .chunking import Chunk
+from .config_index import ConfigEntry, ConfigFact, key_terms
+from .signals import ChunkToken, TOKEN_WEIGHTS
 
 
 SCHEMA_SQL = """
@@ -31,18 +34,83 @@ CREATE TABLE IF NOT EXISTS chunks (
 );
 
 CREATE INDEX IF NOT EXISTS idx_chunks_path ON chunks(path);
+
+-- inverted index: сигнальные токены чанка (keyword/exception/endpoint/method/symbol)
+CREATE TABLE IF NOT EXISTS chunk_tokens (
+  token TEXT NOT NULL,
+  kind TEXT NOT NULL,
+  chunk_id INTEGER NOT NULL,
+  PRIMARY KEY (token, kind, chunk_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_chunk_tokens_chunk ON chunk_tokens(chunk_id);
+
+-- symbol table: fqcn / имя файла -> путь (для stack frame -> chunk)
+CREATE TABLE IF NOT EXISTS file_symbols (
+  symbol TEXT NOT NULL,
+  path TEXT NOT NULL,
+  PRIMARY KEY (symbol, path)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_chunks_path_lines ON chunks(path, start_line, end_line);
+
+-- плоские ключи конфигурации (yaml/properties/tf): key_path -> value + файл:строка
+CREATE TABLE IF NOT EXISTS config_keys (
+  entry_id INTEGER PRIMARY KEY,
+  key_path TEXT NOT NULL,
+  value TEXT NOT NULL,
+  path TEXT NOT NULL,
+  line INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_config_keys_path ON config_keys(path);
+
+-- термины ключа (части пути, camelCase) -> entry_id
+CREATE TABLE IF NOT EXISTS config_terms (
+  term TEXT NOT NULL,
+  entry_id INTEGER NOT NULL,
+  PRIMARY KEY (term, entry_id)
+) WITHOUT ROWID;
 """
 
+# SQLite limit on bound parameters is 999 in older builds
+_IN_BATCH = 500
+
 
 @dataclass(frozen=True)
 class SQLiteStore:
     db_path: Path
+    # долгоживущий процесс (agent serve): одно соединение на поток вместо открытия на каждый запрос
+    persistent: bool = False
+    _local: threading.local = field(default_factory=threading.local, init=False, repr=False, compare=False)
 
-    def connect(self) -> sqlite3.Connection:
+    def _open(self) -> sqlite3.Connection:
         conn = sqlite3.connect(str(self.db_path))
         conn.row_factory = sqlite3.Row
         return conn
 
+    def connect(self) -> sqlite3.Connection:
+        # `with conn:` только коммитит/откатывает, соединение остаётся открытым — его можно переиспользовать
+        if not self.persistent:
+            return self._open()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    def close(self) -> None:
+        """
+        Closes this thread's persistent connection (no-op otherwise).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self._local.conn = None
+            conn.close()
+
+    def count_chunks(self) -> int:
+        with self.connect() as conn:
+            return int(conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0])
+
     def init(self) -> None:
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         with self.connect() as conn:
@@ -69,11 +137,186 @@ class SQLiteStore:
             ).fetchone()
             if not row:
                 return None
-            return Chunk(
-                chunk_id=int(row["chunk_id"]),
-                path=str(row["path"]),
-                language=str(row["language"]),
-                start_line=int(row["start_line"]),
-                end_line=int(row["end_line"]),
-                text=str(row["text"]),
+            return _row_to_chunk(row)
+
+    def get_chunks(self, chunk_ids: Iterable[int]) -> Dict[int, Chunk]:
+        ids = list(dict.fromkeys(int(i) for i in chunk_ids))
+        out: Dict[int, Chunk] = {}
+        with self.connect() as conn:
+            for i in range(0, len(ids), _IN_BATCH):
+                part = ids[i:i + _IN_BATCH]
+                rows = conn.execute(
+                    "SELECT chunk_id, path, language, start_line, end_line, text FROM chunks "
+                    f"WHERE chunk_id IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for row in rows:
+                    out[int(row["chunk_id"])] = _row_to_chunk(row)
+        return out
+
+    def has_table(self, name: str) -> bool:
+        with self.connect() as conn:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                (name,),
+            ).fetchone()
+            return row is not None
+
+    def insert_chunk_tokens(self, tokens: Dict[int, Set[ChunkToken]]) -> None:
+        ids = list(tokens.keys())
+        with self.connect() as conn:
+            # переиндексация тех же chunk_id не должна оставлять старые токены
+            for i in range(0, len(ids), _IN_BATCH):
+                part = ids[i:i + _IN_BATCH]
+                conn.execute(
+                    f"DELETE FROM chunk_tokens WHERE chunk_id IN ({','.join('?' * len(part))})",
+                    part,
+                )
+            conn.executemany(
+                "INSERT OR IGNORE INTO chunk_tokens(token, kind, chunk_id) VALUES (?, ?, ?)",
+                (
+                    (token, kind, chunk_id)
+                    for chunk_id, toks in tokens.items()
+                    for kind, token in toks
+                ),
+            )
+
+    def get_chunk_tokens(self, chunk_ids: Iterable[int]) -> Dict[int, Set[ChunkToken]]:
+        ids = list(dict.fromkeys(int(i) for i in chunk_ids))
+        out: Dict[int, Set[ChunkToken]] = {i: set() for i in ids}
+        with self.connect() as conn:
+            for i in range(0, len(ids), _IN_BATCH):
+                part = ids[i:i + _IN_BATCH]
+                rows = conn.execute(
+                    "SELECT chunk_id, kind, token FROM chunk_tokens "
+                    f"WHERE chunk_id IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for row in rows:
+                    out[int(row["chunk_id"])].add((str(row["kind"]), str(row["token"])))
+        return out
+
+    def find_chunks_by_tokens(self, tokens: Iterable[ChunkToken], *, limit: int = 50) -> List[Tuple[int, float]]:
+        """
+        Candidate generation from the inverted index: chunks ranked by the summed weight of matched tokens.
+        """
+        toks = list(set(tokens))
+        if not toks:
+            return []
+
+        weights: Dict[int, float] = {}
+        with self.connect() as conn:
+            for kind, token in toks:
+                w = TOKEN_WEIGHTS.get(kind, 0.0)
+                for row in conn.execute(
+                    "SELECT chunk_id FROM chunk_tokens WHERE token=? AND kind=?",
+                    (token, kind),
+                ):
+                    cid = int(row["chunk_id"])
+                    weights[cid] = weights.get(cid, 0.0) + w
+
+        ranked = sorted(weights.items(), key=lambda x: x[1], reverse=True)
+        return ranked[:limit]
+
+    def insert_file_symbols(self, symbols: Iterable[Tuple[str, str]]) -> None:
+        rows = list(symbols)
+        paths = list({path for _, path in rows})
+        with self.connect() as conn:
+            for i in range(0, len(paths), _IN_BATCH):
+                part = paths[i:i + _IN_BATCH]
+                conn.execute(
+                    f"DELETE FROM file_symbols WHERE path IN ({','.join('?' * len(part))})",
+                    part,
+                )
+            conn.executemany(
+                "INSERT OR IGNORE INTO file_symbols(symbol, path) VALUES (?, ?)",
+                rows,
+            )
+
+    def find_symbol_paths(self, symbol: str) -> List[str]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT path FROM file_symbols WHERE symbol=?", (symbol,)).fetchall()
+            return sorted(str(r["path"]) for r in rows)
+
+    def find_chunk_at_line(self, path: str, line: int) -> Optional[Chunk]:
+        """
+        Chunk covering `line`; with overlapping chunks prefer the one where the line is farthest from the edges.
+        """
+        with self.connect() as conn:
+            row = conn.execute(
+                """
+                SELECT chunk_id, path, language, start_line, end_line, text FROM chunks
+                WHERE path=? AND start_line<=? AND end_line>=?
+                ORDER BY min(? - start_line, end_line - ?) DESC
+                LIMIT 1
+                """,
+                (path, line, line, line, line),
+            ).fetchone()
+            if not row:
+                return None
+            return _row_to_chunk(row)
+
+    def insert_config_entries(self, entries: Iterable[Tuple[str, ConfigEntry]]) -> int:
+        rows = list(entries)
+        paths = list({path for path, _ in rows})
+        with self.connect() as conn:
+            for i in range(0, len(paths), _IN_BATCH):
+                part = paths[i:i + _IN_BATCH]
+                marks = ",".join("?" * len(part))
+                conn.execute(
+                    f"DELETE FROM config_terms WHERE entry_id IN (SELECT entry_id FROM config_keys WHERE path IN ({marks}))",
+                    part,
+                )
+                conn.execute(f"DELETE FROM config_keys WHERE path IN ({marks})", part)
+
+            for path, e in rows:
+                cur = conn.execute(
+                    "INSERT INTO config_keys(key_path, value, path, line) VALUES (?, ?, ?, ?)",
+                    (e.key, e.value, path, e.line),
+                )
+                conn.executemany(
+                    "INSERT OR IGNORE INTO config_terms(term, entry_id) VALUES (?, ?)",
+                    ((t, cur.lastrowid) for t in key_terms(e.key)),
+                )
+        return len(rows)
+
+    def find_config_facts(self, terms: Iterable[str], *, limit: int = 30) -> List[ConfigFact]:
+        """
+        Config keys ranked by the number of distinct query terms in their key path (shorter keys first on ties).
+        """
+        ts = sorted(set(terms))[:_IN_BATCH]
+        if not ts:
+            return []
+        with self.connect() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT k.key_path, k.value, k.path, k.line, COUNT(*) AS matched
+                FROM config_terms t JOIN config_keys k ON k.entry_id = t.entry_id
+                WHERE t.term IN ({','.join('?' * len(ts))})
+                GROUP BY k.entry_id
+                ORDER BY matched DESC, length(k.key_path), k.path, k.line
+                LIMIT ?
+                """,
+                (*ts, limit),
+            ).fetchall()
+        return [
+            ConfigFact(
+                key=str(r["key_path"]),
+                value=str(r["value"]),
+                path=str(r["path"]),
+                line=int(r["line"]),
+                matched=int(r["matched"]),
             )
+            for r in rows
+        ]
+
+
+def _row_to_chunk(row: sqlite3.Row) -> Chunk:
+    return Chunk(
+        chunk_id=int(row["chunk_id"]),
+        path=str(row["path"]),
+        language=str(row["language"]),
+        start_line=int(row["start_line"]),
+        end_line=int(row["end_line"]),
+        text=str(row["text"]),
+    )
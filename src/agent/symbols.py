@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+
+# Java / Kotlin
+JVM_PACKAGE_RE = re.compile(r"^\s*package\s+([\w.]+)")
+JVM_TYPE_RE = re.compile(
+    r"^\s*(?:@\w+(?:\([^)]*\))?\s+)*(?:(?:public|protected|private|internal|abstract|final|static|sealed|open|data|"
+    r"inner|enum|annotation|value)\s+)*(?:class|interface|enum|record|object|@interface)\s+([A-Z_$][\w$]*)"
+)
+JAVA_METHOD_RE = re.compile(
+    r"^\s*(?:@\w+(?:\([^)]*\))?\s+)*(?:(?:public|protected|private|abstract|final|static|synchronized|native|default)\s+)*"
+    r"(?:<[^>]+>\s+)?[\w$.<>\[\],?\s]+?\s+([a-z_$][\w$]*)\s*\("
+)
+KOTLIN_FUN_RE = re.compile(r"^\s*(?:[a-z]+\s+)*fun\s+(?:<[^>]+>\s+)?(?:[\w.]+\.)?([a-zA-Z_][\w]*)\s*\(")
+# Python
+PY_CLASS_RE = re.compile(r"^(\s*)class\s+([A-Za-z_]\w*)")
+PY_DEF_RE = re.compile(r"^(\s*)(?:async\s+)?def\s+([A-Za-z_]\w*)\s*\(")
+
+# ключевые слова, которые JAVA_METHOD_RE иначе принял бы за имя метода
+_JAVA_NOT_METHODS = {"if", "for", "while", "switch", "catch", "return", "new", "throw", "else", "synchronized", "try"}
+
+
+@dataclass(frozen=True)
+class Symbol:
+    name: str       # "PaymentService" / "PaymentService.confirm"
+    kind: str       # "type" | "method"
+    line: int       # 1-based
+
+
+@dataclass(frozen=True)
+class FileSymbols:
+    package: Optional[str]
+    symbols: List[Symbol]
+
+    def fqcns(self) -> List[str]:
+        types = [s.name for s in self.symbols if s.kind == "type"]
+        if not self.package:
+            return types
+        return [f"{self.package}.{t}" for t in types]
+
+
+def _jvm_symbols(lines: List[str], language: str) -> FileSymbols:
+    package: Optional[str] = None
+    symbols: List[Symbol] = []
+    current_type: Optional[str] = None
+
+    for no, line in enumerate(lines, start=1):
+        if package is None:
+            m = JVM_PACKAGE_RE.match(line)
+            if m:
+                package = m.group(1).rstrip(";")
+                continue
+
+        m = JVM_TYPE_RE.match(line)
+        if m:
+            current_type = m.group(1)
+            symbols.append(Symbol(name=current_type, kind="type", line=no))
+            continue
+
+        if language == "kotlin":
+            m = KOTLIN_FUN_RE.match(line)
+        else:
+            m = JAVA_METHOD_RE.match(line)
+            if m and (m.group(1) in _JAVA_NOT_METHODS or line.rstrip().endswith(";")):
+                m = None
+        if m:
+            name = m.group(1)
+            qualified = f"{current_type}.{name}" if current_type else name
+            symbols.append(Symbol(name=qualified, kind="method", line=no))
+
+    return FileSymbols(package=package, symbols=symbols)
+
+
+def _python_symbols(lines: List[str], module: Optional[str]) -> FileSymbols:
+    symbols: List[Symbol] = []
+    # стек (indent, class_name) для вложенных классов
+    stack: List[tuple[int, str]] = []
+
+    for no, line in enumerate(lines, start=1):
+        m = PY_CLASS_RE.match(line) or PY_DEF_RE.match(line)
+        if not m:
+            continue
+        indent = len(m.group(1))
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        name = m.group(2)
+        if line.lstrip().startswith("class"):
+            symbols.append(Symbol(name=name, kind="type", line=no))
+            stack.append((indent, name))
+        else:
+            qualified = f"{stack[-1][1]}.{name}" if stack else name
+            symbols.append(Symbol(name=qualified, kind="method", line=no))
+
+    return FileSymbols(package=module, symbols=symbols)
+
+
+def python_module_name(path: str) -> str:
+    p = path.replace("\\", "/")
+    if p.endswith(".py"):
+        p = p[:-3]
+    parts = [x for x in p.split("/") if x]
+    if parts and parts[0] == "src":
+        parts = parts[1:]
+    if parts and parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts)
+
+
+def extract_file_symbols(*, text_lines: List[str], language: str, path: str) -> FileSymbols:
+    """
+    Line-based symbol extraction (types and method definitions).
+    Not a parser: good enough to map stack frames and signal tokens to chunks.
+    """
+    if language in ("java", "kotlin"):
+        return _jvm_symbols(text_lines, language)
+    if language == "python":
+        return _python_symbols(text_lines, python_module_name(path))
+    return FileSymbols(package=None, symbols=[])
@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+import json
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import ChunkingConfig, load_chunking_config
+
+
+_DOMAINS = (
+    "payments", "orders", "ledger", "billing", "catalog", "inventory",
+    "shipping", "accounts", "pricing", "checkout", "loyalty", "notifications",
+)
+_NOUNS = (
+    "Payment", "Order", "Invoice", "Refund", "Customer", "Cart", "Shipment",
+    "Price", "Account", "Ledger", "Coupon", "Stock", "Reservation", "Transfer",
+)
+_VERBS = (
+    "confirm", "create", "cancel", "refund", "load", "save", "validate",
+    "publish", "sync", "reserve", "charge", "recalculate", "settle", "expire",
+)
+_STATUSES = ("PENDING", "CONFIRMED", "FAILED", "CANCELLED", "SETTLED")
+
+# роль -> (аннотация, зависимости внутри модуля, язык); порядок — порядок генерации (сначала вызываемые)
+_ROLES: Tuple[Tuple[str, str, Tuple[str, ...], str], ...] = (
+    ("Repository", "Repository", (), "java"),
+    ("Client", "Component", (), "java"),
+    ("Mapper", "Component", (), "kotlin"),
+    ("Service", "Service", ("Repository", "Client", "Mapper"), "java"),
+    ("Validator", "Component", ("Repository",), "java"),
+    ("Listener", "Component", ("Service",), "kotlin"),
+    ("Scheduler", "Component", ("Service",), "java"),
+    ("Controller", "RestController", ("Service", "Validator"), "java"),
+)
+
+
+@dataclass(frozen=True)
+class _Fault:
+    kind: str
+    exception: str              # FQCN, simple name is caught in the generated code
+    message: str
+    log_lines: Tuple[str, ...]
+    symptoms: Dict[str, Any]
+
+
+_FAULTS = (
+    _Fault(
+        "db_pool", "java.sql.SQLTransientConnectionException",
+        "HikariPool-1 - Connection is not available, request timed out after 30000ms",
+        ("HikariPool-1 - Pool stats (total=20, active=20, idle=0, waiting=187)",),
+        {"db_pool_active_pct": 100, "latency_p99_ms": 31000},
+    ),
+    _Fault(
+        "timeout", "java.net.SocketTimeoutException", "Read timed out",
+        ("Retrying request, attempt 3 of 3",),
+        {"latency_p99_ms": 2400, "error_rate_pct": 3.2},
+    ),
+    _Fault(
+        "lock", "org.springframework.dao.CannotAcquireLockException", "could not obtain lock on row",
+        ("org.postgresql.util.PSQLException: ERROR: deadlock detected",),
+        {"latency_p99_ms": 5200, "error_rate_pct": 1.1},
+    ),
+    _Fault(
+        "oom", "java.lang.OutOfMemoryError", "Java heap space",
+        ("GC pause (G1 Evacuation Pause) 1843ms",),
+        {"gc_pause_p99_ms": 1800, "cpu_pct": 97},
+    ),
+    _Fault(
+        "kafka", "org.apache.kafka.common.errors.RecordTooLargeException",
+        "The message is 1048677 bytes when serialized which is larger than the maximum request size",
+        ("Failed to send record to topic, partition 3",),
+        {"kafka_lag": 120000, "error_rate_pct": 0.8},
+    ),
+)
+
+
+@dataclass(frozen=True)
+class _Frame:
+    fqcn: str
+    method: str
+    file: str
+    path: str
+    line: int
+
+
+@dataclass
+class _Method:
+    name: str
+    frame: _Frame               # строка вызова зависимости — там и «падает»
+    fault: _Fault
+    callee: Optional["_Method"] = None
+    endpoint: Optional[str] = None
+
+
+@dataclass
+class SynthRepo:
+    root: Path
+    files: int = 0
+    lines: int = 0
+    chunks: int = 0             # as build_chunks cuts it with the given ChunkingConfig
+    incidents: List[Dict[str, Any]] = field(default_factory=list)
+
+
+def _chunk_count(n_lines: int, max_lines: int, overlap: int) -> int:
+    # та же нарезка, что chunk_text_by_lines
+    count, i = 0, 0
+    while i < n_lines:
+        end = min(i + max_lines, n_lines)
+        count += 1
+        if end >= n_lines:
+            break
+        i = max(end - overlap, 0)
+    return count
+
+
+def _java_filler(rng: random.Random, domain: str, noun: str, verb: str) -> List[str]:
+    table = f"{domain}_{noun.lower()}"
+    pool = (
+        f'metrics.counter("{domain}.{verb}").increment();',
+        f'audit.record(request.id(), "{verb}");',
+        "cache.evict(request.id());",
+        f"result = result.withStatus(Status.{rng.choice(_STATUSES)});",
+        f'if (result.isEmpty()) {{ log.info("nothing to {verb} for {{}}", request.id()); }}',
+        "int attempts = retryPolicy.maxAttempts();",
+        f'String sql = "UPDATE {table} SET status = ? WHERE id = ?";',
+        "jdbc.update(sql, result.status(), request.id());",
+        f'publisher.publish("{domain}.{noun.lower()}.{verb}", result);',
+        "Duration elapsed = Duration.between(started, clock.instant());",
+        "timer.record(elapsed);",
+    )
+    return rng.sample(pool, rng.randint(2, 7))
+
+
+def _kotlin_filler(rng: random.Random, domain: str, noun: str, verb: str) -> List[str]:
+    pool = (
+        f'metrics.counter("{domain}.{verb}").increment()',
+        f'audit.record(request.id, "{verb}")',
+        "cache.evict(request.id)",
+        f"val status = Status.{rng.choice(_STATUSES)}",
+        f'if (result.isEmpty()) log.info("nothing to {verb} for {{}}", request.id)',
+        f'publisher.publish("{domain}.{noun.lower()}.{verb}", result)',
+        "val elapsed = Duration.between(started, clock.instant())",
+    )
+    return rng.sample(pool, rng.randint(2, 5))
+
+
+def _gen_class(
+    rng: random.Random,
+    *,
+    domain: str,
+    module: str,
+    noun: str,
+    role: str,
+    annotation: str,
+    lang: str,
+    deps: Dict[str, Tuple[str, List[_Method]]],
+) -> Tuple[str, List[str], List[_Method]]:
+    """
+    One Spring bean; every method calls a real method of one of its dependencies inside try/catch,
+    so stack frames and the catch clause line up with the generated source.
+    """
+    cls = f"{noun}{role}"
+    pkg = f"com.acme.{domain}.{module}.{role.lower()}"
+    ext = "java" if lang == "java" else "kt"
+    src = "java" if lang == "java" else "kotlin"
+    path = f"src/main/{src}/{pkg.replace('.', '/')}/{cls}.{ext}"
+    file = f"{cls}.{ext}"
+    dom_exc = f"{domain.capitalize()}Exception"
+    base = f"/api/{domain}/{noun.lower()}s"
+
+    lines: List[str] = []
+    if lang == "java":
+        lines += [f"package {pkg};", "", "import java.time.Duration;", "import org.slf4j.Logger;", "import org.slf4j.LoggerFactory;"]
+        lines += [f"import org.springframework.stereotype.{annotation};" if annotation != "RestController" else "import org.springframework.web.bind.annotation.*;"]
+        lines += [f"import com.acme.{domain}.{module}.{d.lower()}.{c};" for d, (c, _) in deps.items()]
+        lines += ["", f"@{annotation}"]
+        if role == "Controller":
+            lines += [f'@RequestMapping("{base}")']
+        lines += [f"public class {cls} {{", f"    private static final Logger log = LoggerFactory.getLogger({cls}.class);"]
+        lines += [f"    private final {c} {d.lower()};" for d, (c, _) in deps.items()]
+        lines += [""]
+        args = ", ".join(f"{c} {d.lower()}" for d, (c, _) in deps.items())
+        lines += [f"    public {cls}({args}) {{"] + [f"        this.{d.lower()} = {d.lower()};" for d in deps] + ["    }"]
+    else:
+        lines += [f"package {pkg}", "", "import java.time.Duration", "import org.slf4j.LoggerFactory"]
+        lines += [f"import org.springframework.stereotype.{annotation}"]
+        lines += [f"import com.acme.{domain}.{module}.{d.lower()}.{c}" for d, (c, _) in deps.items()]
+        lines += ["", f"@{annotation}", f"class {cls}("]
+        lines += [f"    private val {d.lower()}: {c}," for d, (c, _) in deps.items()]
+        lines += [") {", f"    private val log = LoggerFactory.getLogger({cls}::class.java)"]
+
+    methods: List[_Method] = []
+    used: set[str] = set()
+    for _ in range(rng.randint(4, 14)):
+        verb = rng.choice(_VERBS)
+        name = f"{verb}{noun}"
+        if name in used:
+            continue
+        used.add(name)
+        fault = rng.choice(_FAULTS)
+        exc = fault.exception.rsplit(".", 1)[1]
+        callee: Optional[_Method] = None
+        if deps:
+            dep_role = rng.choice(sorted(deps))
+            callee = rng.choice(deps[dep_role][1]) if deps[dep_role][1] else None
+            target = f"{dep_role.lower()}.{callee.name if callee else verb + noun}"
+        else:
+            target = "jdbc.queryForObject" if role == "Repository" else "http.exchange"
+        endpoint = None
+        lines.append("")
+        if lang == "java":
+            if role == "Controller":
+                endpoint = f"{base}/{verb}"
+                lines.append(f'    @PostMapping("/{verb}")')
+            lines += [
+                f"    public {noun}Result {name}({noun}Request request) {{",
+                f'        log.debug("{verb} {noun.lower()} id={{}}", request.id());',
+                "        if (request.amount() <= 0) {",
+                '            throw new IllegalArgumentException("amount must be positive");',
+                "        }",
+                "        try {",
+            ]
+            call_line = len(lines) + 1
+            lines.append(f"            var result = {target}(request);")
+            lines += ["            " + s for s in _java_filler(rng, domain, noun, verb)]
+            lines += [
+                "            return result;",
+                f"        }} catch ({exc} e) {{",
+                f'            log.warn("{verb} {noun.lower()} failed: {{}}", e.getMessage());',
+                f'            throw new {dom_exc}("{verb} failed for " + request.id(), e);',
+                "        }",
+                "    }",
+            ]
+        else:
+            lines += [
+                f"    fun {name}(request: {noun}Request): {noun}Result {{",
+                f'        log.debug("{verb} {noun.lower()} id={{}}", request.id)',
+                '        require(request.amount > 0) { "amount must be positive" }',
+                "        return try {",
+            ]
+            call_line = len(lines) + 1
+            lines.append(f"            val result = {target}(request)")
+            lines += ["            " + s for s in _kotlin_filler(rng, domain, noun, verb)]
+            lines += [
+                "            result",
+                f"        }} catch (e: {exc}) {{",
+                f'            log.warn("{verb} {noun.lower()} failed: {{}}", e.message)',
+                f'            throw {dom_exc}("{verb} failed for ${{request.id}}", e)',
+                "        }",
+                "    }",
+            ]
+        frame = _Frame(fqcn=f"{pkg}.{cls}", method=name, file=file, path=path, line=call_line)
+        methods.append(_Method(name=name, frame=frame, fault=callee.fault if callee else fault, callee=callee, endpoint=endpoint))
+    lines.append("}")
+    return path, lines, methods
+
+
+def _gen_module_config(rng: random.Random, domain: str, module: str) -> List[str]:
+    peer = rng.choice([d for d in _DOMAINS if d != domain])
+    return [
+        "spring:",
+        "  application:",
+        f"    name: {domain}-service",
+        "  datasource:",
+        f"    url: jdbc:postgresql://{domain}-db:5432/{domain}",
+        "    hikari:",
+        f"      maximum-pool-size: {rng.choice((10, 20, 30, 50))}",
+        f"      connection-timeout: {rng.choice((3000, 10000, 30000))}",
+        "      idle-timeout: 600000",
+        "  jpa:",
+        "    properties:",
+        "      hibernate:",
+        "        jdbc:",
+        f"          lock-timeout: {rng.choice((1000, 5000, 10000))}",
+        "  kafka:",
+        "    bootstrap-servers: kafka:9092",
+        "    producer:",
+        f"      max-request-size: {rng.choice((1048576, 2097152))}",
+        f"      linger-ms: {rng.choice((0, 5, 20))}",
+        "clients:",
+        f"  {peer}:",
+        f"    base-url: http://{peer}-service:8080",
+        f"    connect-timeout-ms: {rng.choice((500, 1000, 2000))}",
+        f"    read-timeout-ms: {rng.choice((1000, 2000, 5000, 10000))}",
+        f"    retries: {rng.randint(0, 3)}",
+        f"{domain}:",
+        f"  {module}:",
+        f"    batch-size: {rng.choice((100, 500, 1000))}",
+        f'    schedule: "0 */{rng.randint(1, 15)} * * * *"',
+        "management:",
+        "  endpoints:",
+        "    web:",
+        "      exposure:",
+        "        include: health,prometheus",
+    ]
+
+
+def _gen_values(rng: random.Random, domain: str) -> List[str]:
+    mem = rng.choice((512, 768, 1024, 2048))
+    return [
+        f"replicaCount: {rng.randint(2, 6)}",
+        "image:",
+        f"  repository: registry.acme.local/{domain}-service",
+        f'  tag: "1.{rng.randint(0, 40)}.{rng.randint(0, 9)}"',
+        "resources:",
+        "  requests:",
+        f'    cpu: "{rng.choice(("250m", "500m", "1"))}"',
+        f"    memory: {mem}Mi",
+        "  limits:",
+        f'    cpu: "{rng.choice(("1", "2", "4"))}"',
+        f"    memory: {mem}Mi",
+        "env:",
+        f'  JAVA_OPTS: "-Xmx{mem * 3 // 4}m -XX:+UseG1GC"',
+        "  SPRING_PROFILES_ACTIVE: prod",
+    ]
+
+
+def _make_incident(rng: random.Random, no: int, m: _Method, domain: str) -> Dict[str, Any]:
+    # вершина стека — самый глубокий сгенерированный вызов, ниже — вызывающие
+    chain: List[_Method] = []
+    cur: Optional[_Method] = m
+    while cur is not None and len(chain) < 4:
+        chain.append(cur)
+        cur = cur.callee
+    chain.reverse()
+    fault = chain[0].fault
+    exc_simple = fault.exception.rsplit(".", 1)[1]
+    logs = [f"{fault.exception}: {fault.message}", *fault.log_lines]
+    logs += [f"\tat {c.frame.fqcn}.{c.frame.method}({c.frame.file}:{c.frame.line})" for c in chain]
+    logs.append(f"{domain.capitalize()}Exception: {m.name} failed, caused by {exc_simple}")
+
+    spans = []
+    top = chain[-1]
+    cls = top.frame.fqcn.rsplit(".", 1)[1]
+    p99 = rng.randint(300, 5000)
+    if top.endpoint:
+        spans.append(f"POST {top.endpoint} -> {cls}.{top.name}() p99={p99}ms")
+    else:
+        spans.append(f"{cls}.{top.name}() p99={p99}ms")
+    minute = no % 48
+    return {
+        "id": f"synth-{no:05d}",
+        "service": f"{domain}-service",
+        "time_window": f"2026-01-15T{minute // 2:02d}:{(minute % 2) * 30:02d}:00Z/2026-01-15T{minute // 2:02d}:{(minute % 2) * 30 + 29:02d}:00Z",
+        "symptoms": dict(fault.symptoms),
+        "logs": logs,
+        "traces": {"top_spans": spans},
+        # ground truth для оценки retrieval: строки, из которых «вылетело» исключение, с вершины стека
+        "expected": [{"path": c.frame.path, "line": c.frame.line} for c in chain],
+        "fault": fault.kind,
+    }
+
+
+def generate_repo(
+    root: Path,
+    *,
+    chunks: int,
+    incidents: int = 50,
+    seed: int = 0,
+    chunk_cfg: Optional[ChunkingConfig] = None,
+) -> SynthRepo:
+    """
+    Deterministic Spring-style repo (Java + Kotlin beans, application.yml per module, helm values per
+    domain) with at least `chunks` chunks under `chunk_cfg` (default: CHUNK_* env), plus incidents whose
+    stack traces point at real lines of it ("expected" holds those lines, top of the stack first).
+    """
+    cfg = chunk_cfg or load_chunking_config()
+    rng = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    out = SynthRepo(root=root)
+
+    def write(rel: str, lines: List[str]) -> None:
+        p = root / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        out.files += 1
+        out.lines += len(lines)
+        out.chunks += _chunk_count(len(lines), cfg.max_lines, cfg.overlap)
+
+    # резервуарная выборка мест падения: память не растёт с размером репо
+    sites: List[Tuple[_Method, str]] = []
+    seen = 0
+    module_no = 0
+    while out.chunks < chunks:
+        domain = _DOMAINS[module_no % len(_DOMAINS)]
+        module = f"m{module_no // len(_DOMAINS)}"
+        if module_no < len(_DOMAINS):
+            write(f"deploy/{domain}/values.yaml", _gen_values(rng, domain))
+        module_no += 1
+
+        noun = rng.choice(_NOUNS)
+        beans: Dict[str, Tuple[str, List[_Method]]] = {}
+        for role, annotation, dep_roles, lang in _ROLES:
+            deps = {d: beans[d] for d in dep_roles if d in beans}
+            path, lines, methods = _gen_class(
+                rng, domain=domain, module=module, noun=noun, role=role, annotation=annotation, lang=lang, deps=deps,
+            )
+            write(path, lines)
+            beans[role] = (f"{noun}{role}", methods)
+            for m in methods:
+                if m.callee is None:
+                    continue
+                seen += 1
+                if len(sites) < incidents:
+                    sites.append((m, domain))
+                else:
+                    j = rng.randrange(seen)
+                    if j < incidents:
+                        sites[j] = (m, domain)
+        write(f"src/main/resources/{domain}/{module}/application.yml", _gen_module_config(rng, domain, module))
+
+    for no in range(incidents):
+        if not sites:
+            break
+        m, domain = sites[no] if no < len(sites) else rng.choice(sites)
+        out.incidents.append(_make_incident(rng, no, m, domain))
+    return out
+
+
+def write_incidents(path: Path, incidents: List[Dict[str, Any]]) -> None:
+    """
+    JSONL, one incident per line: the format `agent analyze-batch` reads.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        for inc in incidents:
+            f.write(json.dumps(inc, ensure_ascii=False) + "\n")
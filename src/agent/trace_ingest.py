@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import json
+import logging
+import re
+import time
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+from .log_ingest import open_text
+
+
+log = logging.getLogger("agent")
+
+
+# "spans": [ — и в OTLP (resourceSpans[].scopeSpans[].spans), и в Jaeger (data[].spans)
+SPANS_KEY_RE = re.compile(r'"spans"\s*:\s*\[')
+# OTLP resource attribute перед spans
+SERVICE_NAME_RE = re.compile(r'"key"\s*:\s*"service\.name"\s*,\s*"value"\s*:\s*\{\s*"stringValue"\s*:\s*"([^"]*)"')
+ENDPOINT_ATTRS = ("http.route", "url.template", "http.target", "url.path", "http.url")
+JVM_OP_RE = re.compile(r"[A-Z][\w$]*\.[a-z_][\w$]*")
+
+_READ_CHUNK = 1 << 20
+# один span не бывает таким большим: значит, JSON битый — не читаем весь файл в память
+_MAX_PENDING = 64 << 20
+
+
+def iter_span_objects(f: TextIO) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Streams span objects out of an OTLP/Jaeger JSON export (also NDJSON of several exports)
+    without loading the document: finds every `"spans": [` array and decodes its elements one by one.
+    Yields (service_name or None, span).
+    """
+    dec = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = False
+    service: Optional[str] = None
+
+    def refill() -> bool:
+        nonlocal buf, pos, eof
+        more = f.read(_READ_CHUNK)
+        if not more:
+            eof = True
+            return False
+        buf = buf[pos:] + more
+        pos = 0
+        return True
+
+    while True:
+        if not in_array:
+            m = SPANS_KEY_RE.search(buf, pos)
+            for sm in SERVICE_NAME_RE.finditer(buf, pos, m.start() if m else len(buf)):
+                service = sm.group(1)
+            if m:
+                pos = m.end()
+                in_array = True
+                continue
+            if eof:
+                return
+            # хвост может содержать начало ключа
+            pos = max(pos, len(buf) - 64)
+            refill()
+            continue
+
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf):
+            if not refill():
+                return
+            continue
+        if buf[pos] == "]":
+            in_array = False
+            pos += 1
+            continue
+
+        try:
+            obj, end = dec.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # объект обрезан границей чтения
+            if len(buf) - pos > _MAX_PENDING:
+                raise ValueError("Malformed trace export: cannot decode span object")
+            if eof or not refill():
+                return
+            continue
+        pos = end
+        if isinstance(obj, dict):
+            yield service, obj
+
+
+def _attr_value(v: Any) -> Any:
+    if isinstance(v, dict):
+        for k in ("stringValue", "intValue", "doubleValue", "boolValue"):
+            if k in v:
+                return v[k]
+        return None
+    return v
+
+
+def _attrs(span: Dict[str, Any]) -> Dict[str, Any]:
+    # OTLP: attributes=[{key, value:{stringValue}}]; Jaeger: tags=[{key, value}]
+    out: Dict[str, Any] = {}
+    for a in span.get("attributes") or span.get("tags") or []:
+        if isinstance(a, dict) and "key" in a:
+            out[str(a["key"])] = _attr_value(a.get("value"))
+    return out
+
+
+@dataclass(frozen=True)
+class _Span:
+    trace_id: str
+    span_id: str
+    parent_id: str
+    name: str
+    start_ns: int
+    end_ns: int
+    endpoint: Optional[str]
+
+
+def normalize_span(span: Dict[str, Any]) -> Optional[_Span]:
+    attrs = _attrs(span)
+    endpoint = next((str(attrs[k]) for k in ENDPOINT_ATTRS if attrs.get(k)), None)
+
+    if "traceId" in span:     # OTLP
+        start = int(span.get("startTimeUnixNano") or 0)
+        end = int(span.get("endTimeUnixNano") or start)
+        return _Span(
+            trace_id=str(span["traceId"]),
+            span_id=str(span.get("spanId", "")),
+            parent_id=str(span.get("parentSpanId") or ""),
+            name=str(span.get("name", "")),
+            start_ns=start,
+            end_ns=end,
+            endpoint=endpoint,
+        )
+
+    if "traceID" in span:     # Jaeger (микросекунды)
+        parent = ""
+        for ref in span.get("references") or []:
+            if ref.get("refType") == "CHILD_OF":
+                parent = str(ref.get("spanID", ""))
+                break
+        start = int(span.get("startTime") or 0) * 1000
+        return _Span(
+            trace_id=str(span["traceID"]),
+            span_id=str(span.get("spanID", "")),
+            parent_id=parent,
+            name=str(span.get("operationName", "")),
+            start_ns=start,
+            end_ns=start + int(span.get("duration") or 0) * 1000,
+            endpoint=endpoint,
+        )
+    return None
+
+
+@dataclass
+class OpStats:
+    op: str
+    count: int
+    self_ms: float
+    total_ms: float
+    p95_ms: float
+
+
+@dataclass
+class TraceDigest:
+    spans: int = 0
+    traces: int = 0
+    elapsed_s: float = 0.0
+    top_ops: List[OpStats] = field(default_factory=list)
+    # критический путь самого медленного trace: [(op, self_ms)]
+    critical_path: List[Tuple[str, float]] = field(default_factory=list)
+    # операции по суммарному self-time на критических путях медленных trace'ов
+    critical_ops: List[Tuple[str, float]] = field(default_factory=list)
+    endpoints: List[Tuple[str, int, float]] = field(default_factory=list)   # (endpoint, count, avg_ms)
+
+    @property
+    def spans_per_sec(self) -> float:
+        return self.spans / max(self.elapsed_s, 1e-9)
+
+
+class _SpanColumns:
+    """
+    Columnar span storage in typed arrays (~40 bytes/span) instead of Python objects.
+    """
+
+    def __init__(self) -> None:
+        self.key = array("q")
+        self.parent = array("q")
+        self.trace = array("q")
+        self.op = array("q")
+        self.start = array("q")
+        self.end = array("q")
+        self.ops: Dict[str, int] = {}
+
+    def add(self, s: _Span, service: Optional[str]) -> None:
+        name = f"{service}:{s.name}" if service and not JVM_OP_RE.fullmatch(s.name) else s.name
+        op = self.ops.setdefault(name, len(self.ops))
+        # hash((trace, span)) как 64-битный ключ: коллизии пренебрежимы, памяти — 8 байт
+        self.key.append(hash((s.trace_id, s.span_id)) or 1)
+        self.parent.append(hash((s.trace_id, s.parent_id)) or 1 if s.parent_id else 0)
+        self.trace.append(hash(s.trace_id))
+        self.op.append(op)
+        self.start.append(s.start_ns)
+        self.end.append(max(s.end_ns, s.start_ns))
+
+
+def _analyze(cols: _SpanColumns, *, top_n: int, slow_traces: int) -> TraceDigest:
+    d = TraceDigest()
+    n = len(cols.key)
+    d.spans = n
+    if n == 0:
+        return d
+
+    key = np.frombuffer(cols.key, dtype=np.int64)
+    parent = np.frombuffer(cols.parent, dtype=np.int64)
+    op = np.frombuffer(cols.op, dtype=np.int64)
+    start = np.frombuffer(cols.start, dtype=np.int64)
+    end = np.frombuffer(cols.end, dtype=np.int64)
+    dur = (end - start).astype(np.float64)
+    d.traces = int(np.unique(np.frombuffer(cols.trace, dtype=np.int64)).size)
+
+    # parent index через сортировку ключей
+    order = np.argsort(key, kind="stable")
+    sorted_keys = key[order]
+    pos = np.minimum(np.searchsorted(sorted_keys, parent), n - 1)
+    has_parent = (parent != 0) & (sorted_keys[pos] == parent)
+    parent_idx = np.where(has_parent, order[pos], -1)
+
+    # self-time = длительность минус сумма длительностей детей
+    child_sum = np.bincount(parent_idx[has_parent], weights=dur[has_parent], minlength=n)
+    self_time = np.clip(dur - child_sum, 0.0, None)
+
+    n_ops = len(cols.ops)
+    op_count = np.bincount(op, minlength=n_ops)
+    op_self = np.bincount(op, weights=self_time, minlength=n_ops)
+    op_total = np.bincount(op, weights=dur, minlength=n_ops)
+
+    # p95 длительности по операции: сортировка (op, dur) и индекс внутри группы
+    by_op = np.lexsort((dur, op))
+    group_start = np.concatenate(([0], np.cumsum(op_count)[:-1]))
+    p95_pos = group_start + np.maximum(np.ceil(op_count * 0.95).astype(np.int64) - 1, 0)
+    p95 = np.where(op_count > 0, dur[by_op][np.minimum(p95_pos, n - 1)], 0.0)
+
+    names = [""] * n_ops
+    for name, i in cols.ops.items():
+        names[i] = name
+
+    ns_to_ms = 1e-6
+    for i in np.argsort(-op_self)[:top_n]:
+        d.top_ops.append(
+            OpStats(
+                op=names[i],
+                count=int(op_count[i]),
+                self_ms=float(op_self[i] * ns_to_ms),
+                total_ms=float(op_total[i] * ns_to_ms),
+                p95_ms=float(p95[i] * ns_to_ms),
+            )
+        )
+
+    # критический путь: у каждого span — ребёнок, завершившийся последним
+    children = np.nonzero(has_parent)[0]
+    crit_child = np.full(n, -1, dtype=np.int64)
+    if children.size:
+        c_sorted = children[np.lexsort((end[children], parent_idx[children]))]
+        p_sorted = parent_idx[c_sorted]
+        last = np.append(p_sorted[1:] != p_sorted[:-1], True)
+        crit_child[p_sorted[last]] = c_sorted[last]
+
+    roots = np.nonzero(~has_parent)[0]
+    slow = roots[np.argsort(-dur[roots])[:slow_traces]]
+    crit_self = np.zeros(n_ops, dtype=np.float64)
+    for r_i, root in enumerate(slow.tolist()):
+        x, depth = root, 0
+        while x != -1 and depth < 256:
+            crit_self[op[x]] += self_time[x]
+            if r_i == 0:
+                d.critical_path.append((names[op[x]], float(self_time[x] * ns_to_ms)))
+            x = int(crit_child[x])
+            depth += 1
+    for i in np.argsort(-crit_self)[:top_n]:
+        if crit_self[i] > 0:
+            d.critical_ops.append((names[i], float(crit_self[i] * ns_to_ms)))
+    return d
+
+
+def ingest_traces(paths: List[Path], *, top_n: int = 20, slow_traces: int = 50) -> TraceDigest:
+    """
+    Streams OTLP/Jaeger JSON exports (plain or .gz), rebuilds span trees and aggregates
+    self-time, p95 and critical paths per operation with NumPy.
+    """
+    cols = _SpanColumns()
+    endpoints: Dict[str, List[float]] = {}
+
+    t0 = time.perf_counter()
+    for path in paths:
+        with open_text(path) as f:
+            for service, obj in iter_span_objects(f):
+                s = normalize_span(obj)
+                if s is None:
+                    continue
+                cols.add(s, service)
+                if s.endpoint:
+                    e = endpoints.setdefault(s.endpoint, [0, 0.0])
+                    e[0] += 1
+                    e[1] += (s.end_ns - s.start_ns) * 1e-6
+    parsed_s = time.perf_counter() - t0
+
+    d = _analyze(cols, top_n=top_n, slow_traces=slow_traces)
+    d.elapsed_s = time.perf_counter() - t0
+    ranked = sorted(endpoints.items(), key=lambda kv: kv[1][1], reverse=True)[:top_n]
+    d.endpoints = [(ep, int(c), total / max(c, 1)) for ep, (c, total) in ranked]
+
+    log.info(
+        "Ingested traces: spans=%d traces=%d ops=%d in %.2fs (parse %.2fs, %.0f spans/s)",
+        d.spans, d.traces, len(cols.ops), d.elapsed_s, parsed_s, d.spans_per_sec,
+    )
+    return d
+
+
+def _op_label(op: str) -> str:
+    # "PaymentService.confirm" -> "PaymentService.confirm()" — extract_signals распознаёт это как frame
+    return f"{op}()" if JVM_OP_RE.fullmatch(op) else op
+
+
+def attach_trace_digest(incident: Dict[str, Any], digest: TraceDigest, *, max_items: int = 15) -> Dict[str, Any]:
+    """
+    Returns a copy of the incident with trace-derived top spans, critical path and endpoints under "traces".
+    """
+    out = dict(incident)
+    traces = dict(out.get("traces") or {})
+    top = list(traces.get("top_spans") or [])
+    top.extend(
+        f"{_op_label(s.op)} self={s.self_ms:.0f}ms total={s.total_ms:.0f}ms p95={s.p95_ms:.0f}ms n={s.count}"
+        for s in digest.top_ops[:max_items]
+    )
+    traces["top_spans"] = top
+    traces["critical_path"] = [f"{_op_label(op)} self={ms:.0f}ms" for op, ms in digest.critical_path[:max_items]]
+    traces["critical_ops"] = [f"{_op_label(op)} {ms:.0f}ms" for op, ms in digest.critical_ops[:max_items]]
+    traces["endpoints"] = [f"{ep} n={c} avg={avg:.0f}ms" for ep, c, avg in digest.endpoints[:max_items]]
+    traces["stats"] = {"spans": digest.spans, "traces": digest.traces, "spans_per_sec": round(digest.spans_per_sec)}
+    out["traces"] = traces
+    return out
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .vectordb_qdrant import VectorHit
+
+
+VECTORS_FILE = "vectors.npy"        # float32 (N, dim), L2-нормированные строки
+CHUNK_IDS_FILE = "chunk_ids.npy"    # int64 (N,)
+REDUCED_FILE = "reduced.npy"        # float32 (N, search_dim) при EMBED_REDUCE
+
+
+class SnapshotWriter:
+    """
+    Writes the vector snapshot of an index generation while it is built: rows go straight into
+    a preallocated .npy memmap, so the whole matrix never sits in memory.
+    """
+
+    def __init__(self, out_dir: Path, *, count: int, dim: int):
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self.out_dir = out_dir
+        self._vectors = np.lib.format.open_memmap(out_dir / VECTORS_FILE, mode="w+", dtype=np.float32, shape=(count, dim))
+        self._ids = np.lib.format.open_memmap(out_dir / CHUNK_IDS_FILE, mode="w+", dtype=np.int64, shape=(count,))
+        self._n = 0
+
+    def add(self, ids: List[int], vectors: List[List[float]]) -> None:
+        arr = np.asarray(vectors, dtype=np.float32)
+        arr /= np.linalg.norm(arr, axis=1, keepdims=True) + 1e-12
+        end = self._n + len(ids)
+        self._vectors[self._n:end] = arr
+        self._ids[self._n:end] = ids
+        self._n = end
+
+    def close(self) -> None:
+        if self._n != len(self._ids):
+            raise ValueError(f"snapshot has {self._n} of {len(self._ids)} rows")
+        self._vectors.flush()
+        self._ids.flush()
+        del self._vectors, self._ids
+
+
+class NumpyVectorDB:
+    """
+    Read-only exact cosine search over an mmapped snapshot. Nothing is locked, and the pages live in the
+    OS page cache shared by every process that opens the same generation, so any number of
+    `agent run` / CI jobs can query one index at once.
+    """
+
+    def __init__(self, snapshot_dir: Path, *, vectors_file: str = VECTORS_FILE):
+        path = snapshot_dir / vectors_file
+        if not path.exists():
+            raise FileNotFoundError(f"No vector snapshot in {snapshot_dir}: rebuild the index with `agent index`")
+        self.snapshot_dir = snapshot_dir
+        self.vectors = np.load(path, mmap_mode="r")
+        self.chunk_ids = np.load(snapshot_dir / CHUNK_IDS_FILE, mmap_mode="r")
+        self._order: Optional[np.ndarray] = None
+
+    def count(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def cache_params(self) -> Dict[str, Any]:
+        return {"backend": "numpy"}
+
+    def vectors_for(self, chunk_ids: List[int]) -> np.ndarray:
+        """
+        Rows for the given chunk ids (all must be in the snapshot); a sorted id index is built on first use.
+        """
+        if self._order is None:
+            self._order = np.argsort(self.chunk_ids, kind="stable")
+        ids = np.asarray(chunk_ids, dtype=np.int64)
+        at = np.minimum(np.searchsorted(self.chunk_ids, ids, sorter=self._order), len(self._order) - 1)
+        pos = self._order[at]
+        if not np.array_equal(self.chunk_ids[pos], ids):
+            raise KeyError("chunk ids missing from the vector snapshot")
+        return np.asarray(self.vectors[pos], dtype=np.float32)
+
+    def close(self) -> None:
+        self.vectors = self.chunk_ids = np.empty((0, 0), dtype=np.float32)
+
+    def search(self, *, query_vector: List[float], top_k: int) -> List[VectorHit]:
+        n = self.count()
+        if n == 0 or top_k <= 0:
+            return []
+        q = np.asarray(query_vector, dtype=np.float32)
+        q /= np.linalg.norm(q) + 1e-12
+        scores = self.vectors @ q
+        k = min(top_k, n)
+        top = np.argpartition(scores, n - k)[n - k:] if k < n else np.arange(n)
+        top = top[np.argsort(scores[top])[::-1]]
+        payload: Dict[str, Any] = {}
+        return [VectorHit(score=float(scores[i]), chunk_id=int(self.chunk_ids[i]), payload=payload) for i in top]
+
+    def ensure_collection(self, *, dim: int) -> None:
+        raise TypeError("NumpyVectorDB is read-only")
+
+    def upsert_batch(self, *, ids: List[int], vectors: List[List[float]], payloads: Optional[List[Dict[str, Any]]] = None) -> None:
+        raise TypeError("NumpyVectorDB is read-only")
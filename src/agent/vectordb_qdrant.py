@@ -2,10 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List
-
-from qdrant_client import QdrantClient
-from qdrant_client.http import models as qm
+from typing import Any, Dict, List, Protocol
 
 
 @dataclass(frozen=True)
@@ -15,6 +12,18 @@ class VectorHit:
     payload: Dict[str, Any]
 
 
+class VectorIndex(Protocol):
+    """
+    What queries need from a vector backend: Qdrant, the NumPy snapshot or a reduced-dim wrapper.
+    """
+
+    def search(self, *, query_vector: List[float], top_k: int) -> List[VectorHit]: ...
+    def count(self) -> int: ...
+    def close(self) -> None: ...
+    # what changes the ranking for the same index and query: part of the cached-results key
+    def cache_params(self) -> Dict[str, Any]: ...
+
+
 class QdrantVectorDB:
     """
     Qdrant local mode (no server, no docker):
@@ -25,6 +34,8 @@ class QdrantVectorDB:
     """
 
     def __init__(self, *, local_path: str, collection: str):
+        from qdrant_client import QdrantClient  # импортируем лениво: клиент тянет pydantic/grpc
+
         self.collection = collection
 
         if local_path == ":memory:":
@@ -39,6 +50,8 @@ class QdrantVectorDB:
         if self.collection in existing:
             return
 
+        from qdrant_client.http import models as qm
+
         self.client.create_collection(
             collection_name=self.collection,
             vectors_config=qm.VectorParams(
@@ -47,7 +60,21 @@ class QdrantVectorDB:
             ),
         )
 
+    def count(self) -> int:
+        return int(self.client.count(collection_name=self.collection, exact=True).count)
+
+    def cache_params(self) -> Dict[str, Any]:
+        return {"backend": "qdrant"}
+
+    def close(self) -> None:
+        # local mode держит файловый lock на папку, пока клиент открыт
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
+
     def upsert_batch(self, *, ids: List[int], vectors: List[List[float]], payloads: List[Dict[str, Any]]) -> None:
+        from qdrant_client.http import models as qm
+
         points = [
             qm.PointStruct(id=int(i), vector=v, payload=p)
             for i, v, p in zip(ids, vectors, payloads, strict=True)
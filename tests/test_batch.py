@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+
+from agent.batch import iter_incidents, run_batch
+
+
+def test_jsonl_names_and_skips_bad_lines(tmp_path):
+    src = tmp_path / "incidents.jsonl"
+    src.write_text(
+        "\n".join([
+            json.dumps({"id": "INC 1/a", "logs": "x"}),
+            "",
+            "{not json",
+            "[1, 2]",
+            json.dumps({"incident_id": "inc-2"}),
+            json.dumps({"service": "pay"}),
+        ]) + "\n",
+        encoding="utf-8",
+    )
+
+    got = list(iter_incidents(src))
+
+    assert [name for name, _ in got] == ["INC_1_a", "inc-2", "line00006"]
+    assert got[2][1] == {"service": "pay"}
+
+
+def test_directory_skips_unreadable_files(tmp_path):
+    (tmp_path / "b.json").write_text(json.dumps({"logs": "b"}), encoding="utf-8")
+    (tmp_path / "a.json").write_text(json.dumps({"logs": "a"}), encoding="utf-8")
+    (tmp_path / "broken.json").write_text("{oops", encoding="utf-8")
+    (tmp_path / "list.json").write_text("[]", encoding="utf-8")
+    (tmp_path / "notes.txt").write_text("ignored", encoding="utf-8")
+
+    got = list(iter_incidents(tmp_path))
+
+    assert got == [("a", {"logs": "a"}), ("b", {"logs": "b"})]
+
+
+def test_batch_survives_bad_input_and_failed_incident(tmp_path):
+    src = tmp_path / "incidents.jsonl"
+    src.write_text('{"id": "ok"}\n"just a string"\n{"id": "boom"}\n', encoding="utf-8")
+    reports = {}
+
+    def analyze(job):
+        if job["id"] == "boom":
+            raise RuntimeError("LLM down")
+        return {"summary": job["id"]}
+
+    result = asyncio.run(run_batch(
+        iter_incidents(src),
+        prepare=lambda batch: [incident for _, incident in batch],
+        analyze=analyze,
+        on_report=reports.__setitem__,
+        concurrency=2,
+    ))
+
+    assert result.ok == ["ok"]
+    assert result.failed == ["boom"]
+    assert reports == {"ok": {"summary": "ok"}}
+
+
+def test_duplicate_names_get_a_suffix(tmp_path):
+    src = tmp_path / "incidents.jsonl"
+    src.write_text(
+        "\n".join(json.dumps(inc) for inc in [{"id": "INC 1"}, {"id": "INC/1"}, {"id": "INC_1-2"}, {"id": "INC 1"}]) + "\n",
+        encoding="utf-8",
+    )
+
+    names = [name for name, _ in iter_incidents(src)]
+
+    assert names == ["INC_1", "INC_1-2", "INC_1-2-2", "INC_1-3"]
+
+
+def test_prepare_stays_bounded_ahead_of_llm():
+    prepared = []
+    analyzed = []
+    ahead = []
+
+    def prepare(batch):
+        prepared.extend(name for name, _ in batch)
+        ahead.append(len(prepared) - len(analyzed))
+        return [name for name, _ in batch]
+
+    def analyze(job):
+        time.sleep(0.002)
+        analyzed.append(job)
+        return {}
+
+    result = asyncio.run(run_batch(
+        ((f"i{n}", {}) for n in range(200)),
+        prepare=prepare,
+        analyze=analyze,
+        on_report=lambda name, report: None,
+        concurrency=2,
+        prepare_batch_size=4,
+    ))
+
+    assert len(result.ok) == 200
+    assert max(ahead) <= 2 * 4
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+from agent.config_index import (
+    MASKED_VALUE,
+    ConfigFact,
+    facts_cover,
+    flatten_properties,
+    flatten_terraform,
+    flatten_yaml,
+    key_terms,
+)
+
+
+def _flat(entries) -> list:
+    return [(e.key, e.value, e.line) for e in entries]
+
+
+YAML = """\
+spring:
+  datasource:
+    url: "jdbc:postgresql://db/pay#x"   # primary
+    password: s3cret
+    hikari:
+      maximum-pool-size: 10
+      connection-timeout: 30000
+  banner: |
+    not: a key
+containers:
+  - name: app
+    env:
+      - name: DB_PASSWORD
+        value: hunter2
+      - name: JAVA_OPTS
+        value: -Xmx512m
+"""
+
+
+def test_yaml_nested_keys_lists_and_line_numbers():
+    assert _flat(flatten_yaml(YAML.splitlines())) == [
+        ("spring.datasource.url", "jdbc:postgresql://db/pay#x", 3),
+        ("spring.datasource.password", MASKED_VALUE, 4),
+        ("spring.datasource.hikari.maximum-pool-size", "10", 6),
+        ("spring.datasource.hikari.connection-timeout", "30000", 7),
+        ("spring.banner", "|", 8),
+        ("containers[0].name", "app", 11),
+        ("containers[0].env[0].name", "DB_PASSWORD", 13),
+        ("containers[0].env[0].value", MASKED_VALUE, 14),
+        ("containers[0].env[1].name", "JAVA_OPTS", 15),
+        ("containers[0].env[1].value", "-Xmx512m", 16),
+    ]
+
+
+def test_properties_continuations_comments_and_secrets():
+    lines = [
+        "# comment",
+        "server.port=8080",
+        "app.api-key = abc",
+        "app.hosts=a,\\",
+        "  b",
+        "feign.client.config.default.readTimeout: 5000",
+    ]
+
+    assert _flat(flatten_properties(lines)) == [
+        ("server.port", "8080", 2),
+        ("app.api-key", MASKED_VALUE, 3),
+        ("app.hosts", "a,b", 4),
+        ("feign.client.config.default.readTimeout", "5000", 6),
+    ]
+
+
+def test_terraform_blocks_heredocs_and_lists():
+    lines = [
+        'resource "aws_db_instance" "main" {',
+        "  instance_class = \"db.t3.micro\" # small",
+        "  tags = {",
+        "    team = \"pay\"",
+        "  }",
+        "  policy = <<EOF",
+        "  ignored = 1",
+        "EOF",
+        "  subnets = [",
+        "    \"a\",",
+        "  ]",
+        "  max_connections = 200",
+        "}",
+    ]
+
+    assert _flat(flatten_terraform(lines)) == [
+        ("resource.aws_db_instance.main.instance_class", "db.t3.micro", 2),
+        ("resource.aws_db_instance.main.tags.team", "pay", 4),
+        ("resource.aws_db_instance.main.policy", "<<EOF", 6),
+        ("resource.aws_db_instance.main.subnets", "[", 9),
+        ("resource.aws_db_instance.main.max_connections", "200", 12),
+    ]
+
+
+def test_key_terms_split_camel_and_kebab_case():
+    assert key_terms("spring.datasource.hikari.maximumPoolSize") >= {"hikari", "maximum", "pool", "size", "maximumpoolsize"}
+    assert key_terms("resilience4j.max-attempts") == {"resilience4j", "resilience", "j", "max", "attempts"}
+
+
+def _fact(line: int, path: str = "application.yml") -> ConfigFact:
+    return ConfigFact(key="k", value="v", path=path, line=line, matched=1)
+
+
+POOL = "hikari:\n  maximum-pool-size: 10\n  connection-timeout: 30000\n"
+
+
+def test_facts_cover_needs_every_key_line():
+    chunk = dict(path="application.yml", start_line=20, text=POOL, language="yaml")
+
+    # ключи чанка на строках 21 и 22 (hikari: — только родитель)
+    assert facts_cover([_fact(21), _fact(22)], **chunk)
+    assert not facts_cover([_fact(21)], **chunk)
+    assert not facts_cover([_fact(21, path="other.yml"), _fact(22, path="other.yml")], **chunk)
+
+
+def test_facts_cover_is_false_for_a_chunk_without_keys():
+    assert not facts_cover([_fact(1)], path="application.yml", start_line=1, text="# only comments\n", language="yaml")
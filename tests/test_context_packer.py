@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from agent.analyzer import ContextItem
+from agent.context_packer import ApproxTokenCounter, merge_contexts, pack_contexts
+
+
+def _item(path: str, start: int, end: int, score: float = 1.0) -> ContextItem:
+    text = "\n".join(f"line {n}" for n in range(start, end + 1))
+    return ContextItem(score=score, base=score, rr=0.0, path=path, start_line=start, end_line=end, language="java", text=text)
+
+
+class _LineCounter:
+    """One token per line: budgets in the tests read as line counts."""
+
+    def count(self, text: str) -> int:
+        return text.count("\n") + 1
+
+
+def test_overlapping_ranges_merge_without_repeating_lines():
+    merged = merge_contexts([_item("A.java", 1, 10, 0.5), _item("A.java", 8, 15, 0.9)])
+
+    assert len(merged) == 1
+    m = merged[0]
+    assert (m.start_line, m.end_line, m.score) == (1, 15, 0.9)
+    assert m.text.split("\n") == [f"line {n}" for n in range(1, 16)]
+
+
+def test_adjacent_ranges_merge_and_gaps_do_not():
+    merged = merge_contexts([_item("A.java", 1, 5, 0.2), _item("A.java", 6, 9, 0.3), _item("A.java", 11, 12, 0.8)])
+
+    assert [(m.start_line, m.end_line) for m in merged] == [(11, 12), (1, 9)]
+
+
+def test_contained_range_and_other_files_are_kept_apart():
+    merged = merge_contexts([_item("A.java", 1, 20, 0.4), _item("A.java", 5, 8, 0.7), _item("B.java", 5, 8, 0.1)])
+
+    assert [(m.path, m.start_line, m.end_line, m.score) for m in merged] == [("A.java", 1, 20, 0.7), ("B.java", 5, 8, 0.1)]
+    assert merged[0].text == _item("A.java", 1, 20).text
+
+
+def test_pack_respects_token_budget_and_reports_dropped():
+    items = [_item("A.java", 1, 10, 0.9), _item("B.java", 1, 10, 0.8), _item("C.java", 1, 30, 0.7)]
+
+    packed = pack_contexts(items, max_tokens=25, counter=_LineCounter())
+
+    assert [c.path for c in packed.items] == ["A.java", "B.java"]
+    assert packed.tokens == 20
+    assert [c.path for c in packed.dropped] == ["C.java"]
+
+
+def test_pack_prefers_dense_items_but_not_below_best_single():
+    dense = [_item(f"S{i}.java", 1, 2, 0.1) for i in range(3)]
+    big = _item("Big.java", 1, 10, 5.0)
+
+    packed = pack_contexts([*dense, big], max_tokens=10, counter=_LineCounter())
+
+    # по плотности сначала мелкие, но одиночный лучший элемент ценнее их суммы
+    assert [c.path for c in packed.items] == ["Big.java"]
+
+
+def test_pack_respects_char_budget():
+    items = [_item("A.java", 1, 3, 0.9), _item("B.java", 1, 3, 0.8)]
+
+    packed = pack_contexts(items, max_tokens=1000, counter=_LineCounter(), max_chars=len(items[0].text))
+
+    assert [c.path for c in packed.items] == ["A.java"]
+    assert packed.chars == len(items[0].text)
+
+
+def test_approx_counter():
+    counter = ApproxTokenCounter()
+
+    assert counter.count("") == 0
+    assert counter.count("HikariPool") == 3
+    assert counter.count("a.b()\n") == 6
+    assert counter.count("таймаут 30000") == 3 + 2
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from agent.generations import (
+    CURRENT_FILE,
+    GENERATIONS_DIR,
+    _generation,
+    current_generation_id,
+    gc_generations,
+    list_generations,
+    publish_generation,
+    resolve_index,
+)
+
+
+def _make(index_dir: Path, *ids: str) -> None:
+    for gen_id in ids:
+        (index_dir / GENERATIONS_DIR / gen_id).mkdir(parents=True)
+
+
+def test_publish_switches_current_atomically(tmp_path):
+    _make(tmp_path, "g1", "g2")
+    assert current_generation_id(tmp_path) is None
+
+    publish_generation(tmp_path, _generation(tmp_path, "g1"))
+    assert current_generation_id(tmp_path) == "g1"
+    publish_generation(tmp_path, _generation(tmp_path, "g2"))
+
+    assert (tmp_path / CURRENT_FILE).read_text(encoding="utf-8") == "g2\n"
+    assert resolve_index(tmp_path, legacy_qdrant_path="unused").root == tmp_path / GENERATIONS_DIR / "g2"
+    # временный файл не остаётся рядом с CURRENT
+    assert sorted(p.name for p in tmp_path.iterdir()) == [CURRENT_FILE, GENERATIONS_DIR]
+
+
+def test_without_current_index_is_legacy(tmp_path):
+    gen = resolve_index(tmp_path, legacy_qdrant_path="/q")
+    assert gen.id == "legacy"
+    assert gen.root == tmp_path
+    assert gen.qdrant_path == Path("/q")
+
+
+def test_gc_keeps_current_and_previous(tmp_path):
+    _make(tmp_path, "g1", "g2", "g3", "g4", "g5")
+    publish_generation(tmp_path, _generation(tmp_path, "g4"))
+
+    removed = gc_generations(tmp_path, keep=2)
+
+    assert removed == ["g1", "g2"]
+    # g5 новее CURRENT (сборка в процессе) — не трогаем
+    assert list_generations(tmp_path) == ["g3", "g4", "g5"]
+
+
+def test_gc_keep_one_and_no_current(tmp_path):
+    _make(tmp_path, "g1", "g2")
+    assert gc_generations(tmp_path, keep=1) == []
+    assert list_generations(tmp_path) == ["g1", "g2"]
+
+    publish_generation(tmp_path, _generation(tmp_path, "g2"))
+    assert gc_generations(tmp_path, keep=1) == ["g1"]
+    assert list_generations(tmp_path) == ["g2"]
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from agent.incident_cache import IncidentCache
+from agent.signals import extract_signals
+
+
+OOM = extract_signals("java.lang.OutOfMemoryError: Java heap space\nGC pause 1800ms at com.acme.Ledger.load(Ledger.java:10)")
+TIMEOUT = extract_signals("SocketTimeoutException calling /api/payments/confirm")
+REPORT = {"summary": "heap", "hypotheses": [], "llm_timing": {"total_ms": 1.0}}
+
+
+def _cache(tmp_path, **kw) -> IncidentCache:
+    args = dict(path=tmp_path / "incident_cache.sqlite", index_id="idx@h1", model_name="m", threshold=0.9)
+    return IncidentCache(**{**args, **kw})
+
+
+def test_same_incident_matches_without_run_specific_fields(tmp_path):
+    cache = _cache(tmp_path)
+    cache.add(name="inc-1", vector=[1.0, 0.0, 0.0], signals=OOM, report=REPORT)
+
+    match = cache.lookup([0.99, 0.05, 0.0], OOM)
+
+    assert match is not None and match.name == "inc-1"
+    assert match.signal_score == 1.0
+    report = match.as_report()
+    assert "llm_timing" not in report
+    assert report["cached_match"]["source_incident"] == "inc-1"
+    assert report["cached_match"]["signals_diff"] == {"added": {}, "removed": {}}
+
+
+def test_different_signals_fall_below_threshold(tmp_path):
+    cache = _cache(tmp_path)
+    cache.add(name="inc-1", vector=[1.0, 0.0], signals=OOM, report=REPORT)
+
+    assert cache.lookup([1.0, 0.0], TIMEOUT) is None
+
+
+def test_scope_is_index_model_and_dim(tmp_path):
+    _cache(tmp_path).add(name="inc-1", vector=[1.0, 0.0], signals=OOM, report=REPORT)
+
+    assert _cache(tmp_path, index_id="idx@h2").lookup([1.0, 0.0], OOM) is None
+    assert _cache(tmp_path, model_name="other").lookup([1.0, 0.0], OOM) is None
+    assert _cache(tmp_path).lookup([1.0, 0.0, 0.0], OOM) is None
+    assert _cache(tmp_path).lookup([1.0, 0.0], OOM) is not None
+
+
+def test_partial_reports_are_not_stored_and_old_entries_evicted(tmp_path):
+    cache = _cache(tmp_path, max_entries=2)
+    cache.add(name="partial", vector=[0.0, 1.0], signals=TIMEOUT, report={**REPORT, "partial": True})
+    for i, v in enumerate(([1.0, 0.0], [0.0, 1.0], [0.7, 0.7])):
+        cache.add(name=f"inc-{i}", vector=v, signals=TIMEOUT, report=REPORT)
+
+    with cache.connect() as conn:
+        names = [r["name"] for r in conn.execute("SELECT name FROM incidents ORDER BY id")]
+    assert names == ["inc-1", "inc-2"]
+
+
+def test_unopenable_store_disables_the_cache(tmp_path, caplog):
+    blocker = tmp_path / "file"
+    blocker.write_text("", encoding="utf-8")
+    cache = _cache(tmp_path, path=blocker / "incident_cache.sqlite")
+
+    cache.add(name="inc-1", vector=[1.0], signals=OOM, report=REPORT)
+
+    assert cache.lookup([1.0], OOM) is None
+    assert "running without it" in caplog.text
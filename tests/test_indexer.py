@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+from agent.chunking import Chunk, chunk_text_by_lines
+from agent.indexer import build_lookup_tables, content_hash
+from agent.retriever import resolve_frame_chunks
+from agent.signals import extract_signals
+from agent.store_sqlite import SQLiteStore
+
+
+def _chunks(*texts: str, first_id: int = 1) -> list:
+    return [Chunk(chunk_id=first_id + i, path=f"src/F{i}.java", language="java", start_line=1, end_line=3, text=t)
+            for i, t in enumerate(texts)]
+
+
+def test_content_hash_ignores_ids_and_scan_order():
+    a = _chunks("class A {}", "class B {}")
+    b = list(reversed(_chunks("class A {}", "class B {}", first_id=100)))
+
+    assert content_hash(a) == content_hash(b)
+
+
+def test_content_hash_changes_with_code():
+    assert content_hash(_chunks("class A {}")) != content_hash(_chunks("class A { int x; }"))
+
+
+SERVICE = """package com.acme.pay.service;
+
+import java.util.List;
+
+public class PaymentService {
+    private final LedgerClient ledger;
+
+    public Receipt confirm(Payment p) {
+        return ledger.post(p);
+    }
+
+    public void refund(Payment p) {
+        if (p.isSettled()) {
+            throw new IllegalStateException("settled");
+        }
+        ledger.reverse(p);
+    }
+}
+"""
+
+LEDGER_KT = """package com.acme.pay.ledger
+
+fun retryPost(p: Payment) = post(p)
+"""
+
+
+def _store(tmp_path) -> SQLiteStore:
+    chunks = [
+        *chunk_text_by_lines(text=SERVICE, path="src/main/java/com/acme/pay/service/PaymentService.java",
+                             language="java", chunk_id_start=1, max_lines=8, overlap=2),
+        *chunk_text_by_lines(text=LEDGER_KT, path="src/main/kotlin/com/acme/pay/ledger/Ledger.kt",
+                             language="kotlin", chunk_id_start=100, max_lines=8, overlap=2),
+    ]
+    tables = build_lookup_tables(chunks)
+    store = SQLiteStore(db_path=tmp_path / "payload.sqlite")
+    store.init()
+    store.insert_chunks(chunks)
+    store.insert_chunk_tokens(tables.tokens)
+    store.insert_file_symbols(tables.file_symbols)
+    return store
+
+
+def test_symbols_span_chunks_of_one_file():
+    chunks = chunk_text_by_lines(text=SERVICE, path="PaymentService.java", language="java",
+                                 chunk_id_start=1, max_lines=8, overlap=2)
+
+    tables = build_lookup_tables(chunks)
+
+    # refund() лежит во втором чанке, но тип берётся из начала файла
+    assert ("symbol", "paymentservice.refund") in tables.tokens[2]
+    assert ("com.acme.pay.service.PaymentService", "PaymentService.java") in tables.file_symbols
+    assert ("PaymentService.java", "PaymentService.java") in tables.file_symbols
+
+
+def test_frames_resolve_to_the_chunk_covering_the_line(tmp_path):
+    store = _store(tmp_path)
+    frames = extract_signals(
+        "at com.acme.pay.service.PaymentService.refund(PaymentService.java:14)\n"
+        "at com.acme.pay.service.PaymentService.confirm(PaymentService.java:9)\n"
+        "at com.acme.pay.ledger.LedgerKt.retryPost(Ledger.kt:3)\n"
+        "at com.acme.Missing.run(Missing.java:1)\n"
+    ).locations
+
+    got = resolve_frame_chunks(store, frames, limit=4)
+
+    assert [(c.path.rsplit("/", 1)[-1], c.start_line, c.end_line) for c in got] == [
+        ("PaymentService.java", 13, 18),
+        ("PaymentService.java", 7, 14),
+        # top-level Kotlin: fqcn LedgerKt не объявлен, находим по имени файла в каталоге пакета
+        ("Ledger.kt", 1, 3),
+    ]
+    assert len(resolve_frame_chunks(store, frames, limit=1)) == 1
+
+
+def test_inverted_index_ranks_by_matched_token_weight(tmp_path):
+    store = _store(tmp_path)
+
+    ranked = store.find_chunks_by_tokens([("exception", "illegalstateexception"), ("method", "reverse")])
+
+    # throw на строке 14 попадает в оба перекрывающихся чанка, reverse() — только в последний
+    assert ranked == [(3, 1.5 + 0.75), (2, 1.5)]
+    assert store.find_chunks_by_tokens([]) == []
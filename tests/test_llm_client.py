@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+import pytest
+
+from agent.analyzer import analyze_incident_with_llm
+from agent.bench import MockLLMServer
+from agent.llm_client import LLMClient, LLMError
+
+
+@pytest.fixture
+def server():
+    with MockLLMServer() as srv:
+        yield srv
+
+
+def test_chat_text_reuses_connection_and_token(server):
+    timings = []
+    with LLMClient(server.config(stream=False)) as llm:
+        first = llm.chat_text(system="s", user="u", on_timing=timings.append)
+        second = llm.chat_text(system="s", user="u", on_timing=timings.append)
+
+    assert json.loads(first) == json.loads(second)
+    assert "hypotheses" in json.loads(first)
+    # OAuth и чат на одном хосте: чат уже идёт по соединению, открытому для токена
+    assert timings[0].auth_ms > 0
+    assert timings[1].reused_connection
+    assert timings[1].auth_ms == 0.0
+    assert server.auth_calls == 1
+    assert server.connections == 1
+
+
+def test_chat_stream_yields_whole_report(server):
+    timings = []
+    with LLMClient(server.config(stream=True)) as llm:
+        deltas = list(llm.chat_stream(system="s", user="u", on_timing=timings.append))
+        # [DONE] дочитан: соединение вернулось в пул и переиспользуется
+        list(llm.chat_stream(system="s", user="u", on_timing=timings.append))
+
+    assert timings[0].first_token_ms is not None
+    assert timings[1].reused_connection
+    assert len(deltas) > 1
+    assert json.loads("".join(deltas))["summary"]
+    assert server.connections == 1
+
+
+def test_token_refreshed_before_expiry():
+    with MockLLMServer(token_ttl_s=30.0) as srv:
+        cfg = srv.config(stream=False)
+        with LLMClient(replace(cfg, token_refresh_margin_s=60.0)) as llm:
+            llm.chat_text(system="s", user="u")
+            llm.chat_text(system="s", user="u")
+        assert srv.auth_calls == 2
+
+        with LLMClient(replace(cfg, token_refresh_margin_s=5.0)) as llm:
+            llm.chat_text(system="s", user="u")
+            llm.chat_text(system="s", user="u")
+        assert srv.auth_calls == 3
+
+
+def test_401_refreshes_token_once(server):
+    timings = []
+    with LLMClient(server.config(stream=True)) as llm:
+        llm.chat_text(system="s", user="u")
+        server.unauthorized = 1
+        text = "".join(llm.chat_stream(system="s", user="u", on_timing=timings.append))
+
+    assert [t.retries for t in timings] == [1]
+    assert json.loads(text)["hypotheses"]
+    assert server.auth_calls == 2
+
+
+def test_repeated_401_raises(server):
+    server.unauthorized = 2
+    with LLMClient(server.config(stream=False)) as llm:
+        with pytest.raises(LLMError) as exc:
+            llm.chat_text(system="s", user="u")
+    assert exc.value.status == 401
+    assert server.auth_calls == 2
+
+
+def test_concurrent_calls_get_their_own_timing(server):
+    with LLMClient(server.config(stream=False)) as llm:
+        llm.chat_text(system="s", user="u")
+        sinks = [[] for _ in range(8)]
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            list(ex.map(lambda sink: llm.chat_text(system="s", user="u", on_timing=sink.append), sinks))
+
+    assert all(len(sink) == 1 for sink in sinks)
+    assert len({id(sink[0]) for sink in sinks}) == 8
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_request_phases_reach_report_timing(server, stream):
+    with LLMClient(server.config(stream=stream)) as llm:
+        report = analyze_incident_with_llm(llm=llm, incident={"service": "pay"}, contexts=[])
+
+    timing = report["llm_timing"]
+    assert timing["auth_ms"] > 0
+    assert {"connect_ms", "ttfb_ms", "reused_connection", "retries", "total_ms"} <= timing.keys()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import gzip
+import json
+
+from agent.log_ingest import BoundedCounter, LogTemplateMiner, attach_log_digest, ingest_logs, mask_line
+
+
+def test_mask_line_strips_timestamp_and_numbers():
+    assert mask_line("2026-01-15T10:00:01.123Z took 250 ms on shard 3") == "took <*> ms on shard <*>"
+    assert mask_line("[2026-01-15 10:00:01,5] ok") == "ok"
+
+
+def test_miner_generalises_differing_tokens():
+    miner = LogTemplateMiner()
+    for user in ("alice", "bob", "carol"):
+        line = f"login failed for user {user} from <*>"
+        miner.add(line, line)
+    miner.add("cache warmed", "cache warmed")
+
+    templates = miner.templates()
+
+    assert [(" ".join(c.tokens), c.count) for c in templates] == [
+        ("login failed for user <*> from <*>", 3),
+        ("cache warmed", 1),
+    ]
+    assert templates[0].sample == "login failed for user alice from <*>"
+
+
+def test_miner_evicts_rare_clusters_at_the_limit():
+    miner = LogTemplateMiner(max_clusters=10)
+    for _ in range(5):
+        miner.add("hot line", "hot line")
+    for i in range(30):
+        miner.add(f"rare{i}", f"rare{i}")
+
+    templates = miner.templates()
+
+    assert len(templates) <= 10
+    assert (templates[0].tokens, templates[0].count) == (["hot", "line"], 5)
+
+
+def test_bounded_counter_keeps_heavy_hitters():
+    counter = BoundedCounter(4)
+    counter.add("hot", 10)
+    for key in "abcdefgh":
+        counter.add(key)
+
+    assert len(counter.counts) <= 4
+    assert counter.most_common(1) == [("hot", 10)]
+
+
+def test_ingest_plain_gzip_and_json_logs(tmp_path):
+    plain = tmp_path / "app.log"
+    plain.write_text(
+        "2026-01-15T10:00:01Z GET /api/pay took 1200 ms\n"
+        "2026-01-15T10:00:02Z GET /api/pay took 900 ms\n"
+        "\n"
+        "java.net.SocketTimeoutException: Read timed out\n",
+        encoding="utf-8",
+    )
+    packed = tmp_path / "app.log.gz"
+    with gzip.open(packed, "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"level": "ERROR", "message": "pool exhausted after 30000 ms"}) + "\n")
+
+    digest = ingest_logs([plain, packed])
+
+    assert digest.lines == 4
+    assert ("GET /api/pay took <*> ms", 2) in [(t.template, t.count) for t in digest.templates]
+    assert "java.net.SocketTimeoutException: Read timed out" in [line for line, _ in digest.signal_lines]
+
+    incident = attach_log_digest({"service": "pay"}, digest, max_templates=1)
+    assert incident["log_templates"] == [{"template": digest.templates[0].template, "count": digest.templates[0].count}]
+    assert incident["log_stats"] == {"lines": 4, "templates": len(digest.templates)}
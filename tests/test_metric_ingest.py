@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+
+from agent.metric_ingest import (
+    MetricMatrix,
+    attach_metric_digest,
+    detect_anomalies,
+    ingest_metrics,
+    metric_keywords,
+    parse_time_window,
+)
+
+
+T0 = 1_768_471_200.0    # 2026-01-15T10:00:00Z
+STEP = 60.0
+
+
+def _matrix(**series) -> MetricMatrix:
+    names = list(series)
+    values = np.asarray([series[n] for n in names], dtype=np.float64)
+    return MetricMatrix(names=names, ts=T0 + STEP * np.arange(values.shape[1]), values=values)
+
+
+def _noise(n: int, level: float, seed: int) -> np.ndarray:
+    return level + np.random.default_rng(seed).normal(0.0, level * 0.02, n)
+
+
+def test_sustained_shift_is_found_with_onset_and_change_point():
+    latency = _noise(40, 100.0, 1)
+    latency[25:] += 400.0
+    m = _matrix(http_latency_p99=latency, cpu=_noise(40, 50.0, 2))
+
+    anomalies = detect_anomalies(m, window=(T0 + 20 * STEP, T0 + 39 * STEP))
+
+    assert [a.metric for a in anomalies] == ["http_latency_p99"]
+    a = anomalies[0]
+    assert a.direction == "up"
+    assert a.onset == T0 + 25 * STEP
+    assert a.change_point == T0 + 25 * STEP
+    assert abs(a.baseline - 100.0) < 5.0 and a.peak > 450.0
+    assert a.keywords == ("latency", "p99")
+
+
+def test_single_spike_is_not_sustained():
+    spiky = _noise(40, 10.0, 3)
+    spiky[30] = 1000.0
+
+    assert detect_anomalies(_matrix(queue=spiky), window=(T0 + 20 * STEP, None)) == []
+
+
+def test_drop_on_flat_baseline_and_gaps():
+    pool = np.full(40, 20.0)
+    pool[30:] = 0.0
+    pool[5] = np.nan
+
+    anomalies = detect_anomalies(_matrix(hikari_idle=pool))
+
+    assert [(a.metric, a.direction, a.peak) for a in anomalies] == [("hikari_idle", "down", 0.0)]
+
+
+def test_too_short_series_are_skipped():
+    assert detect_anomalies(_matrix(x=[1.0, 1.0, 9.0, 9.0])) == []
+
+
+def test_parse_time_window_and_keywords():
+    assert parse_time_window("2026-01-15T10:00:00Z/2026-01-15T10:30:00Z") == (T0, T0 + 1800.0)
+    assert parse_time_window("bogus/also-bogus") == (None, None)
+    assert parse_time_window(None) == (None, None)
+    assert metric_keywords('hikaricp_connections_timeout_total{pool="a"}') == ("hikari", "timeout")
+
+
+def test_prometheus_and_csv_inputs_end_up_in_the_incident(tmp_path):
+    values = _noise(30, 0.1, 4)
+    values[20:] = 5.0
+    prom = tmp_path / "q.json"
+    prom.write_text(json.dumps({"data": {"result": [{
+        "metric": {"__name__": "gc_pause_seconds", "pod": "a"},
+        "values": [[T0 + STEP * i, str(v)] for i, v in enumerate(values)],
+    }]}}), encoding="utf-8")
+    wide = tmp_path / "m.csv"
+    wide.write_text("ts,cpu\n" + "".join(f"{T0 + STEP * i},{50 + i % 2}\n" for i in range(30)), encoding="utf-8")
+
+    digest = ingest_metrics([prom, wide], time_window="2026-01-15T10:15:00Z/2026-01-15T10:29:00Z")
+    incident = attach_metric_digest({"symptoms": {"errors": "5xx"}}, digest)
+
+    assert (digest.series, digest.points) == (2, 30)
+    assert [a["metric"] for a in incident["metric_anomalies"]] == ['gc_pause_seconds{pod="a"}']
+    assert incident["metric_anomalies"][0]["onset"] == "2026-01-15T10:20:00Z"
+    assert set(incident["symptoms"]) == {"errors", 'gc_pause_seconds{pod="a"}'}
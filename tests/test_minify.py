@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from agent.analyzer import ContextItem
+from agent.minify import minify_code, minify_contexts
+
+
+JAVA = """package com.acme;
+
+import java.util.List;
+/* licence
+   header */
+public class Pay {
+    // comment
+    String url = "http://x//y"; // trailing
+    void run() {
+        call();
+    }
+}"""
+
+
+def _numbers(minified: str) -> list:
+    return [int(line.split("|", 1)[0]) for line in minified.split("\n")]
+
+
+def test_java_comments_imports_and_indent_stripped_with_source_line_anchors():
+    out = minify_code(JAVA, language="java", start_line=100)
+
+    assert out.split("\n") == [
+        "105|public class Pay {",
+        '107|String url = "http://x//y";',
+        "108|void run() {",
+        "109|call();",
+        "110|}",
+        "111|}",
+    ]
+
+
+def test_anchors_match_original_lines():
+    src = JAVA.split("\n")
+    out = minify_code(JAVA, language="java", start_line=1)
+
+    for n, line in zip(_numbers(out), out.split("\n")):
+        assert line.split("|", 1)[1] in src[n - 1]
+
+
+def test_python_keeps_indent_and_drops_multiline_imports():
+    src = "from x import (\n    a,\n    b,\n)\n\ndef f():\n    # note\n    return a  # why\n"
+
+    out = minify_code(src, language="python", start_line=10)
+
+    assert out.split("\n") == ["15|def f():", "17|    return a"]
+
+
+def test_yaml_hash_inside_value_is_not_a_comment():
+    src = 'url: "http://h/#frag"\n# comment\npool:\n  size: 10 # max\n'
+
+    out = minify_code(src, language="yaml", start_line=1)
+
+    assert out.split("\n") == ['1|url: "http://h/#frag"', "3|pool:", "4|  size: 10"]
+
+
+def test_minify_contexts_marks_items_numbered_and_counts_tokens():
+    item = ContextItem(score=1.0, base=1.0, rr=0.0, path="Pay.java", start_line=1, end_line=12, language="java", text=JAVA)
+
+    out, before, after = minify_contexts([item], count_tokens=len)
+
+    assert out[0].numbered and not item.numbered
+    assert (before, after) == (len(JAVA), len(out[0].text))
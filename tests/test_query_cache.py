@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import numpy as np
+
+from agent.query_cache import QueryCache
+from agent.reduction import Projection, ReducedVectorDB
+
+
+class _Backend:
+    def cache_params(self):
+        return {"backend": "numpy"}
+
+
+def _cache(tmp_path) -> QueryCache:
+    cache = QueryCache(db_path=tmp_path / "query_cache.sqlite", version="v1", model_name="m")
+    cache.init()
+    return cache
+
+
+def test_results_are_keyed_by_backend_params(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put_results("OOM in pay", {"backend": "numpy", "rescore": True, "top_k": 12}, [{"chunk_id": 1}])
+
+    assert cache.get_results("OOM  in pay", {"backend": "numpy", "rescore": True, "top_k": 12}) == [{"chunk_id": 1}]
+    assert cache.get_results("OOM in pay", {"backend": "numpy", "rescore": False, "top_k": 12}) is None
+    assert cache.get_results("OOM in pay", {"backend": "qdrant", "rescore": True, "top_k": 12}) is None
+
+
+def test_hit_counters_are_per_table(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put_vector("q", [0.5, 0.25])
+
+    assert cache.get_results("q", {}) is None
+    assert cache.get_vector("q") == [0.5, 0.25]
+
+    assert cache.hits == {"results": 0, "vectors": 1}
+    assert cache.misses == {"results": 1, "vectors": 0}
+
+
+def test_reduced_index_params_include_projection_and_rescore():
+    projection = Projection(method="pca", matrix=np.zeros((8, 4), dtype=np.float32))
+
+    plain = ReducedVectorDB(_Backend(), projection=projection).cache_params()
+
+    assert plain == {"backend": "numpy", "reduce": "pca", "reduced_dim": 4, "rescore": False}
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from agent.report_schema import IncrementalReportParser
+
+
+REPORT = {
+    "summary": "Pool exhausted",
+    "classification": {"type": "db", "confidence": 0.7},
+    "hypotheses": [
+        {"title": "A", "confidence": 0.8, "evidence": [{"path": "a.java", "lines": "1-2"}]},
+        {"title": "B {not a brace}", "confidence": 0.4, "evidence": []},
+    ],
+    "hotspots": [],
+    "checks": ["c"],
+    "missing_data": [],
+}
+
+
+def _feed(text: str, piece: int) -> tuple[IncrementalReportParser, list]:
+    parser = IncrementalReportParser()
+    seen = []
+    for i in range(0, len(text), piece):
+        seen.extend(parser.feed(text[i:i + piece]))
+    return parser, seen
+
+
+@pytest.mark.parametrize("piece", [1, 7, 10_000])
+def test_hypotheses_arrive_as_their_objects_close(piece):
+    text = "Ответ:\n" + json.dumps(REPORT, ensure_ascii=False, indent=1)
+    parser, seen = _feed(text, piece)
+
+    assert seen == REPORT["hypotheses"]
+    report, partial = parser.result()
+    assert not partial
+    assert report == REPORT
+
+
+def test_cut_inside_hypothesis_keeps_only_closed_ones():
+    text = json.dumps(REPORT)
+    cut = text.index('"conf', text.index('"title": "B'))
+    parser, seen = _feed(text[:cut], 5)
+
+    report, partial = parser.result()
+    assert partial
+    assert report["partial"] is True
+    assert seen == report["hypotheses"] == REPORT["hypotheses"][:1]
+    assert report["summary"] == REPORT["summary"]
+    assert report["hotspots"] == [] and report["checks"] == []
+
+
+def test_cut_inside_string_is_repaired():
+    text = json.dumps(REPORT)
+    cut = text.index('"c"]') + 2
+    parser, _ = _feed(text[:cut], 3)
+
+    report, partial = parser.result()
+    assert partial
+    assert report["hypotheses"] == REPORT["hypotheses"]
+    assert report["checks"] == ["c"]
+
+
+def test_no_json_raises():
+    parser = IncrementalReportParser()
+    parser.feed("no report here")
+    with pytest.raises(ValueError):
+        parser.result()
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import time
+
+from agent.reranker_onnx import CrossEncoderReranker
+
+
+class _SlowModel:
+    """Stand-in cross-encoder: `ms` per document, score = document length."""
+
+    def __init__(self, ms: float):
+        self.ms = ms
+        self.batches = []
+
+    def rerank(self, query, docs, batch_size):
+        self.batches.append(len(docs))
+        time.sleep(self.ms * len(docs) / 1000.0)
+        return [float(len(d)) for d in docs]
+
+
+def _reranker(model) -> CrossEncoderReranker:
+    return CrossEncoderReranker(model_name="stand-in", batch_size=8, _model=model)
+
+
+def test_first_batch_is_one_doc_then_sized_by_budget():
+    model = _SlowModel(ms=20.0)
+    docs = ["a" * n for n in range(1, 21)]
+
+    order, scores, stats = _reranker(model).rerank("q", docs, budget_ms=70.0)
+
+    assert model.batches[0] == 1
+    # ~20 мс на документ: после первого замера в оставшиеся ~50 мс помещается 2 документа, не 8
+    assert model.batches[1] <= 3
+    assert stats.exhausted and stats.scored < len(docs)
+    assert order[:stats.scored] == sorted(range(stats.scored), key=lambda i: -len(docs[i]))
+    assert order[stats.scored:] == list(range(stats.scored, len(docs)))
+    assert scores[stats.scored:] == [None] * (len(docs) - stats.scored)
+
+
+def test_everything_scored_within_a_generous_budget():
+    model = _SlowModel(ms=0.1)
+    docs = ["bb", "a", "ccc"]
+
+    order, scores, stats = _reranker(model).rerank("q", docs, budget_ms=1000.0)
+
+    assert not stats.exhausted
+    assert order == [2, 0, 1]
+    assert scores == [2.0, 1.0, 3.0]
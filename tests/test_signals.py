@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from agent.signals import (
+    FrameLocation,
+    extract_chunk_tokens,
+    extract_signals,
+    frame_symbol,
+    score_chunk_text,
+    score_chunk_tokens,
+    signal_tokens,
+)
+
+
+INCIDENT = """POST /api/payments/confirm p99 latency 4s
+com.zaxxer.hikari.pool.HikariPool$PoolInitializationException: HikariPool-1 - Connection is not available
+    at com.acme.pay.service.PaymentService$Retry.confirm(PaymentService.java:143)
+    at com.acme.pay.api.PaymentController.confirm(Native Method)
+span LedgerClient.post() took 3s
+"""
+
+CHUNK = """public class PaymentService {
+    public Receipt confirm(Payment p) {
+        try {
+            return ledger.post(p);   // /api/payments/confirm
+        } catch (SQLTransientConnectionException e) {
+            throw new PoolInitializationException("hikaripool timeout", e);
+        }
+    }
+}"""
+
+
+def test_extract_signals():
+    s = extract_signals(INCIDENT)
+
+    assert s.endpoints == {"/api/payments/confirm"}
+    assert s.exceptions == {"PoolInitializationException"}
+    assert s.frames == {
+        "com.acme.pay.service.PaymentService$Retry.confirm", "com.acme.pay.api.PaymentController.confirm", "LedgerClient.post",
+    }
+    assert {"p99", "latency", "hikaripool", "connection is not available"} <= s.keywords
+    # "Native Method" без file:line не даёт location; внутренний класс сводится к внешнему
+    assert s.locations == (FrameLocation("com.acme.pay.service.PaymentService", "confirm", "PaymentService.java", 143),)
+
+
+def test_frame_symbol():
+    assert frame_symbol("com.acme.PaymentService$Retry.confirm") == "Retry.confirm"
+    assert frame_symbol("main") == "main"
+
+
+def test_chunk_tokens_and_scoring():
+    s = extract_signals(INCIDENT)
+    tokens = extract_chunk_tokens(CHUNK, symbols=["PaymentService", "PaymentService.confirm"])
+
+    assert {("method", "confirm"), ("method", "post"), ("symbol", "paymentservice.confirm")} <= tokens
+    assert ("method", "try") not in tokens and ("method", "catch") not in tokens
+    assert tokens & signal_tokens(s) == {
+        ("endpoint", "/api/payments/confirm"),
+        ("exception", "poolinitializationexception"),
+        ("keyword", "hikari"),
+        ("keyword", "hikaripool"),
+        ("method", "confirm"),
+        ("method", "post"),
+    }
+    assert score_chunk_tokens(tokens, signal_tokens(s)) == 1.25 + 1.5 + 1.0 + 1.0 + 0.75 + 0.75
+
+
+def test_text_scoring_ranks_the_matching_chunk_first():
+    s = extract_signals(INCIDENT)
+
+    assert score_chunk_text(CHUNK, s) > score_chunk_text("class Unrelated { void run() {} }", s) == 0.0
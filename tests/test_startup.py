@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from .conftest import SRC
+
+
+# тяжёлые модули, которые нужны только подкомандам: `agent --help` и ошибки аргументов обходятся без них
+HEAVY_MODULES = ("numpy", "fastembed", "qdrant_client", "onnxruntime", "ssl", "asyncio", "http.client")
+# запас на `agent --help` сверх голого интерпретатора (site, .pth-файлы и т.п. есть в обоих замерах)
+HELP_BUDGET_MS = 150.0
+
+_LOADED = "import sys; {}; print(' '.join(m for m in {!r} if m in sys.modules))"
+
+
+def _env() -> dict:
+    env = dict(os.environ, PYTHONPATH=str(SRC))
+    # без .pyc замер включал бы компиляцию модулей, а не их импорт
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def _loaded(statement: str) -> set:
+    out = subprocess.run(
+        [sys.executable, "-c", _LOADED.format(statement, HEAVY_MODULES)],
+        cwd=SRC, env=_env(), capture_output=True, text=True, check=True,
+    )
+    return set(out.stdout.split())
+
+
+def _wall_ms(args: list, runs: int = 7) -> float:
+    times = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, *args], cwd=SRC, env=_env(), stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times)
+
+
+def test_cli_import_skips_heavy_modules():
+    baseline = _loaded("pass")
+
+    assert _loaded("import agent.cli") - baseline == set()
+
+
+def test_help_within_budget_of_bare_interpreter():
+    _wall_ms(["-m", "agent.cli", "--help"], runs=1)  # прогрев: .pyc и файловый кэш ОС
+
+    bare = _wall_ms(["-c", "pass"])
+    help_ms = _wall_ms(["-m", "agent.cli", "--help"])
+
+    assert help_ms - bare < HELP_BUDGET_MS, f"agent --help {help_ms:.0f}ms vs bare python {bare:.0f}ms"